@@ -12,8 +12,14 @@ __license__ = "GPL-3.0"
 from .client import Client
 from .exceptions import AmongUsException, ConnectionException, SpectatorException
 from .game import Game
+from .index import LobbyIndex
 from .player import Player
+from .pool import ClientPool
+from .probe import RegionProbe
+from .scanner import LobbyScanner
 from .task import Task
+from .timers import TimerWheel
+from .warmpool import ConnectionPool
 
 __all__ = [
     "Client",
@@ -23,4 +29,10 @@ __all__ = [
     "Player",
     "Task",
     "Game",
+    "TimerWheel",
+    "ClientPool",
+    "LobbyScanner",
+    "LobbyIndex",
+    "RegionProbe",
+    "ConnectionPool",
 ]
@@ -1,15 +1,26 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 import argparse
+import asyncio
+import json
+import time
 from typing import Union
 
 from amongus.helpers import formatHex
 
+from .analysis import PacketEvent, decode, parse_capture
+from .capture import CaptureReader, Direction, replay
+from .connection import Connection
+from .eventbus import EventBus
+from .packets import SpawnPacket
 from .packets.base import Packet
+from .pcap import DEFAULT_PORTS, read_pcap
 
 
 def print_children(p: Union[Packet, list], depth: int, with_data: bool = False):
     for child in p:
+        if type(child) is SpawnPacket:
+            child.parse_spawn()
         print(f"{'   '*depth}{child.__class__.__name__}: {child.values}")  # noqa: T001
         if with_data:
             print(f"{'   '*depth}---> {formatHex(child.data)}")  # noqa: T001
@@ -31,9 +42,135 @@ if __name__ == "__main__":
         default=False,
         help="When parsing, print the respective data of each packet aswell",
     )
+    parser.add_argument(
+        "-c",
+        "--capture",
+        help="Print the packets of every datagram in a capture file, see "
+        "Connection.record",
+    )
+    parser.add_argument(
+        "-r",
+        "--replay",
+        help="Replay the received datagrams of a capture file through a Connection "
+        "and print how long it took",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0,
+        help="Replay speed, 1 is real time, 0 (the default) as fast as possible",
+    )
+    parser.add_argument(
+        "-a",
+        "--analyze",
+        help="Decode the received datagrams of a capture file on all cores and print "
+        "every packet as a JSON line",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes used by --analyze, defaults to the CPU count",
+    )
+    parser.add_argument(
+        "--pcap",
+        help="Decode the Among Us datagrams of a pcap or pcapng file, e.g. captured "
+        "with Wireshark. Only datagrams sent by the server are decoded, the ones "
+        "sent by the client are printed as hex",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        action="append",
+        help="Server port of the datagrams read by --pcap, can be given multiple "
+        "times, default is 22023",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print every packet read by --pcap as a JSON line instead of a summary, "
+        "datagrams sent by the client are an 'Outbound' line with their hex data",
+    )
+    parser.add_argument(
+        "--start",
+        type=float,
+        default=None,
+        help="Only print, replay or analyze the datagrams after this many seconds",
+    )
+    parser.add_argument(
+        "--end",
+        type=float,
+        default=None,
+        help="Only print, replay or analyze the datagrams before this many seconds",
+    )
     args = parser.parse_args()
 
     if args.parse is not None:
         data: bytes = bytes.fromhex(args.parse.replace(" ", ""))
         packets = Packet.parse(data, first_call=True)
         print_children(packets, depth=0, with_data=bool(args.with_data))
+
+    if args.capture is not None:
+        with CaptureReader(args.capture) as reader:
+            for i in reader.span(args.start, args.end):
+                record = reader[i]
+                data = bytes(record.data)
+                print(  # noqa: T001
+                    f"[{reader.seconds(i):10.3f}] "
+                    f"{record.direction.name} {len(data)} bytes"
+                )
+                if record.direction == Direction.Outbound:
+                    # the packets can only be parsed as sent by the server
+                    print(f"   {formatHex(data)}")  # noqa: T001
+                    continue
+                packets = Packet.parse(data, first_call=True)
+                print_children(packets, depth=1, with_data=bool(args.with_data))
+
+    if args.replay is not None:
+        started = time.perf_counter()
+        with CaptureReader(args.replay) as reader:
+            replayed = asyncio.run(
+                replay(
+                    Connection(EventBus()),
+                    reader.between(args.start, args.end),
+                    args.speed,
+                )
+            )
+        took = time.perf_counter() - started
+        print(  # noqa: T001
+            f"Replayed {replayed} datagrams in {took:.3f}s "
+            f"({replayed / took:.0f} datagrams/s)"
+        )
+
+    if args.analyze is not None:
+        for event in parse_capture(
+            args.analyze, workers=args.workers, start=args.start, end=args.end
+        ):
+            print(json.dumps(event._asdict(), default=repr))  # noqa: T001
+
+    if args.pcap is not None:
+        datagrams = read_pcap(args.pcap, args.port or DEFAULT_PORTS)
+        for i, (record, source, destination) in enumerate(datagrams):
+            if args.json:
+                if record.direction == Direction.Inbound:
+                    events = decode(record.data, record.timestamp, i)
+                else:
+                    # the packets can only be parsed as sent by the server
+                    data = {"data": record.data.hex()}
+                    events = [PacketEvent(record.timestamp, i, "Outbound", None, data)]
+                for event in events:
+                    print(json.dumps(event._asdict(), default=repr))  # noqa: T001
+                continue
+            print(  # noqa: T001
+                f"[{record.timestamp / 1e9:.6f}] {source} -> {destination} "
+                f"{record.direction.name} {len(record.data)} bytes"
+            )
+            if record.direction == Direction.Outbound:
+                print(f"   {formatHex(record.data)}")  # noqa: T001
+                continue
+            try:
+                packets = Packet.parse(record.data, first_call=True)
+            except Exception as e:
+                print(f"   Could not parse: {e!r}")  # noqa: T001
+                continue
+            print_children(packets, depth=1, with_data=bool(args.with_data))
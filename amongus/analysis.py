@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import collections
+import concurrent.futures
+import logging
+import os
+from typing import Any, Deque, Dict, Iterator, List, NamedTuple, Tuple, Union
+
+from .capture import CaptureReader, Direction
+from .fleet import compact
+from .packets import SpawnPacket
+from .packets.base import Packet
+
+logger = logging.getLogger(__name__)
+
+# the readers opened by a worker process, by path
+_readers: Dict[str, CaptureReader] = {}
+
+
+class PacketEvent(NamedTuple):
+    """
+    A packet decoded by :func:`parse_capture`, flat and picklable
+
+    Attributes:
+        timestamp (int): Monotonic time of the datagram in nanoseconds
+        record (int): The number of the datagram in the capture
+        packet (str): The class name of the packet, e.g. "SendChatPacket". Datagrams
+            which could not be parsed result in a "ParseError" with the error in
+            values
+        parent (str): The class name of the parent packet, None at the top level
+        values (Dict[str, Any]): The values of the packet, converted with
+            :func:`amongus.fleet.compact`
+    """
+
+    timestamp: int
+    record: int
+    packet: str
+    parent: str
+    values: Dict[str, Any]
+
+
+def _walk(
+    packets: List[Packet], timestamp: int, record: int, parent: str = None
+) -> Iterator[PacketEvent]:
+    for packet in packets:
+        if type(packet) is SpawnPacket:
+            packet.parse_spawn()
+        name = packet.__class__.__name__
+        values = {k: v for k, v in packet.values.items() if k != "child_data"}
+        yield PacketEvent(timestamp, record, name, parent, compact(values))
+        yield from _walk(packet.contained_packets, timestamp, record, name)
+
+
+def decode(data: bytes, timestamp: int = 0, record: int = 0) -> List[PacketEvent]:
+    """
+    Parses a datagram sent by the server into flat :class:`PacketEvent` records
+
+    Args:
+        data (bytes): The datagram
+        timestamp (int): Optional; Put into the records
+        record (int): Optional; Put into the records
+    """
+    try:
+        return list(_walk(Packet.parse(data, first_call=True), timestamp, record))
+    except Exception as e:
+        return [PacketEvent(timestamp, record, "ParseError", None, {"error": repr(e)})]
+
+
+def _parse_chunk(path: str, start: int, end: int) -> List[PacketEvent]:
+    """Runs in the worker processes, decodes the inbound records start to end"""
+    reader = _readers.get(path)
+    if reader is None:
+        reader = _readers[path] = CaptureReader(path)
+    events = []
+    for i in range(start, end):
+        record = reader[i]
+        if record.direction == Direction.Inbound:
+            events.extend(decode(bytes(record.data), record.timestamp, i))
+    return events
+
+
+def chunks(
+    reader: CaptureReader, size: int, span: range = None
+) -> Iterator[Tuple[int, int]]:
+    """
+    Splits the records of a capture into chunks of about size bytes
+
+    Args:
+        reader (CaptureReader): The capture
+        size (int): The amount of bytes per chunk, a chunk always contains at least
+            one record
+        span (range): Optional; Only these records, see :meth:`CaptureReader.span`
+    """
+    span = range(len(reader)) if span is None else span
+    start = span.start
+    while start < span.stop:
+        limit = reader.offsets[start] + size
+        end = start + 1
+        while end < span.stop and reader.offsets[end] < limit:
+            end += 1
+        yield start, end
+        start = end
+
+
+def parse_capture(
+    path: Union[str, os.PathLike],
+    workers: int = None,
+    chunk_size: int = 1 << 20,
+    start: float = None,
+    end: float = None,
+) -> Iterator[PacketEvent]:
+    """
+    Decodes the received datagrams of a capture on all cores
+
+    The capture is split into chunks at datagram boundaries, which are parsed by a
+    :class:`concurrent.futures.ProcessPoolExecutor`. The results are streamed back
+    in the order of the capture, at most two chunks per worker are in flight.
+    DataFlag (movement) packets are not decoded any further, as that needs the net
+    ids known by a connection
+
+    Example:
+        .. code-block:: python
+
+           kills = collections.Counter(
+               e.values["target"]
+               for e in parse_capture("game.aucp")
+               if e.packet == "MurderPlayerPacket"
+           )
+
+    Args:
+        path (str): The capture file
+        workers (int): Optional; The amount of processes, defaults to the CPU count
+        chunk_size (int): Optional; The bytes of capture per chunk
+        start (float): Optional; Seconds since the first record, inclusive
+        end (float): Optional; Seconds since the first record, exclusive
+    """
+    path = os.fspath(path)
+    # builds and saves the index, so the workers only have to load it
+    with CaptureReader(path) as reader:
+        parts = list(chunks(reader, chunk_size, reader.span(start, end)))
+    workers = workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        pending: Deque[concurrent.futures.Future] = collections.deque()
+        parts = iter(parts)
+        for part in parts:
+            pending.append(executor.submit(_parse_chunk, path, *part))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            events = pending.popleft().result()
+            part = next(parts, None)
+            if part is not None:
+                pending.append(executor.submit(_parse_chunk, path, *part))
+            yield from events
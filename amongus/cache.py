@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import time
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class TTLCache:
+    """
+    A small dict like cache whose entries expire after a time to live
+
+    Expired entries are removed lazily when they are accessed. If maxsize is given
+    the oldest entries are evicted first
+
+    Attributes:
+        ttl (float): Default time to live of new entries in seconds
+        maxsize (int): Optional; The maximum amount of entries
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        maxsize: int = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Creates an empty cache
+
+        Args:
+            ttl (float): Default time to live in seconds
+            maxsize (int): Optional; The maximum amount of entries
+            clock (Callable): Optional; The clock used for the expiry times
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+
+    def __len__(self) -> int:
+        """Returns the amount of entries, including expired ones not yet removed."""
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """If the cache contains a key which is not expired."""
+        return self.get(key, _missing) is not _missing
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the value for key or default if it is missing or expired"""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires <= self._clock():
+            del self._data[key]
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float = None) -> None:  # noqa: A003
+        """
+        Stores a value
+
+        Args:
+            key (Hashable): The key
+            value (Any): The value
+            ttl (float): Optional; Overwrites the default time to live
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self._data.pop(key, None)
+        self._data[key] = (self._clock() + ttl, value)
+        if self.maxsize is not None:
+            while len(self._data) > self.maxsize:
+                del self._data[next(iter(self._data))]
+
+    def invalidate(self, key: Hashable) -> None:
+        """Removes an entry, doesn't do anything when it doesn't exist"""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def expires_in(self, key: Hashable) -> float:
+        """Returns the seconds until key expires, 0 if it is missing or expired"""
+        entry = self._data.get(key)
+        if entry is None:
+            return 0.0
+        return max(0.0, entry[0] - self._clock())
+
+
+_missing = object()
@@ -0,0 +1,578 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Recording and replaying of the datagrams of a :class:`Connection`
+
+A capture file starts with a header (magic, format version and the wall clock
+time the file was created) followed by one record per datagram::
+
+    header: b"AUCP" | u8 version | f64 created (unix time)
+    record: u64 timestamp (monotonic ns) | u8 direction | u16 length | data
+
+All numbers are little endian. The timestamps are only meaningful relative to each
+other, a file which was appended to by another process can jump back in time
+
+:class:`CaptureReader` memory maps a capture and keeps an index of it in a sidecar
+file next to it (``<capture>.idx``)::
+
+    header: b"AUCI" | u8 version | f64 capture created | u64 indexed bytes
+            | u32 records | u32 tags
+    arrays: u64 offsets[records] | u64 timestamps[records]
+    tags:   u16 tag | u32 count | u32 record numbers[count], repeated
+"""
+import array
+import asyncio
+import bisect
+import collections
+import logging
+import mmap
+import os
+import struct
+import time
+from enum import IntEnum
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Tuple,
+    Union,
+)
+
+from .enums import GameDataTag, MatchMakingTag, PacketType
+from .helpers import dotdict, readPacked, readString
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"AUCP"
+VERSION = 1
+HEADER = struct.Struct("<4sBd")
+RECORD = struct.Struct("<QBH")
+HELLO = bytes([PacketType.Hello])
+
+
+INDEX_MAGIC = b"AUCI"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<4sBdQII")
+INDEX_TAG = struct.Struct("<HI")
+
+
+class Direction(IntEnum):
+    Inbound = 0
+    Outbound = 1
+
+
+class TagLevel(IntEnum):
+    """Where a tag found by :func:`datagram_tags` comes from"""
+
+    Packet = 0  # PacketType
+    Message = 1  # MatchMakingTag
+    GameData = 2  # GameDataTag
+    RPC = 3  # RPCTag
+
+
+class Record(NamedTuple):
+    """
+    A captured datagram
+
+    Attributes:
+        timestamp (int): Monotonic time of the capture in nanoseconds
+        direction (Direction): If the datagram was received or sent
+        data (bytes): The datagram, a memoryview of the file if read by a
+            :class:`CaptureReader`
+    """
+
+    timestamp: int
+    direction: Direction
+    data: Union[bytes, memoryview]
+
+
+class CaptureWriter:
+    """
+    Appends datagrams to a capture file
+
+    Records are written through a buffered file, they reach the disk when the
+    buffer is full, when a record is written more than :attr:`flushInterval`
+    seconds after the last flush or when the writer is flushed or closed
+
+    Attributes:
+        path (str): The path of the capture file
+        records (int): The amount of records written by this writer
+        flushInterval (float): Seconds records can stay in the buffer, None to only
+            flush when the buffer is full
+    """
+
+    path: str
+    records: int = 0
+    flushInterval: float = 1.0
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        """
+        Opens the file for appending, the header is written if the file is empty
+
+        Args:
+            path (str): The path of the capture file
+        """
+        self.path = os.fspath(path)
+        # stays open until close(), the writer is the context manager
+        self._file: BinaryIO = open(self.path, "ab")  # noqa: SIM115
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, time.time()))
+        self._flushed = time.monotonic()
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def write(self, direction: Direction, data: bytes, timestamp: int = None) -> None:
+        """
+        Appends a datagram
+
+        Args:
+            direction (Direction): If the datagram was received or sent
+            data (bytes): The datagram
+            timestamp (int): Optional; Monotonic nanoseconds, defaults to now
+        """
+        if timestamp is None:
+            timestamp = time.monotonic_ns()
+        self._file.write(RECORD.pack(timestamp, direction, len(data)) + data)
+        self.records += 1
+        if (
+            self.flushInterval is not None
+            and time.monotonic() - self._flushed >= self.flushInterval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        self._file.flush()
+        self._flushed = time.monotonic()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+
+def read_capture(source: Union[str, os.PathLike, BinaryIO]) -> Iterator[Record]:
+    """
+    Reads the records of a capture file
+
+    Args:
+        source (str): The path of the capture file or a binary file object
+
+    Raises:
+        ValueError: The file is not a capture file or of an unknown version
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            yield from read_capture(f)
+        return
+    header = source.read(HEADER.size)
+    if len(header) < HEADER.size or header[:4] != MAGIC:
+        raise ValueError("Not a capture file")
+    _, version, _ = HEADER.unpack(header)
+    if version != VERSION:
+        raise ValueError(f"Unsupported capture version {version}")
+    while True:
+        head = source.read(RECORD.size)
+        if len(head) < RECORD.size:
+            # end of file, or a record cut off while writing
+            return
+        timestamp, direction, length = RECORD.unpack(head)
+        data = source.read(length)
+        if len(data) < length:
+            return
+        yield Record(timestamp, Direction(direction), data)
+
+
+def _messages(data: Union[bytes, memoryview]) -> Iterator[Tuple[int, memoryview]]:
+    offset = 0
+    while offset + 3 <= len(data):
+        length, tag = struct.unpack_from("<HB", data, offset)
+        yield tag, data[offset + 3 : offset + 3 + length]
+        offset += 3 + length
+
+
+def datagram_tags(data: Union[bytes, memoryview]) -> Iterator[Tuple[TagLevel, int]]:
+    """
+    Finds the tags of a datagram without parsing its packets
+
+    Yields the packet type, the tag of every message, the tags inside of GameData
+    messages and the tags of RPCs, stops silently at malformed data
+
+    Args:
+        data (bytes): The datagram, as sent by the server
+    """
+    if not data:
+        return
+    yield TagLevel.Packet, data[0]
+    if data[0] == PacketType.Reliable:
+        body = data[3:]
+    elif data[0] == PacketType.Unreliable:
+        body = data[1:]
+    else:
+        return
+    try:
+        for tag, payload in _messages(memoryview(body)):
+            yield TagLevel.Message, tag
+            if tag == MatchMakingTag.GameData:
+                inner = payload[4:]
+            elif tag == MatchMakingTag.GameDataTo:
+                _, inner = readPacked(payload[4:])
+            else:
+                continue
+            for game_data_tag, game_data in _messages(inner):
+                yield TagLevel.GameData, game_data_tag
+                if game_data_tag == GameDataTag.RpcFlag:
+                    _, rest = readPacked(game_data)
+                    if len(rest):
+                        yield TagLevel.RPC, rest[0]
+    except (IndexError, struct.error):
+        return
+
+
+class CaptureReader:
+    """
+    Memory mapped, indexed access to a capture file
+
+    Records are not copied, their data is a :class:`memoryview` of the mapped file.
+    The index (offsets, timestamps and which records contain which tags, see
+    :func:`datagram_tags`) is stored in a sidecar file, so a capture is only
+    scanned once. Records appended after the index was written are indexed when
+    the capture is opened again
+
+    Example:
+        .. code-block:: python
+
+           with CaptureReader("game.aucp") as reader:
+               for i in reader.find(RPCTag.MurderPlayer, TagLevel.RPC):
+                   for record in reader.around(i, before=15, after=15):
+                       ...
+
+    Attributes:
+        path (str): The path of the capture file
+        index_path (str): The path of the sidecar file, None if not used
+        offsets (array.array): The offset of every record in the file
+        timestamps (array.array): The timestamp of every record in nanoseconds
+    """
+
+    path: str
+    index_path: str = None
+    offsets: array.array
+    timestamps: array.array
+
+    def __init__(self, path: Union[str, os.PathLike], index: bool = True):
+        """
+        Maps the capture file and loads or builds its index
+
+        Args:
+            path (str): The path of the capture file
+            index (bool): Optional; Load and save the sidecar index file
+
+        Raises:
+            ValueError: The file is not a capture file or of an unknown version
+        """
+        self.path = os.fspath(path)
+        self.index_path = self.path + ".idx" if index else None
+        self.offsets = array.array("Q")
+        self.timestamps = array.array("Q")
+        self._tags: Dict[int, array.array] = collections.defaultdict(
+            lambda: array.array("I")
+        )
+        with open(self.path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size or header[:4] != MAGIC:
+                raise ValueError("Not a capture file")
+            _, version, self._created = HEADER.unpack(header)
+            if version != VERSION:
+                raise ValueError(f"Unsupported capture version {version}")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self._indexed = HEADER.size
+        if self.index_path is not None:
+            self._load_index()
+        if self._scan() and self.index_path is not None:
+            self._save_index()
+        self._sorted = all(
+            a <= b for a, b in zip(self.timestamps, self.timestamps[1:])
+        )
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """Returns the amount of records."""
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> Record:
+        """Returns the record with the number i, its data is not copied."""
+        offset = self.offsets[i]
+        timestamp, direction, length = RECORD.unpack_from(self._mmap, offset)
+        start = offset + RECORD.size
+        return Record(timestamp, Direction(direction), self._view[start : start + length])
+
+    def __iter__(self) -> Iterator[Record]:
+        """Iterates over all records in the order they were written."""
+        return (self[i] for i in range(len(self)))
+
+    def close(self) -> None:
+        """
+        Unmaps the file, if record data is still referenced somewhere the file stays
+        mapped until it is garbage collected
+        """
+        if self._mmap.closed:
+            return
+        try:
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            logger.debug(f"Records of {self.path} are still in use, not unmapping")
+
+    def seconds(self, i: int) -> float:
+        """Returns the time of the record in seconds since the first record"""
+        return (self.timestamps[i] - self.timestamps[0]) / 1e9
+
+    def find(self, tag: int, level: TagLevel = TagLevel.RPC) -> List[int]:
+        """
+        Returns the numbers of all records containing the tag
+
+        Args:
+            tag (int): The tag, e.g. a :class:`RPCTag` or :class:`MatchMakingTag`
+            level (TagLevel): Optional; What kind of tag it is, defaults to RPC
+        """
+        return list(self._tags.get(level << 8 | tag, ()))
+
+    def span(self, start: float = None, end: float = None) -> range:
+        """
+        Returns the numbers of the records between two points in time
+
+        Args:
+            start (float): Optional; Seconds since the first record, inclusive
+            end (float): Optional; Seconds since the first record, exclusive
+        """
+        if not len(self):
+            return range(0)
+        first = self.timestamps[0]
+        low = first + int(start * 1e9) if start is not None else None
+        high = first + int(end * 1e9) if end is not None else None
+        if not self._sorted:
+            # appended captures can go back in time, bisecting doesn't work
+            numbers = [
+                i
+                for i, t in enumerate(self.timestamps)
+                if (low is None or t >= low) and (high is None or t < high)
+            ]
+            return range(numbers[0], numbers[-1] + 1) if numbers else range(0)
+        return range(
+            bisect.bisect_left(self.timestamps, low) if low is not None else 0,
+            bisect.bisect_left(self.timestamps, high) if high is not None else len(self),
+        )
+
+    def between(
+        self, start: float = None, end: float = None, direction: Direction = None
+    ) -> Iterator[Record]:
+        """
+        Iterates over the records between two points in time
+
+        Args:
+            start (float): Optional; Seconds since the first record, inclusive
+            end (float): Optional; Seconds since the first record, exclusive
+            direction (Direction): Optional; Only records in this direction
+        """
+        for i in self.span(start, end):
+            record = self[i]
+            if direction is None or record.direction == direction:
+                yield record
+
+    def around(
+        self, i: int, before: float = 15.0, after: float = 15.0, **kwargs
+    ) -> Iterator[Record]:
+        """
+        Iterates over the records around the record i, see :meth:`between`
+
+        Args:
+            i (int): The number of the record, e.g. from :meth:`find`
+            before (float): Optional; Seconds before the record
+            after (float): Optional; Seconds after the record
+        """
+        at = self.seconds(i)
+        return self.between(at - before, at + after, **kwargs)
+
+    def _scan(self) -> bool:
+        """Indexes the records after the indexed part, returns if there were any"""
+        offset, size, count = self._indexed, len(self._mmap), len(self.offsets)
+        while offset + RECORD.size <= size:
+            timestamp, direction, length = RECORD.unpack_from(self._mmap, offset)
+            start = offset + RECORD.size
+            if start + length > size:
+                # cut off while writing
+                break
+            number = len(self.offsets)
+            self.offsets.append(offset)
+            self.timestamps.append(timestamp)
+            if direction == Direction.Inbound:
+                for level, tag in set(datagram_tags(self._view[start : start + length])):
+                    self._tags[level << 8 | tag].append(number)
+            offset = start + length
+        self._indexed = offset
+        return len(self.offsets) > count
+
+    def _load_index(self) -> None:
+        try:
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        try:
+            magic, version, created, indexed, count, tags = INDEX_HEADER.unpack_from(
+                data
+            )
+        except struct.error:
+            return
+        if (
+            magic != INDEX_MAGIC
+            or version != INDEX_VERSION
+            or created != self._created
+            or indexed > len(self._mmap)
+        ):
+            logger.debug(f"Ignoring outdated capture index {self.index_path}")
+            return
+        offset = INDEX_HEADER.size
+        offsets, timestamps = array.array("Q"), array.array("Q")
+        _tags = {}
+        try:
+            for values in (offsets, timestamps):
+                values.frombytes(data[offset : offset + count * 8])
+                offset += count * 8
+            for _ in range(tags):
+                key, amount = INDEX_TAG.unpack_from(data, offset)
+                offset += INDEX_TAG.size
+                numbers = _tags[key] = array.array("I")
+                numbers.frombytes(data[offset : offset + amount * 4])
+                offset += amount * 4
+        except (ValueError, struct.error):
+            logger.debug(f"Ignoring broken capture index {self.index_path}")
+            return
+        if len(offsets) != count or len(timestamps) != count:
+            return
+        self.offsets, self.timestamps, self._indexed = offsets, timestamps, indexed
+        self._tags.update(_tags)
+
+    def _save_index(self) -> None:
+        parts = [
+            INDEX_HEADER.pack(
+                INDEX_MAGIC,
+                INDEX_VERSION,
+                self._created,
+                self._indexed,
+                len(self.offsets),
+                len(self._tags),
+            ),
+            self.offsets.tobytes(),
+            self.timestamps.tobytes(),
+        ]
+        for key, numbers in self._tags.items():
+            parts.append(INDEX_TAG.pack(key, len(numbers)) + numbers.tobytes())
+        temporary = self.index_path + ".tmp"
+        try:
+            with open(temporary, "wb") as f:
+                f.write(b"".join(parts))
+            os.replace(temporary, self.index_path)
+        except OSError as e:
+            # e.g. a read-only directory, the index is rebuilt the next time
+            logger.debug(f"Could not write the capture index: {e!r}")
+
+
+class _ReplayTransport(asyncio.DatagramTransport):
+    """Swallows everything the connection sends while replaying"""
+
+    def __init__(self):
+        super().__init__()
+        self.sent = 0
+        self._closing = False
+
+    def sendto(self, data: bytes, addr=None) -> None:
+        self.sent += 1
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def close(self) -> None:
+        self._closing = True
+
+    def abort(self) -> None:
+        self._closing = True
+
+
+async def replay(
+    connection,
+    source: Union[str, os.PathLike, BinaryIO, Iterable[Record]],
+    speed: float = 1.0,
+) -> int:
+    """
+    Feeds the inbound datagrams of a capture through :meth:`Connection._on_data`
+
+    No socket is used, everything the connection sends is dropped. The connection
+    dispatches its events like it did when the capture was recorded. If it has no
+    name yet, the name of the recorded Hello is used, or ``"Replay"`` if the
+    capture doesn't start with one
+
+    Args:
+        connection (Connection): The connection to replay into, it should not be
+            connected
+        source (str): The path of the capture file, a binary file object or records,
+            e.g. :meth:`CaptureReader.between` for a part of a capture
+        speed (float): Optional; 1 replays in real time, 2 twice as fast and so on.
+            0 replays as fast as possible
+
+    Returns:
+        The amount of replayed datagrams
+    """
+    connection._bind_loop()
+    connection._sequence_ids = {}
+    connection.net_ids = dotdict({})
+    connection.transport = _ReplayTransport()
+    connection.closed = False
+    loop = asyncio.get_running_loop()
+    begin, elapsed, previous = loop.time(), 0, None
+    if isinstance(source, (str, os.PathLike)) or hasattr(source, "read"):
+        source = read_capture(source)
+    replayed = 0
+    try:
+        for record in source:
+            if record.direction != Direction.Inbound:
+                if connection.name is None and bytes(record.data[:1]) == HELLO:
+                    # the name is needed for the packets sent while replaying
+                    connection.name, _ = readString(bytes(record.data[8:]))
+                continue
+            if connection.name is None:
+                # e.g. a part of a capture, the connection still sends its name
+                connection.name = "Replay"
+            if previous is not None:
+                # appended captures can go back in time
+                elapsed += max(record.timestamp - previous, 0)
+            previous = record.timestamp
+            if speed:
+                delay = begin + elapsed / 1e9 / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            connection._last_recv = loop.time()
+            try:
+                await connection._on_data(bytes(record.data))
+            except Exception as e:
+                logger.exception(e)
+            replayed += 1
+    finally:
+        connection._stop_timers()
+        await connection.disconnect(True)
+    return replayed
@@ -3,15 +3,33 @@
 import asyncio
 import re
 from ipaddress import ip_address
-from typing import Any, Callable, List, Tuple, Union
+from typing import Any, Callable, List, Optional, Tuple, Union
 
-from .player import Player
+from .cache import TTLCache
 from .connection import Connection
-from .enums import GameSettings, PlayerAttributes
+from .enums import DisconnectReason, GameSettings, PlayerAttributes
 from .eventbus import EventBus
-from .exceptions import AmongUsException
+from .exceptions import AmongUsException, ConnectionException
 from .game import Game, GameList
+from .index import LobbyIndex
+from .metrics import Metrics
+from .player import Player
+from .probe import RegionProbe
+from .profiler import ProfileReport
 from .regions import regions
+from .timers import TimerWheel
+from .warmpool import ConnectionPool
+
+# the settings of a client which are stored on its connection
+CONNECTION_SETTINGS = (
+    "name",
+    "color",
+    "hat",
+    "skin",
+    "pet",
+    "spectator",
+    "auto_rejoin",
+)
 
 
 class Client:
@@ -28,12 +46,26 @@ class Client:
         pet (PlayerAttributes.Pet): Pet of the character
         spectator (bool): Whether the Client should behave like a normal player
             or just "spectate" and remain invisible
+        auto_rejoin (bool): If the client joins the lobby again after a game ended
         game (Game): The current game
+        metrics (Metrics): The runtime metrics of the connection, None unless enabled
+            with :meth:`Connection.enable_metrics`
         players (List[Player]): Players in the current game
+        lobby_index (LobbyIndex): The lobbies found by :meth:`find_games`, lobbies
+            missing from a newer search are removed. Can be replaced with
+            :attr:`LobbyScanner.index` to query a scanner's lobbies
+        probe (RegionProbe): The region probe used for the "auto" region, keeps
+            probing in the background once it was used
+        lobby_regions (TTLCache): The regions of lobbies joined with region "any",
+            shared by all clients, entries live for 5 minutes
     """
 
     connection: Connection
     eventbus: EventBus
+    lobby_index: LobbyIndex
+    probe: RegionProbe
+    # shared by all clients unless replaced on an instance
+    lobby_regions: TTLCache = TTLCache(300, maxsize=4096)
 
     def __init__(
         self,
@@ -43,6 +75,9 @@ class Client:
         skin: PlayerAttributes.Skin = 0,
         pet: PlayerAttributes.Pet = 0,
         spectator: bool = False,
+        timer_wheel: TimerWheel = None,
+        probe: RegionProbe = None,
+        auto_rejoin: bool = False,
     ):
         """
         Client used to interact with the Among Us servers
@@ -57,6 +92,12 @@ class Client:
             skin (PlayerAttributes.Skin): Skin of the character
             pet (PlayerAttributes.Pet): Pet of the character
             spectator (bool): If the client should only spectate
+            timer_wheel (TimerWheel): Optional; a timer wheel shared between many
+                clients, used for all connection timers instead of the event loop
+            probe (RegionProbe): Optional; a region probe shared between many
+                clients, used by :meth:`start` for the "auto" region
+            auto_rejoin (bool): Optional; Join the lobby again as soon as a game
+                ended, see :attr:`Connection.auto_rejoin`
 
         Raises:
             AmongUsException: Name is longer than 10 or shorter than 1 characters
@@ -66,13 +107,16 @@ class Client:
                 "Name can't be longer than 10 or shorter than 1 character(s)!"
             )
         self.eventbus = EventBus()
-        self.connection = Connection(self.eventbus)
+        self.connection = Connection(self.eventbus, timer_wheel=timer_wheel)
+        self.lobby_index = LobbyIndex()
+        self.probe = probe
         self.name = name
         self.color = color
         self.hat = hat
         self.skin = skin
         self.pet = pet
         self.spectator = spectator
+        self.auto_rejoin = auto_rejoin
 
     @property
     def stopped(self) -> bool:
@@ -142,10 +186,22 @@ class Client:
     def spectator(self, value: bool) -> None:
         self.connection.spectator = value
 
+    @property
+    def auto_rejoin(self) -> bool:
+        return self.connection.auto_rejoin
+
+    @auto_rejoin.setter
+    def auto_rejoin(self, value: bool) -> None:
+        self.connection.auto_rejoin = value
+
     @property
     def latency(self) -> int:
         return self.connection.latency
 
+    @property
+    def metrics(self) -> Optional[Metrics]:
+        return self.connection.metrics
+
     @property
     def game(self) -> Game:
         return self.connection.game
@@ -158,14 +214,39 @@ class Client:
     def _result(self) -> Any:
         return self.connection.result
 
-    def run(self, *args, **kwargs) -> Any:
+    def run(
+        self,
+        *args,
+        loop_factory: Callable[[], asyncio.AbstractEventLoop] = None,
+        **kwargs,
+    ) -> Any:
         """
-        Helper function which runs :meth:`Client.start`
+        Helper function which runs :meth:`Client.start` on a new event loop
 
-        All arguments will be passed to :meth:`Client.start`,
+        All other arguments will be passed to :meth:`Client.start`,
         this will block until the connection is closed from either side
+
+        Example:
+            .. code-block:: python
+
+               import uvloop
+
+               client.run(region="EU", loop_factory=uvloop.new_event_loop)
+
+        Args:
+            loop_factory (Callable): Optional; Creates the event loop to run on,
+                defaults to :func:`asyncio.new_event_loop`
         """
-        return asyncio.get_event_loop().run_until_complete(self.start(*args, **kwargs))
+        loop = (loop_factory or asyncio.new_event_loop)()
+        asyncio.set_event_loop(loop)
+        try:
+            return loop.run_until_complete(self.start(*args, **kwargs))
+        finally:
+            try:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                asyncio.set_event_loop(None)
+                loop.close()
 
     def add_listener(self, event: str, func: Callable) -> None:
         """
@@ -215,17 +296,22 @@ class Client:
         return decorator(name) if callable(name) else decorator
 
     async def start(self, region: str = None, custom_server: str = None,
-                    port: int = 22023, gameVersion: tuple = (2021, 3, 5)) -> Any:
+                    port: int = 22023, gameVersion: tuple = (2021, 3, 5),
+                    pool: ConnectionPool = None) -> Any:
         """
         Starts the client, connecting to the server and sleeping until disconnect
 
         Args:
             region (str): Optional; The region where the lobby is hosted,
-                see :attr:`amongus.regions.regions`
+                see :attr:`amongus.regions.regions`. "auto" connects to the healthy
+                region with the lowest latency, measured by :attr:`probe`
             custom_server (str): Optional; A custom address to connect to, either this
                 or region has to be given. Example: `10.1.1.1:22023` or `10.1.1.1`
             port (int): Optional; Port of the server to connect to, defaults to 22023
             gameVersion (tuple): Optional; The version of the game running on the server
+            pool (ConnectionPool): Optional; Adopt an already connected connection of
+                the region from this pool instead of connecting, the pool has to
+                be filled for the name of this client
 
 
         Raises:
@@ -233,8 +319,26 @@ class Client:
                 see :attr:`ConnectionException.reason` for the reason and
                 :attr:`ConnectionException.custom_reason` if the reason is "Custom"
             AmongUsException: Invalid region or custom_server could not be parsed
+                or a pool was given together with a custom_server
         """
-        if region is not None and region.upper() not in regions:
+        if pool is not None and custom_server is not None:
+            raise AmongUsException("A pool can only be used with a region!")
+        auto = region is not None and region.lower() == "auto"
+        own_probe = auto and self.probe is None
+        if auto:
+            if own_probe:
+                self.probe = RegionProbe(
+                    port=port,
+                    gameVersion=gameVersion,
+                    timer_wheel=self.connection.timer_wheel,
+                )
+            try:
+                region = await self.probe.fastest()
+            except AmongUsException:
+                if own_probe:
+                    self.probe = None
+                raise
+        elif region is not None and region.upper() not in regions:
             raise AmongUsException(f"The region {region} does not exist!")
 
         self.region = region
@@ -250,38 +354,184 @@ class Client:
                 # just let the user handle it
                 raise AmongUsException("custom_server ip could not be parsed!") from e
         else:
-            host = regions[region]
+            host = self.probe.regions[region] if auto else regions[region]
         try:
-            self.connection.players.ready = False
-            await self.connection.connect(name=self.name, host=host, port=port, gameVersion=gameVersion)
-
-            while not self.stopped:
-                # only exit when we lost connection or disconnected in some other way
-                await asyncio.sleep(1)
+            if auto:
+                self.probe.start()
+            if pool is not None:
+                self.adopt(await pool.checkout(region, self.name))
+                self.connection.players.ready = False
+                self.eventbus.dispatch("ready")
+            else:
+                self.connection.players.ready = False
+                await self.connection.connect(name=self.name, host=host, port=port, gameVersion=gameVersion)
+            # only exit when we lost connection or disconnected in some other way,
+            # the connection might be replaced in the meantime (see join_lobby)
+            connection = None
+            while connection is not self.connection:
+                connection = self.connection
+                await connection.wait_closed()
 
             if isinstance(self._result, Exception):
                 raise self._result
             else:
                 return self._result
         finally:
+            if own_probe:
+                self.probe.stop()
+                self.probe = None
             await self.stop()
 
-    async def join_lobby(self, lobby_code: str) -> bool:
+    def adopt(self, connection: Connection) -> None:
+        """
+        Replaces the connection of the client with an already connected one,
+        e.g. from a :class:`ConnectionPool`
+
+        The name and cosmetics of the client are kept and its listeners
+        get the events of the new connection
+
+        Args:
+            connection (Connection): The new connection
+        """
+        old = self.connection
+        connection.eventbus = self.eventbus
+        for attribute in CONNECTION_SETTINGS:
+            setattr(connection, attribute, getattr(old, attribute))
+        connection.profiler, old.profiler = old.profiler, None
+        connection.tracer, old.tracer = old.tracer, None
+        if old.metrics is not None:
+            metrics = old.metrics
+            old.disable_metrics()
+            connection.enable_metrics(metrics)
+        self.connection = connection
+
+    async def join_lobby(self, lobby_code: str, region: str = None) -> bool:
         """
         Joins an existing lobby
 
+        If a region is given and it's not the current one, the lobby is joined with
+        a new connection to that region which replaces the current one. With "any"
+        all regions are tried at once, the first one which finds the lobby wins and
+        is remembered in :attr:`lobby_regions`, so the next join of the lobby only
+        asks that region
+
+        Example:
+            .. code-block:: python
+
+               await client.join_lobby("ABCDEF", region="any")
+
         Args:
             lobby_code (str): 6 or 4 digit lobby code from Among Us
+            region (str): Optional; The region of the lobby or "any" if it is unknown,
+                defaults to the current connection
 
         Raises:
-            AmongUsException: Invalid lobby code
+            AmongUsException: Invalid lobby code or region
+            ConnectionException: Joining failed, see .reason for more
         """
         if len(lobby_code) not in [4, 6]:
             raise AmongUsException("Invalid lobby code length!")
         if re.match("^[A-Z]*$", lobby_code.upper()) is None:
             raise AmongUsException("The lobby code can only contain letters!")
         self.lobby_code = lobby_code.upper()
-        return await self.connection.join_game(self.lobby_code)
+        if region is None:
+            return await self.connection.join_game(self.lobby_code)
+
+        if region.lower() != "any":
+            if region.upper() not in regions:
+                raise AmongUsException(f"The region {region} does not exist!")
+            return await self._race_join(self.lobby_code, [region.upper()])
+        cached = self.lobby_regions.get(self.lobby_code)
+        if cached is not None:
+            try:
+                return await self._race_join(self.lobby_code, [cached])
+            except ConnectionException as e:
+                if e.reason != DisconnectReason.GameNotFound:
+                    raise
+                self.lobby_regions.invalidate(self.lobby_code)
+        return await self._race_join(self.lobby_code, list(regions))
+
+    async def _race_join(self, lobby_code: str, candidates: List[str]) -> bool:
+        """
+        Joins the lobby in all candidate regions concurrently, the first success
+        becomes the client's connection and the other attempts are cancelled
+        """
+        attempts = {}
+        for region in candidates:
+            if region == self.region and self.connection.ready:
+                task = asyncio.ensure_future(self.connection.join_game(lobby_code))
+                attempts[task] = (region, self.connection, None)
+                continue
+            events = []
+            connection = Connection(EventBus(), timer_wheel=self.connection.timer_wheel)
+            # the events are replayed to the listeners if this attempt wins
+            connection.eventbus.add_forwarder(
+                lambda event, args, kwargs, events=events: events.append(
+                    (event, args, kwargs)
+                )
+            )
+            for attribute in CONNECTION_SETTINGS:
+                setattr(connection, attribute, getattr(self.connection, attribute))
+            connection.region = region
+            task = asyncio.ensure_future(
+                self._join_with(connection, regions[region], lobby_code)
+            )
+            attempts[task] = (region, connection, events)
+
+        winner, errors = None, []
+        pending = set(attempts)
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    elif winner is None:
+                        winner = task
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            await asyncio.gather(
+                *(
+                    connection.disconnect(False)
+                    for task, (_, connection, _) in attempts.items()
+                    if task is not winner and connection is not self.connection
+                ),
+                return_exceptions=True,
+            )
+
+        if winner is None:
+            for error in errors:
+                if getattr(error, "reason", None) != DisconnectReason.GameNotFound:
+                    raise error
+            raise ConnectionException(
+                f"Lobby {lobby_code} was not found!", DisconnectReason.GameNotFound
+            )
+        region, connection, events = attempts[winner]
+        self.lobby_regions.set(lobby_code, region)
+        if connection is not self.connection:
+            old = self.connection
+            self.adopt(connection)
+            for event, args, kwargs in events:
+                if event != "ready":
+                    self.eventbus.dispatch(event, *args, **kwargs)
+            await old.disconnect(False)
+        return True
+
+    async def _join_with(self, connection: Connection, host: str, lobby_code: str):
+        """Connects a new connection and joins the lobby with it"""
+        await connection.connect(
+            self.name,
+            host,
+            self.connection.port or 22023,
+            self.connection.gameVersion or (2021, 3, 5),
+        )
+        if connection.closed:
+            raise connection.result
+        return await connection.join_game(lobby_code)
 
     async def find_games(
         self,
@@ -305,7 +555,66 @@ class Client:
         """
         if impostors not in range(1, 4):
             raise AmongUsException("Amount of impostors has to be between 1 and 3!")
-        return await self.connection.find_games(mapId, impostors, language)
+        result = await self.connection.find_games(mapId, impostors, language)
+        # lobbies of custom servers are indexed by the address of the matchmaker
+        region = (
+            self.region.upper()
+            if self.region is not None
+            else "{}:{}".format(*self.connection.matchmaker)
+        )
+        for game in result.games:
+            game.region = region
+        self.lobby_index.replace(result.games, mapId, impostors, language, region)
+        return result
+
+    def query_lobbies(
+        self,
+        mapId: GameSettings.Map = None,
+        impostors: int = None,
+        language: GameSettings.Keywords = None,
+        region: str = None,
+        min_players: int = 0,
+        max_players: int = 255,
+        descending: bool = False,
+        limit: int = None,
+    ) -> List[Game]:
+        """
+        Queries the already found lobbies without asking the server,
+        see :meth:`LobbyIndex.query`
+
+        Example:
+            .. code-block:: python
+
+               # Polus, 2 impostors, 6-9 players, fullest first
+               games = client.query_lobbies(
+                   GameSettings.Map.Polus, 2, min_players=6, max_players=9,
+                   descending=True,
+               )
+
+        Args:
+            mapId (GameSettings.Map): Optional; The map
+            impostors (int): Optional; The amount of impostors
+            language (GameSettings.Keywords): Optional; The language of the chat
+            region (str): Optional; The region the lobby was found in, host:port of
+                the server for lobbies found on a custom server
+            min_players (int): Optional; The minimum player count
+            max_players (int): Optional; The maximum player count
+            descending (bool): Optional; Fullest lobbies first
+            limit (int): Optional; Return at most this many lobbies
+
+        Returns:
+            The matching lobbies sorted by player count
+        """
+        return self.lobby_index.query(
+            mapId,
+            impostors,
+            language,
+            region.upper() if region is not None else None,
+            min_players,
+            max_players,
+            descending,
+            limit,
+        )
 
     async def stop(self, force: bool = False) -> None:
         """
@@ -338,3 +647,34 @@ class Client:
                 velocity/relative position
         """
         await self.connection.move(position, velocity)
+
+    async def profile(self, seconds: float, threshold: float = 0.05) -> ProfileReport:
+        """
+        Times the packet handlers and event listeners for a while
+
+        A profiler enabled with :meth:`Connection.enable_profiling` is replaced for
+        that time and restored afterwards
+
+        Example:
+            .. code-block:: python
+
+               report = await client.profile(30)
+               print(report.format())
+
+        Args:
+            seconds (float): How long to profile
+            threshold (float): Optional; Seconds after which a call is slow and
+                dispatched as a ``slow_handler`` event, default is 50ms
+
+        Returns:
+            The handlers and listeners ranked by the time they took in total
+        """
+        previous = self.connection.profiler
+        profiler = self.connection.enable_profiling(threshold)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            if self.connection.profiler is profiler:
+                self.connection.profiler = previous
+                self.eventbus.profiler = previous
+        return profiler.report()
@@ -1,12 +1,14 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 import asyncio
+import collections
 import logging
+import random
 import time
-from typing import Dict, Tuple, Union
-
-import asyncio_dgram
+from typing import Awaitable, Callable, Deque, Dict, Set, Tuple, Union
 
+from .cache import TTLCache
+from .capture import CaptureWriter, Direction
 from .enums import (
     ChatNoteType,
     DataFlag,
@@ -24,6 +26,7 @@ from .eventbus import EventBus
 from .exceptions import ConnectionException, SpectatorException
 from .game import Game, GameList
 from .helpers import dotdict, formatHex
+from .metrics import Metrics
 from .packets import (
     AcknowledgePacket,
     CheckColorPacket,
@@ -50,23 +53,77 @@ from .packets.gamedata.scenechange import SceneChangePacket
 from .packets.rpc import RPCPacket
 from .packets.rpc.checkname import CheckNamePacket
 from .player import Player, PlayerList
+from .profiler import Profiler
+from .protocol import ConnectionProtocol
 from .queue import PacketQueue
 from .task import Task
+from .timers import TimerWheel
+from .tracing import Tracer, current_trace
 
 logger = logging.getLogger(__name__)
 
+# read-only lookup tables, shared by all connections
+COSMETIC_VALIDATORS = {
+    "name": lambda n: n is not None,
+    "color": PlayerAttributes.Color.has_value,
+    "hat": PlayerAttributes.Hat.has_value,
+    "pet": PlayerAttributes.Pet.has_value,
+    "skin": PlayerAttributes.Skin.has_value,
+}
+COSMETIC_CONVERTERS = {
+    "color": PlayerAttributes.Color,
+    "hat": PlayerAttributes.Hat,
+    "pet": PlayerAttributes.Pet,
+    "skin": PlayerAttributes.Skin,
+}
+NET_ID_FLAGS = {
+    "control": DataFlag.Control,
+    "physics": DataFlag.Physics,
+    "network": DataFlag.Network,
+}
+
 
 class Connection:
     """
     Class for communication with the Among Us servers via UDP
 
     Attributes:
-        socket: The UDP "socket" for UDP communication
+        transport (asyncio.DatagramTransport): The UDP transport for communication
         latency (int): The latency of the connection in ms
         closed (bool): If the connection is closed
         connectTimeout (int): Timeout for connecting to server, default is 1000ms (1s)
         recvTimeout (int): Timeout for receiving messages, default is 10.000ms (10s)
         keepAliveTimeout (int): Timeout between ping messages
+        resendTimeout (int): Time after which an unacknowledged reliable packet is
+            sent again, default is 1000ms (1s)
+        resendLimit (int): How often a reliable packet is resent before giving up,
+            default is 0 (never resend)
+        timer_wheel (TimerWheel): Optional; shared timer wheel which is used for all
+            timers (keepalive, receive timeout, resends) instead of the event loop
+        redirect_cache (TTLCache): Redirect targets by (matchmaker, lobby code),
+            shared by all connections, entries live for 5 minutes
+        redirectLimit (int): How many redirects a join follows, default is 3
+        queueLength (int): How many received packets :attr:`queue` keeps for
+            lookups of older packets, default is 32
+        auto_rejoin (bool): Join the lobby again right after the game ended. The
+            known players and settings are kept, only players whose data changed
+            get a `player_update` event instead of a full `players_update`
+        resumeAttempts (int): How often :meth:`resume` tries to reconnect after the
+            recvTimeout was exceeded, default is 5
+        resumeBackoff (int): The delay before the second attempt in ms, it doubles
+            with every attempt, default is 250ms
+        resumeBackoffMax (int): The longest delay between two attempts in ms,
+            default is 8000ms (8s)
+        capture (CaptureWriter): Optional; Every sent and received datagram is
+            appended to it, see :meth:`record`
+        metrics (Metrics): Optional; Records the traffic, parse and handler times,
+            events and queue depths, see :meth:`enable_metrics`
+        profiler (Profiler): Optional; Times the packet handlers and event listeners
+            and reports slow ones, see :meth:`enable_profiling`
+        tracer (Tracer): Optional; Records the lifecycle of sampled datagrams and the
+            event loop lag, see :meth:`enable_tracing`
+        matchmaker (Tuple[str, int]): The host and port passed to :meth:`connect`,
+            redirects and reconnects don't change it
         host (str): current host
         port (int): current port
         lobby_code (str): current lobby_code
@@ -76,17 +133,19 @@ class Connection:
             Client returns this or raises this if it is an exception
     """
 
-    socket = None
+    transport: asyncio.DatagramTransport = None
     closed: bool = False
     connectTimeout: int = 1000
     recvTimeout: int = 5000
     keepAliveTimeout: int = 1000
+    resendTimeout: int = 1000
+    resendLimit: int = 0
     name: str = None
-    color: PlayerAttributes.Color
-    hat: PlayerAttributes.Hat
-    skin: PlayerAttributes.Skin
-    pet: PlayerAttributes.Pet
-    spectator: bool
+    color: PlayerAttributes.Color = 0
+    hat: PlayerAttributes.Hat = 0
+    skin: PlayerAttributes.Skin = 0
+    pet: PlayerAttributes.Pet = 0
+    spectator: bool = False
     host: str = None
     gameVersion: tuple = None
     port: int = None
@@ -100,19 +159,55 @@ class Connection:
     game: Game
     eventbus: EventBus
     queue: PacketQueue
+    timer_wheel: TimerWheel = None
+    # shared by all connections unless replaced on an instance
+    redirect_cache: TTLCache = TTLCache(300, maxsize=4096)
+    redirectLimit: int = 3
+    queueLength: int = 32
+    auto_rejoin: bool = False
+    resumeAttempts: int = 5
+    resumeBackoff: int = 250
+    resumeBackoffMax: int = 8000
+    matchmaker: Tuple[str, int] = None
+    capture: CaptureWriter = None
+    metrics: Metrics = None
+    profiler: Profiler = None
+    tracer: Tracer = None
     players: PlayerList
     latency: int = float("inf")
     _sequence_ids: Dict[Player, int]
+    _resend_handles: Dict[int, asyncio.TimerHandle]
     _id: int = 1
-    _ready: asyncio.Event = asyncio.Event()
+    _loop: asyncio.AbstractEventLoop = None
+    _debug: bool = False
+    _ready: asyncio.Event = None
+    _closed: asyncio.Event = None
     _reader_task: asyncio.Task = None
-    _pinger_task: asyncio.Task = None
-    _ack_packets: Dict[int, Packet] = {}
+    _inbound: Deque[bytes]
+    _pinger_handle: asyncio.TimerHandle = None
+    _idle_handle: asyncio.TimerHandle = None
+    _last_recv: float = 0.0
+    _ack_packets: Dict[int, Packet]
     _player_amount: int = 0
+    _joining: bool = False
+    # set for reconnects which are not a new connection for the listeners
+    _silent: bool = False
+    # a failed connect keeps the connection open, another server is tried next
+    _fallback: bool = False
+    _resuming: bool = False
+    _rejoining: bool = False
     _spectator_reconnected: bool = False
     _has_player_data: bool = False
-
-    def __init__(self, eventbus: EventBus):
+    # the clients whose PlayerControl spawn is still expected after a rejoin or
+    # resume, the future is resolved once all of them were spawned
+    _expected_spawns: Set[int] = None
+    _reconciled: asyncio.Future = None
+    # content hashes of the spawn data of the current lobby
+    _spawn_hashes: Set[int]
+    # the handler of every tag type, see on_packet
+    _handlers: Dict[type, Callable[[Packet], Awaitable[bool]]]
+
+    def __init__(self, eventbus: EventBus, timer_wheel: TimerWheel = None):
         """
         Init the connection with an eventbus for dispatching events, a message queue,
         a player list to handle the players and an empty Game object
@@ -120,11 +215,26 @@ class Connection:
         Args:
             eventbus (EventBus): The eventbus of the client, to be able to listen for
                 events from the client/dispatching them directly here in this class
+            timer_wheel (TimerWheel): Optional; a timer wheel shared with other
+                connections which will be used instead of per connection loop timers
         """
         self.eventbus = eventbus
-        self.queue = PacketQueue()
+        self.timer_wheel = timer_wheel
+        self._ack_packets = {}
+        self._spawn_hashes = set()
+        self._resend_handles = {}
+        self._inbound = collections.deque()
+        self.queue = PacketQueue(self.queueLength, timer_wheel=timer_wheel)
         self.players = PlayerList()
         self.game = Game()
+        self._handlers = {
+            PacketType: self.on_base_packet,
+            MatchMakingTag: self.on_matchmaking_packet,
+            GameDataTag: self.on_gamedata_packet,
+            RPCTag: self.on_rpc_packet,
+            SpawnTag: self.on_spawn_packet,
+            DataFlag: self.on_dataflag_packet,
+        }
 
     @property
     def reliable_id(self) -> int:
@@ -136,14 +246,21 @@ class Connection:
     @property
     def ready(self) -> bool:
         """If we received a message from the server yet"""
-        return self._ready.is_set()
+        return self._ready is not None and self._ready.is_set()
 
     @property
     def player(self) -> Player:
         """The current player (/ourselves)"""
         return self.players.from_client_id(self.client_id)
 
-    async def connect(self, name: str, host: str, port: int = 22023, gameVersion: tuple = None) -> None:
+    async def connect(
+        self,
+        name: str,
+        host: str,
+        port: int = 22023,
+        gameVersion: tuple = None,
+        reset: bool = True,
+    ) -> None:
         """
         Connects to the given server via UDP and starts listening for data on success
 
@@ -152,23 +269,35 @@ class Connection:
             host (str): Host/address of the server to connect to
             port (int): Port of the server to connect to, defaults to 22023
             gameVersion (tuple): The version of the game running on the server
+            reset (bool): Forget the known net ids and movement sequence ids,
+                only :meth:`resume` keeps them
 
         Raises:
             Exception: Something went wrong, never happened while testing
         """
-        self._sequence_ids = {}
-        self.net_ids = dotdict({})
+        if reset:
+            self._sequence_ids = {}
+            self.net_ids = dotdict({})
         self.host, self.port, self.name, self.gameVersion = host, port, name, gameVersion
+        self.matchmaker = (host, port)
+        self._bind_loop()
+        self._closed.clear()
+        if self.tracer is not None:
+            # stopped when the connection was closed
+            self.tracer.start()
         try:
-            self.socket = await asyncio.wait_for(
-                asyncio_dgram.connect((host, port)), timeout=self.connectTimeout / 1000
+            self.transport, _ = await asyncio.wait_for(
+                self._loop.create_datagram_endpoint(
+                    lambda: ConnectionProtocol(self), remote_addr=(host, port)
+                ),
+                timeout=self.connectTimeout / 1000,
             )
         except asyncio.TimeoutError:
             logging.debug("Timeout when connecting to the server...")
             self.result = ConnectionException(
                 f"Timeout connecting to {host}:{port}", DisconnectReason.Timeout
             )
-            await self.disconnect(True)
+            await self.disconnect(True, reconnect=self._resuming or self._fallback)
         except Exception as e:
             logger.exception(e)
             raise
@@ -178,7 +307,6 @@ class Connection:
                 HelloPacket.create(gameVersion=gameVersion, name=self.name)
             )
             self.closed = False
-            self._reader_task = asyncio.create_task(self._reader())
             try:
                 await asyncio.wait_for(
                     self.wait_until_ready(), timeout=self.recvTimeout / 1000
@@ -187,7 +315,7 @@ class Connection:
                 self.result = ConnectionException(
                     "Timed out waiting for messages", DisconnectReason.Timeout
                 )
-                await self.disconnect(True)
+                await self.disconnect(True, reconnect=self._resuming or self._fallback)
 
     async def disconnect(self, force: bool, reconnect: bool = False) -> None:
         """
@@ -205,19 +333,35 @@ class Connection:
             logger.debug("Not disconnecting, we're already closed!")
             return
 
-        if not force and self._ready.is_set():
+        if not force and self.ready:
             logger.debug("Sending disconnect packet as were still connected")
             await self.send(DisconnectPacket.create())
         self.closed = not reconnect
+        if self.closed and self._closed is not None:
+            self._closed.set()
         self.queue.clear()
-        if self._reader_task is not None:
-            self._reader_task.cancel()
-        if self._pinger_task is not None:
-            self._pinger_task.cancel()
-        self._ready.clear()
-        self.socket.close()
+        # the reader task is not cancelled as we might be running inside of it,
+        # it stops on its own once there is no more data
+        self._inbound.clear()
+        self._stop_timers()
+        if self._ready is not None:
+            self._ready.clear()
+        if self.transport is not None:
+            self.transport.close()
+        if self.closed:
+            self.stop_recording()
+            if self.tracer is not None:
+                self.tracer.stop()
+        elif self.capture is not None:
+            self.capture.flush()
 
-    async def reconnect(self, host: str = None, port: int = None, gameVersion: tuple = None) -> None:
+    async def reconnect(
+        self,
+        host: str = None,
+        port: int = None,
+        gameVersion: tuple = None,
+        reset: bool = True,
+    ) -> None:
         """
         Disconnects and reconnects to the server because it sometimes doesn't send
         anything/doesn't answer in the first place
@@ -229,6 +373,7 @@ class Connection:
             host (str): Optional; The new host to connect to
             port (int): Optional; The new port to connect to
             gameVersion (tuple): Optional: The version of the game running on the server
+            reset (bool): Optional; See :meth:`connect`
         """
         logger.debug("Reconnecting...")
         await self.disconnect(False, reconnect=True)
@@ -236,11 +381,231 @@ class Connection:
         port = port if port is not None else self.port
         gameVersion = gameVersion if gameVersion is not None else self.gameVersion
         logger.debug("Disconnected, now reconnecting...")
-        await self.connect(self.name, host, port, gameVersion)
+        matchmaker = self.matchmaker
+        await self.connect(self.name, host, port, gameVersion, reset=reset)
+        self.matchmaker = matchmaker
+
+    async def resume(self) -> bool:
+        """
+        Reconnects after the connection was lost and rejoins the lobby
+
+        The players, net ids and settings are kept and only updated by the spawn
+        data of the rejoin, players which left in the meantime are removed with a
+        `player_leave` event. Failed attempts are retried after an exponential
+        backoff with jitter (see :attr:`resumeBackoff`). Instead of `ready` and
+        `game_join` a single `resumed` event is dispatched on success, after the
+        spawns of all players were applied
+
+        Returns:
+            True if resumed, otherwise the connection is closed with the
+            reason in :attr:`result`
+        """
+        if self._resuming:
+            return False
+        lobby_code = self.lobby_code if self.game_id is not None else None
+        self._resuming = self._silent = True
+        try:
+            for attempt in range(self.resumeAttempts):
+                if attempt:
+                    delay = min(
+                        self.resumeBackoffMax, self.resumeBackoff * 2 ** (attempt - 1)
+                    )
+                    await asyncio.sleep(random.uniform(delay / 2, delay) / 1000)
+                if self.closed:
+                    # stopped in the meantime
+                    return False
+                logger.info(f"Resuming, attempt {attempt + 1}/{self.resumeAttempts}")
+                await self.reconnect(reset=False)
+                if not self.ready:
+                    continue
+                if lobby_code is not None:
+                    self._reconciled = self._loop.create_future()
+                    try:
+                        await asyncio.wait_for(
+                            self.join_game(lobby_code), self.recvTimeout / 1000
+                        )
+                    except asyncio.TimeoutError:
+                        continue
+                    except ConnectionException as e:
+                        # the lobby is gone, there is nothing to resume
+                        self.result = e
+                        break
+                    try:
+                        await asyncio.wait_for(
+                            asyncio.shield(self._reconciled), self.recvTimeout / 1000
+                        )
+                    except asyncio.TimeoutError:
+                        logger.warning("Resumed without the spawns of every player")
+                        self._expected_spawns = None
+                self._resuming = self._silent = False
+                # failed attempts left their reason, the client would stop with it
+                self.result = None
+                self.eventbus.dispatch("resumed")
+                return True
+            else:
+                logger.warning("Could not resume the connection")
+        finally:
+            self._resuming = self._silent = False
+            self._expected_spawns = self._reconciled = None
+        await self.disconnect(True)
+        return False
+
+    def record(self, path: str) -> CaptureWriter:
+        """
+        Starts recording every datagram into a capture file, see :mod:`amongus.capture`
+
+        Reconnects and redirects are recorded into the same file, the recording is
+        stopped when the connection is closed. A running recording is stopped first
+
+        Args:
+            path (str): The capture file, new records are appended to it
+
+        Returns:
+            The writer, also available as :attr:`capture`
+        """
+        self.stop_recording()
+        self.capture = CaptureWriter(path)
+        return self.capture
+
+    def stop_recording(self) -> None:
+        """Stops the recording started with :meth:`record` and closes the file"""
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+
+    def enable_metrics(self, metrics: Metrics = None) -> Metrics:
+        """
+        Starts recording runtime metrics, see :mod:`amongus.metrics`
+
+        The metrics of the event bus (dispatched events and listener times) are
+        recorded into the same registry
+
+        Args:
+            metrics (Metrics): Optional; A registry to record into, e.g. one shared by
+                many connections. A new one is created by default
+
+        Returns:
+            The registry, also available as :attr:`metrics`
+        """
+        self.disable_metrics()
+        self.metrics = Metrics() if metrics is None else metrics
+        self.eventbus.metrics = self.metrics
+        self.metrics.add_gauge("inbound_queue_depth", self, lambda c: len(c._inbound))
+        self.metrics.add_gauge("unacked_packets", self, lambda c: len(c._ack_packets))
+        self.metrics.add_gauge(
+            "outbound_buffer_bytes",
+            self,
+            lambda c: c.transport.get_write_buffer_size() if c.transport else 0,
+        )
+        return self.metrics
+
+    def disable_metrics(self) -> None:
+        """Stops recording the metrics started with :meth:`enable_metrics`"""
+        if self.metrics is not None:
+            self.metrics.remove_gauges(self)
+            if self.eventbus.metrics is self.metrics:
+                self.eventbus.metrics = None
+            self.metrics = None
+
+    def enable_profiling(self, threshold: float = 0.05) -> Profiler:
+        """
+        Starts timing every packet handler by tag and every event listener by event
+        and function, see :class:`Profiler`
+
+        Calls slower than the threshold are logged and dispatched as a
+        ``slow_handler`` event
+
+        Args:
+            threshold (float): Optional; Seconds after which a call is slow, None to
+                not report slow calls, default is 50ms
+
+        Returns:
+            The profiler, also available as :attr:`profiler`
+        """
+        self.disable_profiling()
+        self.profiler = Profiler(threshold, self.eventbus)
+        self.eventbus.profiler = self.profiler
+        return self.profiler
+
+    def disable_profiling(self) -> None:
+        """Stops the profiling started with :meth:`enable_profiling`"""
+        if self.profiler is not None:
+            if self.eventbus.profiler is self.profiler:
+                self.eventbus.profiler = None
+            self.profiler = None
+
+    def enable_tracing(
+        self,
+        sample_rate: float = 0.01,
+        capacity: int = 1024,
+        lag_interval: float = 0.1,
+    ) -> Tracer:
+        """
+        Starts tracing the lifecycle of sampled received datagrams and measuring the
+        event loop lag, see :mod:`amongus.tracing`
+
+        The lag monitor starts right away if the event loop is running, otherwise
+        when connecting. With metrics enabled, the lag is recorded as
+        ``loop_lag_seconds`` as well
+
+        Args:
+            sample_rate (float): Optional; The share of datagrams traced, 0 to 1,
+                default is 1 in 100
+            capacity (int): Optional; The amount of traces and lag measurements kept
+            lag_interval (float): Optional; Seconds between two loop lag
+                measurements, None to not measure the lag
+
+        Returns:
+            The tracer, also available as :attr:`tracer`
+        """
+        self.disable_tracing()
+        self.tracer = Tracer(sample_rate, capacity, lag_interval, self.metrics)
+        self.eventbus.tracer = self.tracer
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            self.tracer.start()
+        return self.tracer
+
+    def disable_tracing(self) -> None:
+        """Stops the tracing started with :meth:`enable_tracing`"""
+        if self.tracer is not None:
+            self.tracer.stop()
+            if self.eventbus.tracer is self.tracer:
+                self.eventbus.tracer = None
+            self.tracer = None
 
     async def wait_until_ready(self):
+        self._bind_loop()
         await self._ready.wait()
 
+    async def wait_closed(self):
+        """Waits until the connection is closed for good (not by a reconnect)"""
+        self._bind_loop()
+        if not self.closed:
+            await self._closed.wait()
+
+    def _bind_loop(self) -> None:
+        """
+        Creates the loop bound primitives for the running event loop
+
+        This is done per instance when connecting instead of at import time, so the
+        connection works with any event loop implementation (e.g. uvloop). They are
+        only recreated when the loop changed, so waiters survive reconnects
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._debug = loop.get_debug()
+        self._ready = asyncio.Event()
+        self._closed = asyncio.Event()
+        self.eventbus.debug = self._debug
+        if self.tracer is not None:
+            self.tracer.start()
+
     async def send(self, packet: Packet) -> None:
         """
         Serializes and sends a packet
@@ -251,29 +616,77 @@ class Connection:
         # we pass a lambda which returns the id because we dont know if the packet
         # needs the reliable id, so if it needs it and it gets called we increase the
         # id, else it just stays the same
-        if packet.reliable:
+        # acknowledgements don't get a reliable id and are never acknowledged
+        acked = packet.reliable and packet.tag != PacketType.Acknowledgement
+        if acked:
 
             async def _on_ack():
-                self.latency = int(round((time.perf_counter() - _time_before) * 1000))
+                rtt = time.perf_counter() - _time_before
+                self.latency = int(round(rtt * 1000))
                 if self.latency <= 0:
                     self.latency = 1
+                if self.metrics is not None:
+                    self.metrics.observe("ack_rtt_seconds", rtt)
 
             packet.add_callback(_on_ack)
             _time_before = time.perf_counter()
-        await self._send(packet.serialize(lambda: self.reliable_id))
-        if packet.reliable:
-            self._ack_packets[self._id - 1] = packet
-        if packet.reliable and packet.tag not in [
-            PacketType.Ping,
-            PacketType.Acknowledgement,
-        ]:
-            await self._start_pinging(restart=True)
+        # pings are created with their id, which might not be the last one anymore
+        reliable_id = packet.values.reliable_id
+
+        def _get_id() -> int:
+            nonlocal reliable_id
+            reliable_id = self.reliable_id
+            return reliable_id
+
+        payload = packet.serialize(_get_id)
+        self._send(payload)
+        if acked:
+            self._ack_packets[reliable_id] = packet
+        if acked and packet.tag != PacketType.Ping:
+            if self.resendLimit > 0:
+                self._schedule_resend(reliable_id, payload, 1)
+            self._start_pinging(restart=True)
             # restart pinger as a reliable packet counts as a ping too?
 
+    async def ping(self, timeout: float = None) -> float:
+        """
+        Sends a Ping packet and waits for its acknowledgement
+
+        Args:
+            timeout (float): Optional; Seconds to wait for the acknowledgement
+
+        Returns:
+            The round trip time in ms
+
+        Raises:
+            asyncio.TimeoutError: No acknowledgement after timeout seconds
+        """
+        answered = self._loop.create_future()
+        packet = PingPacket.create(self.reliable_id)
+        start = time.perf_counter()
+        await self.send(packet)
+        on_ack = packet.callback
+
+        async def _on_ack():
+            await on_ack()
+            if not answered.done():
+                answered.set_result((time.perf_counter() - start) * 1000)
+
+        packet.callback = _on_ack
+        try:
+            return await asyncio.wait_for(answered, timeout)
+        finally:
+            self._ack_packets.pop(packet.values.reliable_id, None)
+
     async def join_game(self, lobby_code: str) -> bool:
         """
         Sends a join game request to the server and returns True on success
 
+        Redirects to the game server are followed here without dispatching ready
+        again and are remembered in :attr:`redirect_cache`, so the next join of the
+        same lobby connects to the game server directly. If that server doesn't
+        answer or know the lobby anymore, the matchmaker is asked again
+
         Args:
             lobby_code (str): The code for the game lobby
 
@@ -283,21 +696,132 @@ class Connection:
         self.lobby_code = lobby_code
         logger.debug(f"Joining game '{lobby_code}'")
         await self.wait_until_ready()
-        await self.send(ReliablePacket.create([JoinGamePacket.create(lobby_code)]))
+        key = (self.matchmaker, lobby_code)
+        target = self.redirect_cache.get(key)
+        from_cache = target is not None and target != (self.host, self.port)
+        if from_cache:
+            logger.debug(f"Using cached redirect to {target[0]}:{target[1]}")
+            try:
+                await self._redirect(*target, fallback=True)
+            except ConnectionException as e:
+                # the game server moved or is down, ask the matchmaker again
+                logger.info(f"Cached redirect failed ({e}), asking the matchmaker")
+                self.redirect_cache.invalidate(key)
+                from_cache = False
+                await self._redirect(*self.matchmaker)
+                self.result = None
+
+        self._joining = True
+        try:
+            for _ in range(self.redirectLimit + 1):
+                await self.send(
+                    ReliablePacket.create([JoinGamePacket.create(lobby_code)])
+                )
+                result = await self.queue.wait_for(
+                    lambda p: type(p.tag) == MatchMakingTag
+                    and p.tag
+                    in [
+                        MatchMakingTag.JoinedGame,
+                        MatchMakingTag.JoinGame,
+                        MatchMakingTag.Redirect,
+                    ]
+                )
 
-        result = await self.queue.wait_for(
-            lambda p: type(p.tag) == MatchMakingTag
-            and p.tag in [MatchMakingTag.JoinedGame, MatchMakingTag.JoinGame]
+                if result.tag == MatchMakingTag.Redirect:
+                    target = (result.values.host, result.values.port)
+                    self.redirect_cache.set(key, target)
+                    await self._redirect(*target)
+                elif result.tag == MatchMakingTag.JoinGame:
+                    reason = DisconnectReason(result.values.reason)
+                    if reason == DisconnectReason.GameNotFound:
+                        self.redirect_cache.invalidate(key)
+                        if from_cache:
+                            # the game moved or ended, ask the matchmaker again
+                            from_cache = False
+                            await self._redirect(*self.matchmaker)
+                            continue
+                    raise ConnectionException(
+                        "Joining game failed!",
+                        reason=reason,
+                        custom_reason=result.values.custom_reason,
+                    )
+                elif result.tag == MatchMakingTag.JoinedGame:
+                    return True
+            raise ConnectionException("Too many redirects!", DisconnectReason.Error)
+        finally:
+            self._joining = False
+
+    async def _rejoin(self) -> None:
+        """Joins the lobby again after the game ended, see :attr:`auto_rejoin`"""
+        try:
+            await self.join_game(self.lobby_code)
+        except ConnectionException as e:
+            logger.warning(f"Rejoining '{self.lobby_code}' failed: {e}")
+            self._rejoining = False
+            self.eventbus.dispatch("rejoin_failed", e)
+
+    async def _redirect(self, host: str, port: int, fallback: bool = False) -> None:
+        """
+        Reconnects to another server without dispatching ready again
+
+        Args:
+            host (str): The host of the server
+            port (int): The port of the server
+            fallback (bool): Optional; Don't close the connection if the server
+                can't be reached, so another one can be tried
+
+        Raises:
+            ConnectionException: The server could not be reached
+        """
+        silent, self._silent = self._silent, True
+        self._fallback = fallback
+        try:
+            # resume and the spectator rejoin keep their state across the redirect
+            await self.reconnect(host, port, reset=not silent)
+        finally:
+            self._silent = silent
+            self._fallback = False
+        if self.closed or not self.ready:
+            raise self.result
+
+    def _snapshot(self) -> tuple:
+        """Returns the decoded lobby state, see :meth:`_restore`"""
+        return (
+            self.players,
+            dict(self.net_ids),
+            self.game,
+            self.host_id,
+            self._player_amount,
         )
 
-        if result.tag == MatchMakingTag.JoinGame:
-            raise ConnectionException(
-                "Joining game failed!",
-                reason=DisconnectReason(result.values.reason),
-                custom_reason=result.values.custom_reason,
-            )
-        elif result.tag == MatchMakingTag.JoinedGame:
-            return True
+    def _restore(self, snapshot: tuple) -> None:
+        """Restores the lobby state of :meth:`_snapshot` after a reconnect"""
+        players, net_ids, self.game, self.host_id, self._player_amount = snapshot
+        self.players = players
+        self.net_ids = dotdict(net_ids)
+
+    async def _spectator_rejoin(self) -> None:
+        """
+        Reconnects and joins the lobby again without requesting the spawn data
+
+        The players, net ids and settings decoded during the first join are
+        restored instead, so the listeners keep their objects and spawn data the
+        server sends again is skipped (see :meth:`on_packet`). Neither ready nor
+        game_join are dispatched again
+        """
+        snapshot = self._snapshot()
+        self._silent = True
+        try:
+            await self.reconnect()
+            if self.closed:
+                return
+            self._restore(snapshot)
+            self._spectator_reconnected = True
+            await self.join_game(self.lobby_code)
+        except ConnectionException as e:
+            logger.warning(f"Rejoining '{self.lobby_code}' as spectator failed: {e}")
+        finally:
+            self._silent = False
 
     async def send_chat(self, message: str) -> None:
         """
@@ -331,6 +855,7 @@ class Connection:
         mapId: GameSettings.SearchMap,
         impostors: int,
         language: GameSettings.Keywords,
+        timeout: float = None,
     ) -> GameList:
         """
         Finds public games matching the passed properties
@@ -339,6 +864,33 @@ class Connection:
             mapId (GameSettings.Map): The map
             impostors (int): The amount of impostors
             language (GameSettings.Keywords): The language of the chat
+            timeout (float): Optional; Seconds to wait for the answer
+
+        Raises:
+            asyncio.TimeoutError: No answer after timeout seconds
+        """
+        result = await self.request_game_list(mapId, impostors, language, timeout)
+        for game in result.games:
+
+            async def _join_func(game=game):
+                await self.join_game(game.readable_code)
+
+            game.join = _join_func
+        return result
+
+    async def request_game_list(
+        self,
+        mapId: GameSettings.SearchMap,
+        impostors: int,
+        language: GameSettings.Keywords,
+        timeout: float = None,
+    ) -> GameList:
+        """
+        Like :meth:`find_games` but the games are not bound to this connection, so
+        they can't be joined through it
+
+        Only one request should be pending per connection at a time, as the answers
+        can't be told apart
         """
         logger.debug(
             f"Finding games... Criteria: mapId={repr(mapId)}, impostors={impostors}, "
@@ -356,15 +908,13 @@ class Connection:
 
         result = await self.queue.wait_for(
             lambda p: type(p.tag) == MatchMakingTag
-            and p.tag == MatchMakingTag.GetGameListV2
+            and p.tag == MatchMakingTag.GetGameListV2,
+            timeout=timeout,
         )
-
         for game in result.values.games:
-
-            async def _join_func():
-                await self.join_game(game.readable_code)
-
-            game.join = _join_func
+            game.region = self.region
+            if language != GameSettings.Keywords.All:
+                game.keywords = language
         return GameList(
             games=result.values.games,
             skeld_count=result.values.skeld_count,
@@ -429,6 +979,9 @@ class Connection:
         """
         if not self.ready:
             return
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.inc("packets_received_total", type(packet.tag), packet.tag)
 
         if isinstance(packet, (ReliablePacket, UnreliablePacket)):
             for p in packet:
@@ -439,6 +992,13 @@ class Connection:
                 await self.on_packet(p)
             return
         elif type(packet) == SpawnPacket:
+            if self.spectator:
+                key = hash(packet.data)
+                if self._spectator_reconnected and key in self._spawn_hashes:
+                    logger.debug("Skipping known spawn data")
+                    return
+                self._spawn_hashes.add(key)
+            packet.parse_spawn()
             for p in packet:
                 await self.on_packet(p)
             return
@@ -463,16 +1023,25 @@ class Connection:
 
         await self.queue.put(packet)
 
-        handlers = {
-            PacketType: self.on_base_packet,
-            MatchMakingTag: self.on_matchmaking_packet,
-            GameDataTag: self.on_gamedata_packet,
-            RPCTag: self.on_rpc_packet,
-            SpawnTag: self.on_spawn_packet,
-            DataFlag: self.on_dataflag_packet,
-        }
-
-        if not await handlers[type(packet.tag)](packet):
+        handler = self._handlers[type(packet.tag)]
+        profiler = self.profiler
+        trace = current_trace.get() if self.tracer is not None else None
+        if metrics is None and profiler is None and trace is None:
+            handled = await handler(packet)
+        else:
+            started = time.perf_counter()
+            handled = await handler(packet)
+            took = time.perf_counter() - started
+            if metrics is not None:
+                metrics.observe("handler_seconds", took, type(packet.tag))
+            if profiler is not None or trace is not None:
+                tag = packet.tag
+                name = f"{type(tag).__name__}.{getattr(tag, 'name', tag)}"
+                if profiler is not None:
+                    profiler.record("handler", name, took)
+                if trace is not None:
+                    trace.handlers.append((name, started, started + took))
+        if not handled:
             logger.warning(
                 f"Unhandled packet: {packet}. \nData: {formatHex(packet.data)}"
             )
@@ -492,6 +1061,9 @@ class Connection:
             except KeyError:
                 pass
             else:
+                handle = self._resend_handles.pop(packet.values.reliable_id, None)
+                if handle is not None:
+                    handle.cancel()
                 p.ack()
         elif packet.tag == PacketType.Ping:
             pass
@@ -503,22 +1075,44 @@ class Connection:
         if packet.tag == MatchMakingTag.ReselectServer:
             logger.debug("Received ReselectServer, ignoring...")
         elif packet.tag == MatchMakingTag.Redirect:
+            if self._joining:
+                # handled by join_game
+                return True
             logger.debug(
                 f"Received Redirect, now connecting to {packet.values.host}:"
                 f"{packet.values.port}"
             )
+            self.redirect_cache.set(
+                (self.matchmaker, self.lobby_code),
+                (packet.values.host, packet.values.port),
+            )
             await self.reconnect(packet.values.host, packet.values.port)
         elif packet.tag == MatchMakingTag.JoinedGame:
             logger.info(f"Successfully joined game '{self.lobby_code}'!")
-            self.eventbus.dispatch("game_join", self.lobby_code)
+            if self._rejoining:
+                # not before, the game_end listeners might still need it
+                for player in self.players:
+                    player.reset_game_state()
+            if self._resuming or self._rejoining:
+                self._reconcile_players(packet.values.player_ids, self.client_id)
+            if not self._silent:
+                self._spawn_hashes.clear()
+                self.eventbus.dispatch("game_join", self.lobby_code)
             self.game_id = packet.values.game_id
             self.game.code = self.game_id
             self.client_id = packet.values.client_id
             self.host_id = packet.values.host_id
 
-            if not self.spectator or not (
+            request_spawns = not self.spectator or not (
                 self._spectator_reconnected or self._has_player_data
-            ):
+            )
+            if self._resuming or self._rejoining:
+                if request_spawns:
+                    # the rejoin ends once every client in the lobby was spawned
+                    self._expected_spawns = {*packet.values.player_ids, self.client_id}
+                else:
+                    self._end_reconcile()
+            if request_spawns:
                 logger.debug("Sending a SceneChange to get more data")
                 await self.send(
                     ReliablePacket.create(
@@ -561,10 +1155,17 @@ class Connection:
                 # when the game ends we just need to send JoinGame again. Let the end
                 # user decide if the client should reconnect to the lobby
                 self.eventbus.dispatch("game_end", self.game, packet.values.reason)
+                if self.auto_rejoin:
+                    self._rejoining = True
+                    # join_game waits for packets of this reader, so it can't be
+                    # awaited here
+                    asyncio.ensure_future(self._rejoin())
             else:
                 logger.warning("Received game end for the wrong game?")
         elif packet.tag == MatchMakingTag.RemovePlayer:
             if packet.values.game_id == self.game_id:
+                if self._expected_spawns is not None:
+                    self._spawned(packet.values.player_id)
                 player = self.players[packet.values.player_id]
                 if player is not None:
                     self.players.remove(player)
@@ -579,6 +1180,36 @@ class Connection:
             return False
         return True
 
+    def _reconcile_players(self, client_ids: list, old_client_id: int) -> None:
+        """
+        Removes the players which left while we were disconnected
+
+        Args:
+            client_ids (list): The clients in the lobby according to JoinedGame
+            old_client_id (int): Our client id before the rejoin
+        """
+        client_ids = set(client_ids)
+        for player in list(self.players):
+            if player.client_id is None or player.client_id in client_ids:
+                continue
+            self.players.remove(player)
+            for net_id in player.net_ids.values():
+                self.net_ids.pop(net_id, None)
+            if player.client_id != old_client_id:
+                self.eventbus.dispatch("player_leave", player)
+
+    def _spawned(self, client_id: int) -> None:
+        """Ends the rejoin once no more spawns are expected, see on_spawn_packet"""
+        self._expected_spawns.discard(client_id)
+        if not self._expected_spawns:
+            self._end_reconcile()
+
+    def _end_reconcile(self) -> None:
+        self._expected_spawns = None
+        self._rejoining = False
+        if self._reconciled is not None and not self._reconciled.done():
+            self._reconciled.set_result(True)
+
     async def on_gamedata_packet(self, packet: Union[GameDataPacket, GameDataToPacket]):
         if packet.tag == GameDataTag.DespawnFlag:
             logger.debug(f"Received despawn flag for {packet.values.net_id}")
@@ -626,29 +1257,16 @@ class Connection:
             RPCTag.SetColor,
             RPCTag.SetSkin,
         ]:
-            validators = {
-                "name": lambda n: n is not None,
-                "color": PlayerAttributes.Color.has_value,
-                "hat": PlayerAttributes.Hat.has_value,
-                "pet": PlayerAttributes.Pet.has_value,
-                "skin": PlayerAttributes.Skin.has_value,
-            }
-            converters = {
-                "color": PlayerAttributes.Color,
-                "hat": PlayerAttributes.Hat,
-                "pet": PlayerAttributes.Pet,
-                "skin": PlayerAttributes.Skin,
-            }
             # as these packets only have one value either way we just use that
             cosmetic = list(packet.values)[0]
             value = packet.values[cosmetic]
             logger.debug(f"Received Set{cosmetic}")
 
-            if value is not None and validators[cosmetic](value):
+            if value is not None and COSMETIC_VALIDATORS[cosmetic](value):
                 # valid
-                if cosmetic in converters.keys():
+                if cosmetic in COSMETIC_CONVERTERS:
                     # convert to enum
-                    value = converters[cosmetic](value)
+                    value = COSMETIC_CONVERTERS[cosmetic](value)
 
                 if packet.parent.values.net_id in self.player.net_ids.values():
                     # for us
@@ -735,16 +1353,14 @@ class Connection:
         if packet.tag == SpawnTag.GameData:
             logger.debug(f"Received player data! {packet}")
             self._player_amount = packet.values.num_players
-            self.players += packet.values.players
+            changed = self.players.merge(packet.values.players)
+            if self._resuming or self._rejoining:
+                for player in changed:
+                    self.eventbus.dispatch("player_update", player)
         elif packet.tag == SpawnTag.PlayerControl:
             logger.debug(f"Received PlayerControl data: {packet}")
             for key, net_id in packet.values.net_ids.items():
-                _translate = {
-                    "control": DataFlag.Control,
-                    "physics": DataFlag.Physics,
-                    "network": DataFlag.Network,
-                }
-                self.net_ids[net_id] = _translate[key]
+                self.net_ids[net_id] = NET_ID_FLAGS[key]
 
             player = self.players[packet.values.player_id]
             if player is None:
@@ -757,20 +1373,19 @@ class Connection:
             if player.client_id == self.host_id:
                 player.host = True
 
-            if self.players.complete():
+            if self._expected_spawns is not None:
+                # the changes were dispatched with the player data
+                self._spawned(player.client_id)
+            elif self.players.complete():
                 self.eventbus.dispatch("players_update", list(self.players))
 
             if self.player is not None and all(
                 n is not None for n in self.player.net_ids.values()
             ):
                 if self.spectator:
-                    if (
-                        not (self._has_player_data and self._spectator_reconnected)
-                        and self.players.complete()
-                    ):
+                    if not self._has_player_data and self.players.complete():
                         self._has_player_data = True
-                        await self.reconnect()
-                        self._spectator_reconnected = True
+                        asyncio.ensure_future(self._spectator_rejoin())
                 else:
                     await self.send(
                         ReliablePacket.create(
@@ -866,52 +1481,153 @@ class Connection:
             )
         )
 
-    async def _start_pinging(self, restart: bool = True) -> None:
+    def _call_later(self, delay: int, callback: callable, *args):
         """
-        Manages the _pinger, this method will start or restart it
+        Schedules a callback on the shared timer wheel if there is one, otherwise on
+        the event loop
 
         Args:
-            restart (bool): If the current task should be cancelled before starting a
+            delay (int): The delay in ms
+            callback (callable): A normal function which gets called after the delay
+
+        Returns:
+            A handle which can be cancelled
+        """
+        if self.timer_wheel is not None:
+            return self.timer_wheel.call_later(delay / 1000, callback, *args)
+        return self._loop.call_later(delay / 1000, callback, *args)
+
+    def _stop_timers(self) -> None:
+        """Cancels the keepalive, receive timeout and resend timers"""
+        if self._pinger_handle is not None:
+            self._pinger_handle.cancel()
+            self._pinger_handle = None
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        for handle in self._resend_handles.values():
+            handle.cancel()
+        self._resend_handles.clear()
+
+    def _start_pinging(self, restart: bool = True) -> None:
+        """
+        Manages the keepalive timer, this method will start or restart it
+
+        Args:
+            restart (bool): If the current timer should be cancelled before starting a
                 new one
         """
         if not self.ready:
             return
-        if restart:
-            self._pinger_task.cancel()
-        self._pinger_task = asyncio.create_task(self._pinger())
+        if restart and self._pinger_handle is not None:
+            self._pinger_handle.cancel()
+        self._pinger_handle = self._call_later(self.keepAliveTimeout, self._pinger)
 
-    async def _pinger(self) -> None:
-        """Periodically sends Ping packets"""
-        while not self.closed:
-            await asyncio.sleep(self.keepAliveTimeout / 1000)
-            await self.send(PingPacket.create(self.reliable_id))
+    def _pinger(self) -> None:
+        """Sends a Ping packet and schedules the next one"""
+        self._pinger_handle = None
+        if self.closed:
+            return
+        # send() restarts the keepalive timer for every non ping packet, so this has
+        # to be done here
+        self._pinger_handle = self._call_later(self.keepAliveTimeout, self._pinger)
+        asyncio.ensure_future(self.send(PingPacket.create(self.reliable_id)))
+
+    def _schedule_resend(self, reliable_id: int, payload: bytes, attempt: int) -> None:
+        """Sets up the deadline after which the reliable packet is sent again"""
+        self._resend_handles[reliable_id] = self._call_later(
+            self.resendTimeout, self._resend, reliable_id, payload, attempt
+        )
 
-    async def _send(self, payload: bytes) -> None:
+    def _resend(self, reliable_id: int, payload: bytes, attempt: int) -> None:
+        """Sends an unacknowledged reliable packet again"""
+        self._resend_handles.pop(reliable_id, None)
+        if self.closed or reliable_id not in self._ack_packets:
+            return
+        logger.debug(f"Resending packet {reliable_id} (attempt {attempt})")
+        if self.metrics is not None:
+            self.metrics.inc("resends_total")
+        self._send(payload)
+        if attempt < self.resendLimit:
+            self._schedule_resend(reliable_id, payload, attempt + 1)
+
+    def _on_idle(self) -> None:
         """
-        Sends the data to the server
+        Receive timeout watchdog, lets the Connection reconnect if nothing was
+        received within the recvTimeout
+        """
+        self._idle_handle = None
+        if self.closed:
+            return
+        idle = (self._loop.time() - self._last_recv) * 1000
+        if idle < self.recvTimeout:
+            self._idle_handle = self._call_later(self.recvTimeout - idle, self._on_idle)
+            return
+        logger.warning("Exceeded recvTimeout")
+        asyncio.ensure_future(self.resume())
+
+    def _send(self, payload: bytes) -> None:
+        """
+        Sends the data to the server, UDP sends don't block so this is not awaited
 
         Args:
             payload: bytes; the payload to send
         """
-        if asyncio.get_event_loop().get_debug():
+        if self._debug:
             logger.debug(f"Sending {len(payload)} bytes: {formatHex(payload)}")
-        await self.socket.send(payload)
-
-    async def _reader(self) -> None:
+        if self.capture is not None:
+            self.capture.write(Direction.Outbound, payload)
+        if self.metrics is not None:
+            self.metrics.inc("datagrams_sent_total")
+            self.metrics.inc("bytes_sent_total", value=len(payload))
+        self.transport.sendto(payload)
+
+    def _datagram_received(self, data: bytes) -> None:
         """
-        Reader loop which tries to receive bytes within the recvTimeout and lets the
-        Connection reconnect on failure
+        Called synchronously by the :class:`ConnectionProtocol` for every datagram
+
+        The datagram is put into the inbound buffer, which is drained by a single
+        reader task in order. The task only exists while there is data to process,
+        so a burst of datagrams only costs one task switch
+
+        Args:
+            data (bytes): The datagram which has been received
         """
-        while not self.closed:
-            try:
-                data, _ = await asyncio.wait_for(
-                    self.socket.recv(), timeout=self.recvTimeout / 1000
-                )
-                asyncio.ensure_future(self._on_data(data))
-            except asyncio.TimeoutError:
-                if not self.closed:
-                    logger.warning("Exceeded recvTimeout")
-                    await self.reconnect()
+        self._last_recv = self._loop.time()
+        if self.capture is not None:
+            self.capture.write(Direction.Inbound, data)
+        if self.metrics is not None:
+            self.metrics.inc("datagrams_received_total")
+            self.metrics.inc("bytes_received_total", value=len(data))
+        if self.tracer is not None:
+            data = self.tracer.sample(data)
+        self._set_ready()
+        self._inbound.append(data)
+        if self._reader_task is None:
+            self._reader_task = asyncio.ensure_future(self._reader())
+
+    async def _reader(self) -> None:
+        """Drains the inbound buffer and passes every datagram to :meth:`_on_data`"""
+        try:
+            while self._inbound:
+                try:
+                    await self._on_data(self._inbound.popleft())
+                except Exception as e:
+                    logger.exception(e)
+        finally:
+            self._reader_task = None
+
+    def _set_ready(self) -> None:
+        """Marks the connection as ready after the first received data"""
+        if not self._ready.is_set():
+            self._ready.set()
+            self._start_pinging(restart=False)
+            # the handshake has its own timeout in connect(), so the watchdog only
+            # runs once the server answered
+            if self._idle_handle is None:
+                self._idle_handle = self._call_later(self.recvTimeout, self._on_idle)
+            if not self._silent:
+                self.eventbus.dispatch("ready")
 
     async def _on_data(self, data: bytes) -> None:
         """
@@ -920,14 +1636,30 @@ class Connection:
         Args:
             data (bytes): The payload which has been received
         """
-        if asyncio.get_event_loop().get_debug():
+        if self._debug:
             logger.debug(f"Received {len(data)} bytes: {formatHex(data)}")
-        if not self._ready.is_set():
-            self._ready.set()
-            await self._start_pinging(restart=False)
-            self.eventbus.dispatch("ready")
-        packets = Packet.parse(data, first_call=True)
-        for packet in packets:
-            if packet.reliable and not isinstance(packet, AcknowledgePacket):
-                await self.acknowledge(packet.reliable_id)
-            await self.on_packet(packet)
+        self._set_ready()
+        trace = getattr(data, "trace", None) if self.tracer is not None else None
+        if trace is not None:
+            trace.started = time.perf_counter()
+            # the handlers and the listener tasks find the trace through the context
+            token = current_trace.set(trace)
+        try:
+            if self.metrics is None and trace is None:
+                packets = Packet.parse(data, first_call=True)
+            else:
+                started = time.perf_counter()
+                packets = Packet.parse(data, first_call=True)
+                parsed = time.perf_counter()
+                if self.metrics is not None:
+                    self.metrics.observe("parse_seconds", parsed - started)
+                if trace is not None:
+                    trace.parsed = parsed
+            for packet in packets:
+                if packet.reliable and not isinstance(packet, AcknowledgePacket):
+                    await self.acknowledge(packet.reliable_id)
+                await self.on_packet(packet)
+        finally:
+            if trace is not None:
+                trace.applied = time.perf_counter()
+                current_trace.reset(token)
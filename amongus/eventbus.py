@@ -2,25 +2,79 @@
 # -*- coding: utf-8 -*-
 import asyncio
 import logging
+import time
 from collections import defaultdict
 from typing import Dict, List
 
+from .tracing import current_trace
+
 logger = logging.getLogger(__name__)
 
 
 class EventBus:
-    listeners: Dict[str, List[callable]] = defaultdict(lambda: [])
+    listeners: Dict[str, List[callable]]
+    forwarders: List[callable]
+    # set by the Connection from the event loop's debug mode when connecting
+    debug: bool = False
+    # set by Connection.enable_metrics, counts events and times the listeners
+    metrics = None
+    # set by Connection.enable_profiling, times every listener by its function
+    profiler = None
+    # set by Connection.enable_tracing, adds the events and listeners to the trace
+    # of the datagram which dispatched them
+    tracer = None
+
+    def __init__(self):
+        self.listeners = defaultdict(list)
+        self.forwarders = []
 
     def add_listener(self, event: str, callback: callable):
         self.listeners[event].append(callback)
 
+    def add_forwarder(self, callback: callable):
+        """
+        Adds a callback which gets every dispatched event, e.g. to pass them on to
+        another process. It is called synchronously as `callback(event, args, kwargs)`
+        """
+        self.forwarders.append(callback)
+
     def remove_listener(self, callback: callable):
         for _, callbacks in self.listeners.items():
             if callback in callbacks:
-                callbacks.pop(callback)
+                callbacks.remove(callback)
 
     def dispatch(self, event: str, *args, **kwargs):
-        if asyncio.get_event_loop().get_debug():
+        if self.debug:
             logger.debug(f"Dispatching event (on_) '{event}'")
+        for forward in self.forwarders:
+            forward(event, args, kwargs)
+        if self.metrics is None and self.profiler is None and self.tracer is None:
+            for cb in self.listeners["on_" + event]:
+                asyncio.create_task(cb(*args, **kwargs))
+            return
+        if self.metrics is not None:
+            self.metrics.inc("events_total", event)
+        started = time.perf_counter()
+        trace = current_trace.get() if self.tracer is not None else None
+        if trace is not None:
+            trace.events.append((event, started))
         for cb in self.listeners["on_" + event]:
-            asyncio.create_task(cb(*args, **kwargs))
+            asyncio.create_task(
+                self._timed(event, started, cb, cb(*args, **kwargs), trace)
+            )
+
+    async def _timed(
+        self, event: str, started: float, callback: callable, coroutine, trace
+    ):
+        """Runs a listener for the metrics, the profiler and the tracer"""
+        try:
+            if self.profiler is not None:
+                return await self.profiler.listener(event, callback, coroutine)
+            return await coroutine
+        finally:
+            finished = time.perf_counter()
+            if self.metrics is not None:
+                self.metrics.observe("listener_seconds", finished - started, event)
+            if trace is not None:
+                name = getattr(callback, "__qualname__", repr(callback))
+                trace.listeners.append((event, name, started, finished))
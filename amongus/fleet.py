@@ -0,0 +1,517 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import asyncio
+import contextlib
+import enum
+import logging
+import multiprocessing
+import os
+import time
+from dataclasses import dataclass, field
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from .client import Client
+from .exceptions import ConnectionException
+from .game import Game
+from .player import Player
+from .pool import ClientPool
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BotSpec:
+    """
+    Everything a worker needs to create and start a bot
+
+    Attributes:
+        id (int): The id of the bot inside of the fleet
+        name (str): The name of the bot
+        lobby_code (str): Optional; The lobby the bot joins once it is ready
+        client_kwargs (dict): Passed to :class:`Client`
+        start_kwargs (dict): Passed to :meth:`Client.start`
+    """
+
+    id: int  # noqa: A003
+    name: str
+    lobby_code: str = None
+    client_kwargs: dict = field(default_factory=dict)
+    start_kwargs: dict = field(default_factory=dict)
+
+
+@dataclass
+class _WorkerState:
+    id: int  # noqa: A003
+    process: multiprocessing.Process = None
+    conn: Any = None
+    bots: Dict[int, BotSpec] = field(default_factory=dict)
+    restarts: int = 0
+    failed: bool = False
+
+
+def compact(value: Any) -> Any:
+    """
+    Converts event arguments into small picklable values for the IPC channel
+
+    Players are sent as `(id, name)`, games as their readable code and enums as
+    their int value. Everything else which is not a plain value is sent as `repr`
+    """
+    if value is None or isinstance(value, (bool, str, bytes, float)):
+        return value
+    if isinstance(value, enum.Enum):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, Player):
+        return getattr(value, "id", None), getattr(value, "name", None)
+    if isinstance(value, Game):
+        return value.readable_code
+    if isinstance(value, (list, tuple)):
+        return [compact(v) for v in value]
+    if isinstance(value, dict):
+        return {compact(k): compact(v) for k, v in value.items()}
+    return repr(value)
+
+
+class _Worker:
+    """Runs inside of the worker process, owns a :class:`ClientPool`"""
+
+    def __init__(self, worker_id: int, conn, handlers: list, forward: set):
+        self.id = worker_id
+        self.conn = conn
+        self.handlers = handlers
+        self.forward = forward
+        self.pool = ClientPool()
+        self.events = 0
+        self.finished = 0
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def send(self, *message) -> None:
+        # the supervisor is gone if this fails, we'll notice when reading
+        with contextlib.suppress(EOFError, OSError):
+            self.conn.send(message)
+
+    def add(self, spec: BotSpec) -> None:
+        client = Client(
+            spec.name, timer_wheel=self.pool.timer_wheel, **spec.client_kwargs
+        )
+        for name, func in self.handlers:
+            client.add_listener(name, self._bind(func, client))
+        if spec.lobby_code is not None:
+
+            async def _join_lobby():
+                try:
+                    await client.join_lobby(spec.lobby_code)
+                except ConnectionException as e:
+                    # not in a lobby, stop so _run_bot reports it
+                    client.connection.result = e
+                    await client.stop()
+
+            client.add_listener("ready", _join_lobby)
+        if self.forward:
+            client.eventbus.add_forwarder(self._forwarder(spec.id))
+        self._tasks[spec.id] = asyncio.ensure_future(self._run_bot(spec, client))
+
+    @staticmethod
+    def _bind(func: Callable, client: Client) -> Callable:
+        async def _handler(*args, **kwargs):
+            return await func(client, *args, **kwargs)
+
+        return _handler
+
+    def _forwarder(self, bot_id: int) -> Callable:
+        def _forward(event: str, args: tuple, kwargs: dict) -> None:
+            if "*" in self.forward or event in self.forward:
+                self.events += 1
+                self.send("e", bot_id, event, compact(args))
+
+        return _forward
+
+    async def _run_bot(self, spec: BotSpec, client: Client) -> None:
+        try:
+            result = await self.pool.start_client(client, **spec.start_kwargs)
+        except Exception as e:
+            result = e
+        self.finished += 1
+        self._tasks.pop(spec.id, None)
+        self.send("x", spec.id, compact(result))
+
+    def metrics(self) -> dict:
+        total, average, maximum = self.pool.memory_summary()
+        latencies = [c.latency for c in self.pool if c.latency != float("inf")]
+        return {
+            "pid": os.getpid(),
+            "bots": len(self._tasks),
+            "finished": self.finished,
+            "events": self.events,
+            "memory": total,
+            "memory_avg": average,
+            "memory_max": maximum,
+            "latency_avg": sum(latencies) / len(latencies) if latencies else None,
+            "time": time.time(),
+        }
+
+    async def _report(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.send("m", self.metrics())
+
+    async def run(self, specs: List[BotSpec], metrics_interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        for spec in specs:
+            self.add(spec)
+        reporter = asyncio.ensure_future(self._report(metrics_interval))
+        try:
+            while True:
+                try:
+                    message = await loop.run_in_executor(None, self.conn.recv)
+                except (EOFError, OSError):
+                    logger.warning(f"Worker {self.id} lost its supervisor, stopping")
+                    break
+                if message[0] == "add":
+                    self.add(message[1])
+                elif message[0] == "stop":
+                    break
+        finally:
+            reporter.cancel()
+            await self.pool.stop()
+            if self._tasks:
+                await asyncio.wait(list(self._tasks.values()), timeout=5)
+            self.send("m", self.metrics())
+
+
+def _worker_main(
+    worker_id: int,
+    conn,
+    specs: List[BotSpec],
+    handlers: list,
+    forward: set,
+    metrics_interval: float,
+    loop_factory: Callable = None,
+) -> None:
+    """Entry point of the worker processes"""
+    loop = (loop_factory or asyncio.new_event_loop)()
+    asyncio.set_event_loop(loop)
+    try:
+        worker = _Worker(worker_id, conn, handlers, forward)
+        loop.run_until_complete(worker.run(specs, metrics_interval))
+    finally:
+        loop.close()
+        conn.close()
+
+
+class Fleet:
+    """
+    Supervisor which spreads bots over worker processes to use all CPU cores
+
+    Every worker runs a :class:`ClientPool`. Bots are assigned to the worker with
+    the least bots, bots for the same lobby are kept on the same worker unless
+    that worker has :attr:`lobby_affinity` more bots than the least loaded one.
+    Crashed workers are restarted with the bots they were running.
+
+    Event handlers are declared once with :meth:`event` and run inside of every
+    worker for every bot, they get the worker local :class:`Client` as first
+    argument. Events the supervisor subscribed to with :meth:`on` are sent back
+    over a pipe as compact tuples (see :func:`compact`), worker metrics are sent
+    every :attr:`metrics_interval` seconds.
+
+    Note:
+        Handlers and bot specs are pickled when the workers are started with the
+        "spawn" start method, so handlers have to be defined at module level and
+        the fleet has to be started inside of an `if __name__ == "__main__"` block
+
+    Example:
+        .. code-block:: python
+
+           fleet = Fleet(workers=4)
+
+           @fleet.event
+           async def on_game_join(client, lobby_code):
+               await client.send_chat("Hello!")
+
+           @fleet.on("game_join")
+           def joined(worker_id, bot_id, lobby_code):
+               print(f"Bot {bot_id} on worker {worker_id} joined {lobby_code}")
+
+           if __name__ == "__main__":
+               for i in range(2000):
+                   fleet.add_bot(f"Bot{i}", lobby_code="ABCDEF", region="EU")
+               fleet.run()
+
+    Attributes:
+        workers (int): The amount of worker processes, defaults to the CPU count
+        metrics (Dict[int, dict]): The last metrics reported by every worker
+        results (Dict[int, Any]): The compacted results of finished bots
+        max_restarts (int): How often a worker is restarted before giving up on it
+        lobby_affinity (int): See above
+        metrics_interval (float): Seconds between metric reports of the workers
+    """
+
+    def __init__(
+        self,
+        workers: int = None,
+        max_restarts: int = 5,
+        lobby_affinity: int = 15,
+        metrics_interval: float = 5.0,
+        loop_factory: Callable[[], asyncio.AbstractEventLoop] = None,
+        start_method: str = None,
+    ):
+        """
+        Creates the supervisor, no processes are started until :meth:`run`
+
+        Args:
+            workers (int): Optional; The amount of worker processes
+            max_restarts (int): Optional; Restarts per worker before giving up
+            lobby_affinity (int): Optional; See :class:`Fleet`
+            metrics_interval (float): Optional; Seconds between metric reports
+            loop_factory (Callable): Optional; Creates the event loop in the workers
+            start_method (str): Optional; The multiprocessing start method
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_restarts = max_restarts
+        self.lobby_affinity = lobby_affinity
+        self.metrics_interval = metrics_interval
+        self.loop_factory = loop_factory
+        self.metrics: Dict[int, dict] = {}
+        self.results: Dict[int, Any] = {}
+        self._context = multiprocessing.get_context(start_method)
+        self._state = [_WorkerState(i) for i in range(self.workers)]
+        self._handlers: List[Tuple[str, Callable]] = []
+        self._listeners: Dict[str, List[Callable]] = {}
+        self._next_id = 0
+        self._running = False
+        self._stopping = False
+
+    def event(self, name: Union[str, Callable] = None) -> Callable:
+        """
+        Decorator which registers a bot event handler for every worker
+
+        Works like :meth:`Client.event`, but the handler gets the bot's
+        :class:`Client` as first argument
+        """
+
+        def decorator(func: Callable):
+            _name = name
+            if callable(_name):
+                _name = name.__name__
+                func = name
+            if not asyncio.iscoroutinefunction(func):
+                raise TypeError("Listeners must be coroutines")
+            self._handlers.append((_name or func.__name__, func))
+            return func
+
+        return decorator(name) if callable(name) else decorator
+
+    def on(self, event: str) -> Callable:
+        """
+        Decorator which registers a supervisor side listener
+
+        The listener is a normal function called as
+        `func(worker_id, bot_id, *args)` with the compacted event arguments.
+        Use `"*"` to receive every event, which is called as
+        `func(worker_id, bot_id, event, *args)`.
+        Besides bot events there are `metrics` (`func(worker_id, metrics)`),
+        `bot_finished` (`func(worker_id, bot_id, result)`) and `worker_restart`
+        (`func(worker_id, restarts)`)
+
+        Args:
+            event (str): The event name without the `on_` prefix
+        """
+        if event.startswith("on_"):
+            event = event[3:]
+
+        def decorator(func: Callable):
+            self._listeners.setdefault(event, []).append(func)
+            return func
+
+        return decorator
+
+    def add_bot(
+        self,
+        name: str,
+        lobby_code: str = None,
+        client_kwargs: dict = None,
+        **kwargs,
+    ) -> int:
+        """
+        Adds a bot to the fleet, if the fleet is running it is started right away
+
+        Args:
+            name (str): The bot's name
+            lobby_code (str): Optional; The lobby the bot joins when it is ready
+            client_kwargs (dict): Optional; Arguments for :class:`Client`
+            kwargs: Passed to :meth:`Client.start`, e.g. `region="EU"`
+
+        Returns:
+            The bot id
+        """
+        spec = BotSpec(
+            id=self._next_id,
+            name=name,
+            lobby_code=lobby_code.upper() if lobby_code else None,
+            client_kwargs=client_kwargs or {},
+            start_kwargs=kwargs,
+        )
+        self._next_id += 1
+        worker = self._assign(spec)
+        worker.bots[spec.id] = spec
+        if self._running and worker.process is not None:
+            worker.conn.send(("add", spec))
+        return spec.id
+
+    def load(self) -> Dict[int, int]:
+        """Returns the amount of running bots per worker"""
+        return {w.id: len(w.bots) for w in self._state if not w.failed}
+
+    def totals(self) -> dict:
+        """Sums up the last metrics of all workers"""
+        totals: Dict[str, Any] = {}
+        for metrics in self.metrics.values():
+            for key in ("bots", "finished", "events", "memory"):
+                totals[key] = totals.get(key, 0) + metrics.get(key, 0)
+        totals["restarts"] = sum(w.restarts for w in self._state)
+        totals["workers"] = sum(1 for w in self._state if not w.failed)
+        return totals
+
+    def stop(self) -> None:
+        """Lets :meth:`run` stop all workers and return, can be called by listeners"""
+        self._stopping = True
+
+    def run(self) -> Dict[int, Any]:
+        """
+        Starts the workers and supervises them until all bots finished or
+        :meth:`stop` was called
+
+        Returns:
+            :attr:`results`
+        """
+        self._running = True
+        self._stopping = False
+        try:
+            for worker in self._state:
+                self._spawn(worker)
+            while not self._stopping and any(w.bots for w in self._state):
+                self._poll(timeout=0.5)
+        finally:
+            self._shutdown()
+            self._running = False
+        return self.results
+
+    def _assign(self, spec: BotSpec) -> _WorkerState:
+        workers = [w for w in self._state if not w.failed]
+        if not workers:
+            raise RuntimeError("All workers of the fleet failed")
+        least = min(workers, key=lambda w: len(w.bots))
+        if spec.lobby_code is not None:
+            for worker in workers:
+                if any(b.lobby_code == spec.lobby_code for b in worker.bots.values()):
+                    if len(worker.bots) - len(least.bots) <= self.lobby_affinity:
+                        return worker
+                    break
+        return least
+
+    def _spawn(self, worker: _WorkerState) -> None:
+        parent, child = self._context.Pipe()
+        forward = set(self._listeners) - {"metrics", "bot_finished", "worker_restart"}
+        worker.conn = parent
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(
+                worker.id,
+                child,
+                list(worker.bots.values()),
+                self._handlers,
+                forward,
+                self.metrics_interval,
+                self.loop_factory,
+            ),
+            name=f"amongus-fleet-{worker.id}",
+            daemon=True,
+        )
+        worker.process.start()
+        child.close()
+
+    def _emit(self, event: str, *args) -> None:
+        for func in self._listeners.get(event, []):
+            try:
+                func(*args)
+            except Exception as e:
+                logger.exception(e)
+
+    def _handle(self, worker: _WorkerState, message: tuple) -> None:
+        kind = message[0]
+        if kind == "e":
+            _, bot_id, event, args = message
+            self._emit(event, worker.id, bot_id, *args)
+            self._emit("*", worker.id, bot_id, event, *args)
+        elif kind == "m":
+            self.metrics[worker.id] = message[1]
+            self._emit("metrics", worker.id, message[1])
+        elif kind == "x":
+            _, bot_id, result = message
+            worker.bots.pop(bot_id, None)
+            self.results[bot_id] = result
+            self._emit("bot_finished", worker.id, bot_id, result)
+
+    def _poll(self, timeout: float) -> None:
+        alive = [w for w in self._state if w.process is not None and not w.failed]
+        conns = {w.conn: w for w in alive}
+        sentinels = {w.process.sentinel: w for w in alive}
+        for ready in wait(list(conns) + list(sentinels), timeout=timeout):
+            if ready in conns:
+                self._drain(conns[ready])
+            else:
+                worker = sentinels[ready]
+                worker.process.join()
+                self._restart(worker)
+
+    def _drain(self, worker: _WorkerState) -> None:
+        """Handles the messages of a worker which are already in the pipe"""
+        with contextlib.suppress(EOFError, OSError):
+            while worker.conn.poll():
+                self._handle(worker, worker.conn.recv())
+
+    def _restart(self, worker: _WorkerState) -> None:
+        # the exit can be noticed before its last results, e.g. finished bots, were
+        # read, those must not be started again on the new process
+        self._drain(worker)
+        logger.warning(
+            f"Worker {worker.id} exited with code {worker.process.exitcode}, "
+            f"{len(worker.bots)} bots affected"
+        )
+        worker.conn.close()
+        if worker.restarts >= self.max_restarts:
+            logger.error(f"Worker {worker.id} crashed too often, giving up on it")
+            worker.failed = True
+            for bot_id in list(worker.bots):
+                self.results[bot_id] = "worker failed"
+                self._emit("bot_finished", worker.id, bot_id, "worker failed")
+            worker.bots.clear()
+            return
+        worker.restarts += 1
+        self._spawn(worker)
+        self._emit("worker_restart", worker.id, worker.restarts)
+
+    def _shutdown(self) -> None:
+        for worker in self._state:
+            if worker.process is None or not worker.process.is_alive():
+                continue
+            with contextlib.suppress(OSError):
+                worker.conn.send(("stop",))
+        deadline = time.monotonic() + 10
+        for worker in self._state:
+            if worker.process is None:
+                continue
+            # drain the last messages so the worker doesn't block on a full pipe
+            while worker.process.is_alive() and time.monotonic() < deadline:
+                try:
+                    if worker.conn.poll(0.1):
+                        self._handle(worker, worker.conn.recv())
+                except (EOFError, OSError):
+                    break
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.conn.close()
+            worker.process = None
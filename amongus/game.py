@@ -45,6 +45,8 @@ class Game:
         name (str): The game name (visible when searching games)
         code (int): The game's code (6 chars)
         public (bool): If the game is public and thus can be found by everyone
+        region (str): The region the game was found in, only set for games
+            returned by find_games
 
     """
 
@@ -77,6 +79,7 @@ class Game:
     playerCount: int
     name: str
     code: int
+    region: str = None
 
     public: bool
 
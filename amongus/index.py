@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import bisect
+import heapq
+import itertools
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .enums import GameSettings
+from .game import Game
+
+# the key of a bucket is the map id, the amount of impostors, the language and the
+# region of its lobbies, a lobby is identified by its region and code
+BucketKey = Tuple[int, int, GameSettings.Keywords, str]
+LobbyKey = Tuple[str, int]
+
+
+class LobbyIndex:
+    """
+    Keeps discovered lobbies sorted by player count for fast filtered queries
+
+    Lobbies are grouped into buckets by map, impostors, language and region. Every
+    bucket is a list of (playerCount, code) kept sorted with :mod:`bisect`, so adding,
+    updating and removing a lobby costs a binary search and a player count range
+    is found in O(log n). A query merges the ranges of all matching buckets lazily,
+    so only the returned lobbies are touched.
+
+    Lobbies without known keywords are stored with the language None and only
+    match queries for any language.
+
+    Example:
+        .. code-block:: python
+
+           index = LobbyIndex()
+           index.update(result.games)
+           # Polus, 2 impostors, 6-9 players, fullest first
+           games = index.query(
+               mapId=GameSettings.Map.Polus, impostors=2,
+               min_players=6, max_players=9, descending=True,
+           )
+    """
+
+    _buckets: Dict[BucketKey, List[Tuple[int, int]]]
+    _games: Dict[LobbyKey, Tuple[BucketKey, Tuple[int, int], Game]]
+
+    def __init__(self, games: Iterable[Game] = None):
+        """
+        Creates the index
+
+        Args:
+            games (Iterable[Game]): Optional; Lobbies to add
+        """
+        self._buckets = {}
+        self._games = {}
+        if games is not None:
+            self.update(games)
+
+    def __len__(self) -> int:
+        """Returns the amount of lobbies in the index."""
+        return len(self._games)
+
+    def __iter__(self) -> Iterator[Game]:
+        """Iterates over all lobbies in no particular order."""
+        return (game for _, _, game in self._games.values())
+
+    def __contains__(self, game: Game) -> bool:
+        """If the lobby is in the index."""
+        return self._key(game) in self._games
+
+    @staticmethod
+    def _key(game: Game) -> LobbyKey:
+        return getattr(game, "region", None), game.code
+
+    def get(self, code: int, region: str = None) -> Game:
+        """Returns the lobby with the code or None if it is not in the index"""
+        entry = self._games.get((region, code))
+        return entry[2] if entry is not None else None
+
+    def add(self, game: Game) -> None:
+        """Adds a lobby or updates it if it is already in the index"""
+        key = self._key(game)
+        bucket_key = (
+            int(game.mapId),
+            game.impostors,
+            getattr(game, "keywords", None),
+            key[0],
+        )
+        entry = (game.playerCount, game.code)
+        old = self._games.get(key)
+        if old is not None:
+            if old[0] == bucket_key and old[1] == entry:
+                # nothing which is indexed changed, just keep the newer object
+                self._games[key] = (bucket_key, entry, game)
+                return
+            self._discard(old[0], old[1])
+        bisect.insort(self._buckets.setdefault(bucket_key, []), entry)
+        self._games[key] = (bucket_key, entry, game)
+
+    def update(self, games: Iterable[Game]) -> None:
+        """Adds or updates multiple lobbies"""
+        for game in games:
+            self.add(game)
+
+    def replace(
+        self,
+        games: Iterable[Game],
+        mapId: GameSettings.SearchMap = GameSettings.SearchMap.All,
+        impostors: int = 0,
+        language: GameSettings.Keywords = GameSettings.Keywords.All,
+        region: str = None,
+    ) -> List[Game]:
+        """
+        Updates the index with the result of a search: the lobbies of the region
+        which match the search but are missing from games are removed, the games are
+        added or updated
+
+        Args:
+            games (Iterable[Game]): The lobbies the search returned
+            mapId (GameSettings.SearchMap): Optional; The searched maps
+            impostors (int): Optional; The searched amount of impostors, 0 for any
+            language (GameSettings.Keywords): Optional; The searched language
+            region (str): Optional; The region which was searched
+
+        Returns:
+            The removed lobbies
+        """
+        games = list(games)
+        found = {self._key(game) for game in games}
+        removed = [
+            game
+            for key, (bucket_key, _, game) in self._games.items()
+            if key not in found
+            and bucket_key[3] == region
+            and int(mapId) & 1 << bucket_key[0]
+            and impostors in (0, bucket_key[1])
+            and language in (GameSettings.Keywords.All, bucket_key[2])
+        ]
+        for game in removed:
+            self.remove(game)
+        self.update(games)
+        return removed
+
+    def remove(self, game: Game) -> None:
+        """Removes a lobby, doesn't do anything when it isn't in the index"""
+        old = self._games.pop(self._key(game), None)
+        if old is not None:
+            self._discard(old[0], old[1])
+
+    def clear(self) -> None:
+        self._buckets.clear()
+        self._games.clear()
+
+    def _discard(self, bucket_key: BucketKey, entry: Tuple[int, int]) -> None:
+        bucket = self._buckets[bucket_key]
+        i = bisect.bisect_left(bucket, entry)
+        if i < len(bucket) and bucket[i] == entry:
+            del bucket[i]
+        if not bucket:
+            del self._buckets[bucket_key]
+
+    def query(
+        self,
+        mapId: GameSettings.Map = None,
+        impostors: int = None,
+        language: GameSettings.Keywords = None,
+        region: str = None,
+        min_players: int = 0,
+        max_players: int = 255,
+        descending: bool = False,
+        limit: int = None,
+    ) -> List[Game]:
+        """
+        Returns the lobbies matching the filters sorted by player count
+
+        Every filter which is None matches everything
+
+        Args:
+            mapId (GameSettings.Map): Optional; The map
+            impostors (int): Optional; The amount of impostors
+            language (GameSettings.Keywords): Optional; The language of the chat
+            region (str): Optional; The region the lobby was found in
+            min_players (int): Optional; The minimum player count
+            max_players (int): Optional; The maximum player count
+            descending (bool): Optional; Fullest lobbies first
+            limit (int): Optional; Return at most this many lobbies
+
+        Returns:
+            The matching lobbies, ties are sorted by code
+        """
+        filters = (mapId, impostors, language, region)
+        lo, hi = (min_players, -1), (max_players + 1, -1)
+        ranges, regions = [], []
+        for bucket_key, bucket in self._buckets.items():
+            if not all(f is None or f == k for f, k in zip(filters, bucket_key)):
+                continue
+            start = bisect.bisect_left(bucket, lo)
+            end = bisect.bisect_left(bucket, hi)
+            if start == end:
+                continue
+            # the position in ranges breaks ties instead of the region, which might
+            # not be comparable
+            indices = range(end - 1, start - 1, -1) if descending else range(start, end)
+            ranges.append(_entries(bucket, indices, len(ranges)))
+            regions.append(bucket_key[3])
+        merged = heapq.merge(*ranges, reverse=descending)
+        return [
+            self._games[(regions[i], code)][2]
+            for _, code, i in itertools.islice(merged, limit)
+        ]
+
+
+def _entries(bucket: list, indices: range, tag: int):
+    for i in indices:
+        yield (*bucket[i], tag)
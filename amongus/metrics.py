@@ -0,0 +1,372 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Runtime metrics of connections: counters, histograms and gauges with a snapshot API
+and the Prometheus text exposition format, optionally served over HTTP
+
+Metrics are disabled by default, a connection without a registry only checks
+``connection.metrics is None`` on its hot paths. Enable them with
+:meth:`Connection.enable_metrics`, a registry can be shared by many connections to
+get the totals of all of them.
+"""
+import asyncio
+import bisect
+import collections
+import enum
+import json
+import logging
+import math
+import weakref
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds, 10µs to 10s
+DEFAULT_BUCKETS = tuple(
+    round(m * 10 ** e, 6) for e in range(-5, 1) for m in (1, 2.5, 5)
+) + (10.0,)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# name -> (kind, help, label names) of the metrics recorded by the library
+FAMILIES = {
+    "datagrams_received_total": ("counter", "Datagrams received", ()),
+    "datagrams_sent_total": ("counter", "Datagrams sent, including resends", ()),
+    "bytes_received_total": ("counter", "Bytes of the received datagrams", ()),
+    "bytes_sent_total": ("counter", "Bytes of the sent datagrams", ()),
+    "resends_total": ("counter", "Reliable packets sent again", ()),
+    "packets_received_total": (
+        "counter",
+        "Received packets by the type and value of their tag",
+        ("type", "tag"),
+    ),
+    "events_total": ("counter", "Events dispatched by the event bus", ("event",)),
+    "parse_seconds": ("histogram", "Time to parse a received datagram", ()),
+    "handler_seconds": (
+        "histogram",
+        "Time a packet handler of the connection took, by tag type",
+        ("type",),
+    ),
+    "listener_seconds": (
+        "histogram",
+        "Time from dispatching an event until a listener finished",
+        ("event",),
+    ),
+    "ack_rtt_seconds": (
+        "histogram",
+        "Time until a reliable packet was acknowledged",
+        (),
+    ),
+    "loop_lag_seconds": (
+        "histogram",
+        "How much later than scheduled the event loop ran a callback",
+        (),
+    ),
+    "inbound_queue_depth": ("gauge", "Received datagrams waiting to be parsed", ()),
+    "unacked_packets": ("gauge", "Sent reliable packets waiting for an ack", ()),
+    "outbound_buffer_bytes": (
+        "gauge",
+        "Bytes buffered by the transport because the socket was busy",
+        (),
+    ),
+}
+
+
+def _label(value: Any) -> str:
+    """Converts a label value, tag types and enum members are stored as they are"""
+    if isinstance(value, type):
+        return value.__name__
+    if isinstance(value, enum.Enum):
+        return value.name
+    return str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Histogram:
+    """
+    A histogram with fixed buckets, like the ones of Prometheus
+
+    Attributes:
+        bounds (Sequence[float]): The upper bounds of the buckets, ascending
+        counts (List[int]): The observations per bucket, the last one is +Inf
+        count (int): The amount of observations
+        sum (float): The sum of all observations
+        max (float): The largest observation
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile by interpolating inside of its bucket
+
+        Args:
+            q (float): The quantile, 0 to 1
+
+        Returns:
+            The estimate, 0 without observations
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.bounds):
+                    return self.max
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = min(self.bounds[i], self.max)
+                return lower + (upper - lower) * max(rank - seen, 0) / count
+            seen += count
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    A registry of counters, histograms and gauges
+
+    Every value is identified by a name and a tuple of label values. The label
+    names of the metrics recorded by the library are in :data:`FAMILIES`, other
+    names can be used as well and get labels named ``label0``, ``label1`` and so on.
+    Histograms measure seconds.
+
+    Example:
+        .. code-block:: python
+
+           metrics = client.connection.enable_metrics()
+           await metrics.serve(port=9464)  # http://127.0.0.1:9464/metrics
+           ...
+           print(metrics.snapshot()["packets_received_total"])
+
+    Attributes:
+        counters (Dict[Tuple[str, tuple], float]): The counters by name and labels
+        histograms (Dict[Tuple[str, tuple], Histogram]): The histograms by name and
+            labels
+        buckets (Sequence[float]): The bucket bounds of new histograms
+        prefix (str): Put in front of the names in :meth:`prometheus`
+    """
+
+    counters: Dict[Tuple[str, tuple], float]
+    histograms: Dict[Tuple[str, tuple], Histogram]
+    _gauges: Dict[str, weakref.WeakKeyDictionary]
+
+    def __init__(
+        self, buckets: Sequence[float] = DEFAULT_BUCKETS, prefix: str = "amongus_"
+    ):
+        """
+        Args:
+            buckets (Sequence[float]): Optional; The upper bounds of the histogram
+                buckets in seconds, default is 10µs to 10s
+            prefix (str): Optional; The prefix of the names in :meth:`prometheus`
+        """
+        self.counters = collections.Counter()
+        self.histograms = {}
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self._gauges = collections.defaultdict(weakref.WeakKeyDictionary)
+
+    def inc(self, name: str, *labels: Any, value: float = 1) -> None:
+        """
+        Increases a counter
+
+        Args:
+            name (str): The name of the counter
+            labels: The label values
+            value (float): Optional; The amount to add, default is 1
+        """
+        self.counters[name, labels] += value
+
+    def observe(self, name: str, value: float, *labels: Any) -> None:
+        """
+        Adds an observation to a histogram, which is created on first use
+
+        Args:
+            name (str): The name of the histogram
+            value (float): The observed value, e.g. a duration in seconds
+            labels: The label values
+        """
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[name, labels] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def add_gauge(self, name: str, owner: object, func: Callable[[Any], float]) -> None:
+        """
+        Adds a gauge which is read when taking a snapshot
+
+        The value of a gauge is the sum of ``func(owner)`` over all its owners, so a
+        registry shared by many connections reports e.g. the total queue depth. The
+        owners are referenced weakly and dropped once they are garbage collected
+
+        Args:
+            name (str): The name of the gauge
+            owner (object): The object the gauge reads from
+            func (Callable): Gets the owner and returns the current value
+        """
+        self._gauges[name][owner] = func
+
+    def remove_gauges(self, owner: object) -> None:
+        """Removes the gauges of an owner"""
+        for owners in self._gauges.values():
+            owners.pop(owner, None)
+
+    def gauge(self, name: str) -> float:
+        """Returns the current value of a gauge"""
+        return sum(func(owner) for owner, func in list(self._gauges[name].items()))
+
+    def reset(self) -> None:
+        """Clears all counters and histograms, gauges are kept"""
+        self.counters.clear()
+        self.histograms.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns the current values as plain data, e.g. to be logged or sent as JSON
+
+        Values without labels are stored by their name, labeled ones in a dict by
+        their label values joined by "/", e.g.
+        ``snapshot["packets_received_total"]["RPCTag/SendChat"]``. Histograms are
+        summarized by their count, sum, mean, estimated quantiles and max
+        """
+        result: Dict[str, Any] = {}
+        for (name, labels), value in sorted(
+            self.counters.items(), key=lambda item: item[0][0]
+        ):
+            if labels:
+                result.setdefault(name, {})["/".join(map(_label, labels))] = value
+            else:
+                result[name] = value
+        for (name, labels), histogram in self.histograms.items():
+            if labels:
+                key = "/".join(map(_label, labels))
+                result.setdefault(name, {})[key] = histogram.snapshot()
+            else:
+                result[name] = histogram.snapshot()
+        for name in self._gauges:
+            result[name] = self.gauge(name)
+        return result
+
+    def prometheus(self) -> str:
+        """Returns the current values in the Prometheus text exposition format"""
+        families: Dict[str, List[str]] = collections.defaultdict(list)
+        kinds: Dict[str, str] = {}
+        for (name, labels), value in self.counters.items():
+            kinds[name] = "counter"
+            families[name].append(f"{self._name(name, labels)} {_number(value)}")
+        for (name, labels), histogram in self.histograms.items():
+            kinds[name] = "histogram"
+            lines = families[name]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), histogram.counts):
+                cumulative += count
+                le = (("le", _number(bound)),)
+                lines.append(f"{self._name(name, labels, '_bucket', le)} {cumulative}")
+            lines.append(f"{self._name(name, labels, '_sum')} {_number(histogram.sum)}")
+            lines.append(f"{self._name(name, labels, '_count')} {histogram.count}")
+        for name in self._gauges:
+            kinds[name] = "gauge"
+            families[name].append(f"{self.prefix}{name} {_number(self.gauge(name))}")
+
+        output = []
+        for name in sorted(families):
+            description = FAMILIES.get(name, (None, name.replace("_", " "), ()))[1]
+            output.append(f"# HELP {self.prefix}{name} {description}")
+            output.append(f"# TYPE {self.prefix}{name} {kinds[name]}")
+            output.extend(families[name])
+        return "\n".join(output) + "\n"
+
+    def _name(
+        self, name: str, labels: tuple, suffix: str = "", extra: tuple = ()
+    ) -> str:
+        """Formats a sample name with its labels"""
+        names = FAMILIES.get(name, (None, None, ()))[2]
+        pairs = [
+            (names[i] if i < len(names) else f"label{i}", _label(value))
+            for i, value in enumerate(labels)
+        ]
+        pairs.extend(extra)
+        if not pairs:
+            return f"{self.prefix}{name}{suffix}"
+        formatted = ",".join(f'{key}="{_escape(value)}"' for key, value in pairs)
+        return f"{self.prefix}{name}{suffix}{{{formatted}}}"
+
+    async def serve(
+        self, host: str = "127.0.0.1", port: int = 9464
+    ) -> asyncio.AbstractServer:
+        """
+        Serves the metrics over HTTP, ``/metrics`` in the Prometheus format and
+        ``/metrics.json`` as :meth:`snapshot`
+
+        Args:
+            host (str): Optional; The address to listen on, default is localhost only
+            port (int): Optional; The port, 0 picks a free one
+
+        Returns:
+            The server, close it to stop serving
+        """
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Answers a single HTTP request"""
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.split()
+            path = parts[1].split(b"?")[0] if len(parts) > 1 else b""
+            if path == b"/metrics":
+                status, content_type = "200 OK", PROMETHEUS_CONTENT_TYPE
+                body = self.prometheus().encode()
+            elif path == b"/metrics.json":
+                status, content_type = "200 OK", "application/json"
+                body = json.dumps(self.snapshot()).encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"Not Found"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            logger.debug(f"Metrics request failed: {e!r}")
+        finally:
+            writer.close()
@@ -2,13 +2,16 @@
 # -*- coding: utf-8 -*-
 import asyncio
 import logging
-from typing import List
+from typing import Dict, List
 
 from ..enums import PacketType
 from ..helpers import dotdict, formatHex
 
 logger = logging.getLogger(__name__)
 
+# tag -> subclasses lookup tables, see Packet.subclasses_for
+_registries: Dict[type, Dict[int, List[type]]] = {}
+
 
 class Packet:
     """The base class for all packets sent and received by this library
@@ -132,6 +135,28 @@ class Packet:
         """
         raise NotImplementedError
 
+    @classmethod
+    def subclasses_for(cls, tag: int) -> List[type]:
+        """
+        Returns the direct subclasses which parse the given tag, in the order they
+        were defined
+
+        The lookup table is built once per class on first use and is shared
+        read-only by every connection in the process, instead of going through
+        :meth:`__subclasses__` for every message
+
+        Args:
+            tag (int): The tag read from the data
+        """
+        registry = _registries.get(cls)
+        if registry is None:
+            registry = {}
+            for p in cls.__subclasses__():
+                for _tag in p.tag if type(p.tag) == list else [p.tag]:
+                    registry.setdefault(_tag, []).append(p)
+            _registries[cls] = registry
+        return registry.get(tag, [])
+
     @staticmethod
     def parse(data: bytes, first_call=False) -> List["Packet"]:
         """
@@ -147,7 +172,7 @@ class Packet:
             data = data[1:]
             result = None
 
-            for p in Packet.__subclasses__():
+            for p in Packet.subclasses_for(tag):
                 if type(p.tag) == PacketType and not first_call:
                     # when its a "parent"/"main"/whatever packet require first_call to
                     # be True. This ensures that packets like Reliable can be parsed
@@ -155,9 +180,8 @@ class Packet:
                     continue
                 if first_call and type(p.tag) != PacketType:
                     continue
-                if p.tag == tag or (type(p.tag) == list and tag in p.tag):
-                    result, data = p.parse(data)
-                    break
+                result, data = p.parse(data)
+                break
 
             if result is not None:
                 packets.append(result)
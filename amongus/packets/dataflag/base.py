@@ -34,9 +34,8 @@ class DataFlagPacket(GameDataPacket):
             dataflag (DataFlag): Our internal dataflag enum for "translation"
         """
         result = None
-        for p in DataFlagPacket.__subclasses__():
-            if p.tag == dataflag:
-                result = p.parse(self.values.child_data)
+        for p in DataFlagPacket.subclasses_for(dataflag):
+            result = p.parse(self.values.child_data)
 
         if result is not None:
             self.add_packet(result)
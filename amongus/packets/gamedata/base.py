@@ -27,10 +27,9 @@ class GameDataPacket(Packet):
             tag = _data[2]
             result = None
 
-            for p in GameDataPacket.__subclasses__():
-                if p.tag == tag:
-                    result = p.parse(_data[3 : size + 3])
-                    break
+            for p in GameDataPacket.subclasses_for(tag):
+                result = p.parse(_data[3 : size + 3])
+                break
 
             if result is not None:
                 packet.add_packet(result)
@@ -69,10 +68,9 @@ class GameDataToPacket(Packet):
             tag = _data[2]
             result = None
 
-            for p in GameDataPacket.__subclasses__():
-                if p.tag == tag:
-                    result = p.parse(_data[3 : size + 3])
-                    break
+            for p in GameDataPacket.subclasses_for(tag):
+                result = p.parse(_data[3 : size + 3])
+                break
 
             if result is not None:
                 packet.add_packet(result)
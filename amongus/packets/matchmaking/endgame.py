@@ -17,7 +17,7 @@ class EndGamePacket(Packet):
     @classmethod
     def parse(cls, data: bytes) -> Tuple["EndGamePacket", bytes]:
         game_id = unpack({data[:4]: "I"})
-        reason = data[5]
+        reason = data[4]
         if GameOverReason.has_value(reason):
             reason = GameOverReason(reason)
         return cls(data, game_id=game_id, reason=reason), b""
@@ -39,7 +39,7 @@ class GetGameListV2Packet(Packet):
         while len(_data):
             game = Game()
             _, gamedata, _data = readMessage(_data)
-            host, game.port = struct.unpack("Ih", gamedata[:6])
+            host, game.port = struct.unpack("IH", gamedata[:6])
             game.host = ".".join(socket.inet_ntoa(pack({host: "!L"})).split(".")[::-1])
             game.code = unpack({gamedata[6:10]: "I"})
             game.name, _rest = readString(gamedata[10:])
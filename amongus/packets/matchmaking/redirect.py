@@ -18,7 +18,7 @@ class RedirectPacket(Packet):
 
     @classmethod
     def parse(cls, data: bytes) -> Tuple["RedirectPacket", bytes]:
-        host, port = struct.unpack("Ih", data)
+        host, port = struct.unpack("IH", data)
         host = ".".join(socket.inet_ntoa(pack({host: "!L"})).split(".")[::-1])
         return cls(data, host=host, port=port), b""
 
@@ -22,10 +22,9 @@ class RPCPacket(GameDataPacket):
         net_id, _data = readPacked(data[0:])
         tag = _data[0]
 
-        for p in RPCPacket.__subclasses__():
-            if p.tag == tag:
-                result = [p.parse(_data[1:])]
-                break
+        for p in RPCPacket.subclasses_for(tag):
+            result = [p.parse(_data[1:])]
+            break
 
         if result is None:
             logger.warning(
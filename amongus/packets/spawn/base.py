@@ -18,27 +18,41 @@ class SpawnPacket(GameDataPacket):
 
     @classmethod
     def parse(cls, data: bytes) -> "SpawnPacket":
-        result = None
         spawn_id, _data = readPacked(data)
         owner, _data = readPacked(_data)
         flags = _data[0]
         component_length, _data = readPacked(_data[1:])
 
-        packet = cls(data, owner=owner, flags=flags, component_length=component_length)
-
-        for p in SpawnPacket.__subclasses__():
-            if p.tag == spawn_id:
-                result = p.parse(_data)
-                break
+        return cls(
+            data,
+            spawn_id=spawn_id,
+            owner=owner,
+            flags=flags,
+            component_length=component_length,
+            child_data=_data,
+        )
+
+    def parse_spawn(self) -> None:
+        """
+        Parses the spawned object, this is not done in :meth:`parse` so
+        :class:`Connection` can skip spawn data it already knows, like
+        :meth:`DataFlagPacket.parse_with_flag` it continues the "parsing pipeline"
+        """
+        if self.contained_packets:
+            return
+        result = None
+        for p in SpawnPacket.subclasses_for(self.values.spawn_id):
+            result = p.parse(self.values.child_data)
+            break
 
         if result is not None:
-            packet.add_packet(result)
+            self.add_packet(result)
         else:
             logger.warning(
-                f"Could not find a Spawn packet which can parse '{spawn_id}'.\n"
-                f"Data: {formatHex(_data)}"
+                f"Could not find a Spawn packet which can parse "
+                f"'{self.values.spawn_id}'.\n"
+                f"Data: {formatHex(self.values.child_data)}"
             )
-        return packet
 
     def serialize(self, getID: callable) -> bytes:
         raise NotImplementedError
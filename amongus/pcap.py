@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+A minimal streaming reader for pcap and pcapng files, e.g. from Wireshark or tcpdump
+
+Only what is needed to get the UDP datagrams of Among Us traffic is supported:
+Ethernet (with VLAN tags), raw IP, BSD loopback and Linux cooked captures carrying
+IPv4 or IPv6. Fragmented IP packets are skipped. The file is read block by block,
+so captures of any size are read in constant memory
+"""
+import logging
+import os
+import struct
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple, Union
+
+from .capture import Direction, Record
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = (22023,)
+
+PCAP_MAGICS = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1000),  # microseconds
+    b"\xa1\xb2\xc3\xd4": (">", 1000),
+    b"\x4d\x3c\xb2\xa1": ("<", 1),  # nanoseconds
+    b"\xa1\xb2\x3c\x4d": (">", 1),
+}
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = (0x8100, 0x88A8)
+IPPROTO_UDP = 17
+
+
+def _ip_payload(frame: bytes, linktype: int) -> Optional[Tuple[bytes, bytes, bytes]]:
+    """Returns the source, destination and UDP datagram of a link layer frame"""
+    if linktype == LINKTYPE_ETHERNET:
+        ethertype, offset = struct.unpack_from(">H", frame, 12)[0], 14
+        while ethertype in ETHERTYPE_VLAN:
+            ethertype = struct.unpack_from(">H", frame, offset + 2)[0]
+            offset += 4
+    elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        # the address family is in host byte order for NULL, in network order for
+        # LOOP, IPv4 is 2 everywhere and IPv6 24, 28 or 30
+        ethertype = ETHERTYPE_IPV4 if 2 in (frame[0], frame[3]) else ETHERTYPE_IPV6
+        offset = 4
+    elif linktype == LINKTYPE_LINUX_SLL:
+        ethertype, offset = struct.unpack_from(">H", frame, 14)[0], 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        ethertype, offset = struct.unpack_from(">H", frame, 0)[0], 20
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        ethertype = ETHERTYPE_IPV4 if frame[0] >> 4 == 4 else ETHERTYPE_IPV6
+        offset = 0
+    else:
+        return None
+
+    if ethertype == ETHERTYPE_IPV4:
+        header = (frame[offset] & 0x0F) * 4
+        flags_fragment = struct.unpack_from(">H", frame, offset + 6)[0]
+        if frame[offset + 9] != IPPROTO_UDP or flags_fragment & 0x3FFF:
+            # not UDP or fragmented
+            return None
+        source = frame[offset + 12 : offset + 16]
+        destination = frame[offset + 16 : offset + 20]
+        offset += header
+    elif ethertype == ETHERTYPE_IPV6:
+        # extension headers are not followed, Among Us traffic doesn't use them
+        if frame[offset + 6] != IPPROTO_UDP:
+            return None
+        source = frame[offset + 8 : offset + 24]
+        destination = frame[offset + 24 : offset + 40]
+        offset += 40
+    else:
+        return None
+    return source, destination, frame[offset:]
+
+
+def _address(ip: bytes, port: int) -> str:
+    if len(ip) == 4:
+        return f"{'.'.join(str(b) for b in ip)}:{port}"
+    return f"[{':'.join(ip[i : i + 2].hex() for i in range(0, 16, 2))}]:{port}"
+
+
+def _frames(f: BinaryIO) -> Iterator[Tuple[int, int, bytes]]:
+    """Yields the timestamp in ns, the link type and the data of every frame"""
+    magic = f.read(4)
+    if magic in PCAP_MAGICS:
+        endian, factor = PCAP_MAGICS[magic]
+        header = f.read(20)
+        linktype = struct.unpack(endian + "HHiIII", header)[5] & 0x0FFFFFFF
+        record = struct.Struct(endian + "IIII")
+        while True:
+            head = f.read(record.size)
+            if len(head) < record.size:
+                return
+            seconds, fraction, captured, _ = record.unpack(head)
+            data = f.read(captured)
+            if len(data) < captured:
+                return
+            yield seconds * 1_000_000_000 + fraction * factor, linktype, data
+    elif magic == struct.pack("<I", PCAPNG_SHB):
+        yield from _pcapng_frames(f, magic)
+    else:
+        raise ValueError("Not a pcap or pcapng file")
+
+
+def _pcapng_frames(f: BinaryIO, first: bytes) -> Iterator[Tuple[int, int, bytes]]:
+    endian = "<"
+    # per interface: link type and timestamp units per second
+    interfaces = []
+    block_type = first
+    while True:
+        if block_type is None:
+            block_type = f.read(4)
+        if len(block_type) < 4:
+            return
+        length_data = f.read(4)
+        if len(length_data) < 4:
+            return
+        if block_type == struct.pack("<I", PCAPNG_SHB):
+            # a new section, possibly with another byte order
+            byte_order = f.read(4)
+            little = struct.unpack("<I", byte_order)[0] == PCAPNG_BYTE_ORDER
+            endian = "<" if little else ">"
+            length = struct.unpack(endian + "I", length_data)[0]
+            f.read(length - 12)
+            interfaces = []
+            block_type = None
+            continue
+        kind = struct.unpack(endian + "I", block_type)[0]
+        length = struct.unpack(endian + "I", length_data)[0]
+        body = f.read(length - 8)
+        block_type = None
+        if len(body) < length - 8:
+            return
+        if kind == PCAPNG_IDB:
+            linktype = struct.unpack_from(endian + "H", body)[0]
+            interfaces.append([linktype, 1_000_000])
+            _idb_options(body[8:-4], endian, interfaces[-1])
+        elif kind == PCAPNG_EPB:
+            interface, high, low, captured = struct.unpack_from(endian + "IIII", body)
+            linktype, resolution = interfaces[interface]
+            timestamp = ((high << 32) | low) * 1_000_000_000 // resolution
+            yield timestamp, linktype, body[20 : 20 + captured]
+        elif kind == PCAPNG_SPB and interfaces:
+            # no timestamp, the captured length is the block minus its framing
+            original = struct.unpack_from(endian + "I", body)[0]
+            yield 0, interfaces[0][0], body[4 : 4 + min(original, len(body) - 8)]
+
+
+def _idb_options(options: bytes, endian: str, interface: list) -> None:
+    """Reads the timestamp resolution (if_tsresol) of an interface"""
+    offset = 0
+    while offset + 4 <= len(options):
+        code, length = struct.unpack_from(endian + "HH", options, offset)
+        if code == 0:
+            return
+        if code == 9 and length >= 1:
+            value = options[offset + 4]
+            interface[1] = 2 ** (value & 0x7F) if value & 0x80 else 10 ** value
+        offset += 4 + (length + 3) // 4 * 4
+
+
+def read_pcap(
+    source: Union[str, os.PathLike, BinaryIO], ports: Iterable[int] = DEFAULT_PORTS
+) -> Iterator[Tuple[Record, str, str]]:
+    """
+    Reads the UDP datagrams from or to the ports from a pcap or pcapng file
+
+    Datagrams sent from one of the ports are inbound (sent by the server), the
+    others outbound
+
+    Args:
+        source (str): The path of the file or a binary file object
+        ports (Iterable[int]): Optional; The server ports, default is 22023
+
+    Returns:
+        The record (with the capture timestamp in ns since the epoch), the source
+        and the destination address of every datagram
+
+    Raises:
+        ValueError: The file is not a pcap or pcapng file
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb", buffering=1 << 20) as f:
+            yield from read_pcap(f, ports)
+        return
+    ports = set(ports)
+    for timestamp, linktype, frame in _frames(source):
+        try:
+            result = _ip_payload(frame, linktype)
+            if result is None:
+                continue
+            source_ip, destination_ip, udp = result
+            source_port, destination_port, length = struct.unpack_from(">HHH", udp)
+        except (IndexError, struct.error):
+            continue
+        if source_port in ports:
+            direction = Direction.Inbound
+        elif destination_port in ports:
+            direction = Direction.Outbound
+        else:
+            continue
+        yield (
+            Record(timestamp, direction, udp[8:length] if length >= 8 else udp[8:]),
+            _address(source_ip, source_port),
+            _address(destination_ip, destination_port),
+        )
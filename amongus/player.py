@@ -3,7 +3,7 @@
 from typing import Dict, List, Tuple, Union
 
 from .enums import PlayerAttributes
-from .helpers import dotdict, readPacked, readString
+from .helpers import createPacked, dotdict, readPacked, readString, writeString
 from .task import Task
 
 
@@ -92,8 +92,39 @@ class Player:
         self.host = other.host
         self.death_position = other.death_position
 
+    def state(self) -> tuple:
+        """Returns the data which is sent in the spawn data, to compare players"""
+        return (
+            self.name,
+            self.color,
+            self.hat,
+            self.pet,
+            self.skin,
+            self.statusBitField,
+            tuple((t.id, t.complete) for t in getattr(self, "tasks", ())),
+        )
+
+    def reset_game_state(self) -> None:
+        """Forgets everything which only lasts for one game, e.g. after it ended"""
+        self.tasks = []
+        self.impostor = False
+        self.statusBitField &= ~4
+        self.death_position = None
+        self.position = None
+        self.velocity = None
+
     def serialize(self) -> bytes:
-        pass
+        """The opposite of :meth:`deserialize`, as sent in the spawn data"""
+        return (
+            bytes([self.id])
+            + writeString(self.name)
+            + bytes([self.color])
+            + createPacked(self.hat)
+            + createPacked(self.pet)
+            + createPacked(self.skin)
+            + bytes([self.statusBitField, len(self.tasks)])
+            + b"".join(t.serialize() for t in self.tasks)
+        )
 
 
 class PlayerList:
@@ -128,15 +159,34 @@ class PlayerList:
                players = PlayerList()
                players += [Player(...), Player(...)]
         """
+        self.merge(other)
+        return self
+
+    def merge(self, other: Union[Player, list]) -> List[Player]:
+        """
+        Adds new players and overwrites the data of known ones
+
+        Args:
+            other (Union[Player, list]): A player or a list of players
+
+        Returns:
+            The players which are new or whose data changed
+        """
         if type(other) == Player:
             other = [other]
+        changed = []
         for player in other:
-            if player.id in self.players.keys():
+            known = self.players.get(player.id)
+            if known is not None:
                 # we already have data, overwrite just the new data
-                self.players[player.id].overwrite(player)
+                before = known.state()
+                known.overwrite(player)
+                if known.state() != before:
+                    changed.append(known)
             else:
                 self.players.update({player.id: player})
-        return self
+                changed.append(player)
+        return changed
 
     def __iter__(self):
         """Makes it possible to iterate over this PlayerList."""
@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Dict, Iterable
+
+from .connection import Connection
+from .eventbus import EventBus
+from .exceptions import AmongUsException
+from .regions import regions as default_regions
+from .timers import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+
+class RegionProbe:
+    """
+    Measures the round trip time to every region and picks the fastest one
+
+    A probe connects to all regions concurrently, measures the Hello handshake and
+    a few Ping round trips and disconnects again. The results are smoothed with an
+    exponentially weighted moving average, so a single slow answer doesn't make a
+    region look bad. A region which can't be reached is unhealthy until it answers
+    again.
+
+    Example:
+        .. code-block:: python
+
+           probe = RegionProbe()
+           region = await probe.fastest()
+           probe.start()  # keep the table up to date in the background
+
+    Attributes:
+        regions (Dict[str, str]): The regions to probe, name -> host
+        rtt (Dict[str, float]): The smoothed round trip time per region in ms,
+            infinite for unhealthy regions
+        healthy (Dict[str, bool]): If the region answered the last probe
+        interval (float): Seconds between probes in the background and the time
+            after which the table is considered outdated
+        last_probe (float): The loop time of the last finished probe
+    """
+
+    regions: Dict[str, str]
+    rtt: Dict[str, float]
+    healthy: Dict[str, bool]
+    interval: float
+    last_probe: float = None
+
+    def __init__(
+        self,
+        regions: Dict[str, str] = None,
+        port: int = 22023,
+        gameVersion: tuple = (2021, 3, 5),
+        samples: int = 3,
+        alpha: float = 0.3,
+        timeout: float = 1.0,
+        interval: float = 60.0,
+        timer_wheel: TimerWheel = None,
+    ):
+        """
+        Creates the probe, nothing is measured until :meth:`probe` is called
+
+        Args:
+            regions (Dict[str, str]): Optional; The regions to probe, defaults to
+                :attr:`amongus.regions.regions`
+            port (int): Optional; Port of the servers
+            gameVersion (tuple): Optional; The version of the game running on the
+                servers
+            samples (int): Optional; Pings per region and probe
+            alpha (float): Optional; Weight of a new sample in the moving average
+            timeout (float): Optional; Seconds to wait for a single answer
+            interval (float): Optional; Seconds between background probes
+            timer_wheel (TimerWheel): Optional; Timer wheel for the connections
+        """
+        self.regions = dict(regions if regions is not None else default_regions)
+        self.port = port
+        self.gameVersion = gameVersion
+        self.samples = samples
+        self.alpha = alpha
+        self.timeout = timeout
+        self.interval = interval
+        self.timer_wheel = timer_wheel
+        self.rtt = {}
+        self.healthy = {}
+        self._lock = None
+        self._task = None
+
+    def best(self) -> str:
+        """Returns the healthy region with the lowest round trip time or None"""
+        candidates = [r for r in self.regions if self.healthy.get(r)]
+        return min(candidates, key=lambda r: self.rtt[r], default=None)
+
+    async def fastest(self) -> str:
+        """
+        Returns the best region, probing first if the table is outdated
+
+        Raises:
+            AmongUsException: No region could be reached
+        """
+        loop = asyncio.get_running_loop()
+        if self.last_probe is None or loop.time() - self.last_probe > self.interval:
+            await self.probe()
+        region = self.best()
+        if region is None:
+            raise AmongUsException("No region could be reached!")
+        return region
+
+    async def probe(self, regions: Iterable[str] = None) -> Dict[str, float]:
+        """
+        Probes the regions concurrently and updates the table
+
+        Concurrent calls wait for the running probe instead of starting another one
+
+        Args:
+            regions (Iterable[str]): Optional; Only probe these regions
+
+        Returns:
+            :attr:`rtt`
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if self._lock.locked():
+            async with self._lock:
+                return self.rtt
+        async with self._lock:
+            regions = list(regions) if regions is not None else list(self.regions)
+            samples = await asyncio.gather(
+                *(self._probe_region(self.regions[r]) for r in regions)
+            )
+            for region, rtt in zip(regions, samples):
+                self._update(region, rtt)
+            self.last_probe = asyncio.get_running_loop().time()
+            logger.debug(f"Probed regions: {self.rtt}")
+            return self.rtt
+
+    def _update(self, region: str, rtt: float) -> None:
+        if rtt is None:
+            self.healthy[region] = False
+            self.rtt[region] = float("inf")
+            return
+        old = self.rtt.get(region)
+        if not self.healthy.get(region) or old is None:
+            # start over after the region was unreachable
+            self.rtt[region] = rtt
+        else:
+            self.rtt[region] = old + self.alpha * (rtt - old)
+        self.healthy[region] = True
+
+    async def _probe_region(self, host: str) -> float:
+        """Returns the average round trip time to the host in ms, None if it failed"""
+        connection = Connection(EventBus(), timer_wheel=self.timer_wheel)
+        connection.connectTimeout = connection.recvTimeout = int(self.timeout * 1000)
+        start = time.perf_counter()
+        try:
+            await connection.connect("Probe", host, self.port, self.gameVersion)
+            if connection.closed:
+                return None
+            results = [(time.perf_counter() - start) * 1000]
+            for _ in range(self.samples):
+                with contextlib.suppress(asyncio.TimeoutError):
+                    results.append(await connection.ping(self.timeout))
+            # the handshake only counts if no ping was answered
+            rtt = results[1:] or results
+            return sum(rtt) / len(rtt)
+        except OSError as e:
+            logger.debug(f"Probing {host} failed: {e!r}")
+            return None
+        finally:
+            await connection.disconnect(False)
+
+    def start(self, interval: float = None) -> asyncio.Task:
+        """
+        Keeps probing in the background, doesn't do anything if already running
+
+        Args:
+            interval (float): Optional; Overwrites :attr:`interval`
+        """
+        if interval is not None:
+            self.interval = interval
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return self._task
+
+    def stop(self) -> None:
+        """Stops probing in the background"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.probe()
+            except Exception as e:
+                logger.exception(e)
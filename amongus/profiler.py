@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Coroutine, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProfileEntry:
+    """
+    The time spent in one packet handler or event listener
+
+    Attributes:
+        kind (str): "handler" for the packet handlers of the connection, by tag, or
+            "listener" for the event listeners, by event and function name
+        name (str): e.g. "RPCTag.SendChat" or "chat:on_chat"
+        calls (int): How often it ran
+        total (float): Seconds it ran in total
+        max (float): Seconds of the slowest call
+        slow (int): Calls which took longer than the threshold
+    """
+
+    kind: str
+    name: str
+    calls: int = 0
+    total: float = 0.0
+    max: float = 0.0  # noqa: A003
+    slow: int = 0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+
+@dataclass
+class ProfileReport:
+    """
+    The result of :meth:`Profiler.report`, e.g. from :meth:`Client.profile`
+
+    Attributes:
+        duration (float): Seconds the profiler ran
+        threshold (float): Seconds after which a call counted as slow
+        entries (List[ProfileEntry]): The handlers and listeners, the ones which took
+            the most time in total first
+    """
+
+    duration: float
+    threshold: float
+    entries: List[ProfileEntry] = field(default_factory=list)
+
+    def format(self, limit: int = 20) -> str:  # noqa: A003
+        """
+        Returns the report as a human readable table
+
+        Args:
+            limit (int): Optional; The amount of entries to show
+        """
+        busy = sum(e.total for e in self.entries)
+        slow = "" if self.threshold is None else f", slow after {self.threshold * 1000}ms"
+        lines = [
+            f"{self.duration:.1f}s profiled, {busy * 1000:.1f}ms in handlers and "
+            f"listeners{slow}",
+            f"{'kind':>8} {'name':<36} {'calls':>8} {'total ms':>9} {'%':>6} "
+            f"{'mean ms':>8} {'max ms':>8} {'slow':>5}",
+        ]
+        for e in self.entries[:limit]:
+            share = 100 * e.total / self.duration if self.duration else 0.0
+            lines.append(
+                f"{e.kind:>8} {e.name:<36} {e.calls:>8} {e.total * 1000:>9.2f} "
+                f"{share:>6.2f} {e.mean * 1000:>8.3f} {e.max * 1000:>8.2f} {e.slow:>5}"
+            )
+        return "\n".join(lines)
+
+
+class _Busy:
+    """
+    Runs a coroutine and sums up the time of its steps, which is the time it blocked
+    the event loop. Waiting for e.g. a sleep or the network is not counted
+    """
+
+    __slots__ = ("coroutine", "busy")
+
+    def __init__(self, coroutine: Coroutine):
+        self.coroutine = coroutine
+        self.busy = 0.0
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            started = time.perf_counter()
+            try:
+                if error is None:
+                    future = self.coroutine.send(value)
+                else:
+                    future = self.coroutine.throw(error)
+            except StopIteration as e:
+                self.busy += time.perf_counter() - started
+                return e.value
+            except BaseException:
+                self.busy += time.perf_counter() - started
+                raise
+            self.busy += time.perf_counter() - started
+            try:
+                value, error = (yield future), None
+            except GeneratorExit:
+                self.coroutine.close()
+                raise
+            # thrown into the coroutine on the next step, which re-raises it if it
+            # doesn't handle it
+            except BaseException as e:  # noqa: B036
+                value, error = None, e
+
+
+class Profiler:
+    """
+    Times the packet handlers of a connection by tag and the event listeners by
+    event and function, see :meth:`Connection.enable_profiling`
+
+    A call which takes longer than the threshold is logged as a warning and
+    dispatched as a ``slow_handler`` event with the kind ("handler" or "listener"),
+    the name and the seconds it took. Listeners are timed by the time they block
+    the event loop, awaiting e.g. :func:`asyncio.sleep` doesn't count
+
+    Example:
+        .. code-block:: python
+
+           @client.event
+           async def on_slow_handler(kind, name, seconds):
+               print(f"{kind} {name} took {seconds * 1000:.1f}ms")
+
+           client.connection.enable_profiling(threshold=0.005)
+
+    Attributes:
+        threshold (float): Seconds after which a call is slow, None to not report
+            slow calls
+        started (float): The :func:`time.perf_counter` time the profiler was created
+        entries (Dict[Tuple[str, str], ProfileEntry]): The entries by kind and name
+    """
+
+    threshold: float
+    started: float
+    entries: Dict[Tuple[str, str], ProfileEntry]
+
+    def __init__(self, threshold: float = 0.05, eventbus: Any = None):
+        """
+        Args:
+            threshold (float): Optional; Seconds after which a call is slow, default
+                is 50ms
+            eventbus (EventBus): Optional; Gets the ``slow_handler`` events
+        """
+        self.threshold = threshold
+        self.eventbus = eventbus
+        self.started = time.perf_counter()
+        self.entries = {}
+
+    def record(self, kind: str, name: str, seconds: float) -> None:
+        """
+        Adds the time of one call
+
+        Args:
+            kind (str): "handler" or "listener"
+            name (str): The name of the handler or listener
+            seconds (float): The time the call took
+        """
+        entry = self.entries.get((kind, name))
+        if entry is None:
+            entry = self.entries[kind, name] = ProfileEntry(kind, name)
+        entry.calls += 1
+        entry.total += seconds
+        if seconds > entry.max:
+            entry.max = seconds
+        if self.threshold is not None and seconds >= self.threshold:
+            entry.slow += 1
+            logger.warning(f"Slow {kind} {name}: {seconds * 1000:.1f}ms")
+            # listeners of slow_handler itself would report themselves endlessly
+            if self.eventbus is not None and name.split(":")[0] != "slow_handler":
+                self.eventbus.dispatch("slow_handler", kind, name, seconds)
+
+    async def listener(self, event: str, callback: Any, coroutine: Coroutine) -> Any:
+        """Runs the coroutine of an event listener and records its busy time"""
+        timed = _Busy(coroutine)
+        try:
+            return await timed
+        finally:
+            name = getattr(callback, "__qualname__", repr(callback))
+            self.record("listener", f"{event}:{name}", timed.busy)
+
+    def report(self) -> ProfileReport:
+        """Returns the entries ranked by their total time"""
+        return ProfileReport(
+            time.perf_counter() - self.started,
+            self.threshold,
+            sorted(self.entries.values(), key=lambda e: e.total, reverse=True),
+        )
+
+    def reset(self) -> None:
+        """Clears the entries and restarts the duration"""
+        self.entries.clear()
+        self.started = time.perf_counter()
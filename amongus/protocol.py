@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionProtocol(asyncio.DatagramProtocol):
+    """
+    Datagram protocol which hands every received datagram synchronously to its
+    :class:`Connection`, see :meth:`Connection._datagram_received`
+    """
+
+    def __init__(self, connection):
+        """
+        Args:
+            connection (Connection): The connection which receives the datagrams
+        """
+        self.connection = connection
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.connection._datagram_received(data)
+
+    def error_received(self, exc: Exception) -> None:
+        # mostly ICMP port unreachable, the idle watchdog takes care of reconnecting
+        logger.debug(f"Error received on the UDP transport: {exc!r}")
@@ -4,6 +4,8 @@ import asyncio
 import collections
 from typing import Any, Callable, Dict
 
+from .timers import TimerWheel
+
 
 class PacketQueue:
     """
@@ -11,17 +13,21 @@ class PacketQueue:
     places at once
     """
 
-    _listeners: Dict[callable, callable] = {}
+    _listeners: Dict[callable, callable]
 
-    def __init__(self, maxlen: int = None):
+    def __init__(self, maxlen: int = None, timer_wheel: TimerWheel = None):
         """
         Initializes the queue
 
         Args:
             maxlen (int): If given the queue has a limited length and everything
                 beyond that length will be deleted (LOFI)
+            timer_wheel (TimerWheel): Optional; used for the timeouts of
+                :meth:`wait_for` instead of the event loop
         """
         self._content = collections.deque(maxlen=maxlen)
+        self._listeners = {}
+        self.timer_wheel = timer_wheel
 
     def clear(self):
         self._content.clear()
@@ -43,8 +49,16 @@ class PacketQueue:
         """
         self._listeners[packet_filter] = callback
 
+    def remove_listener(self, packet_filter: callable):
+        """Removes a listener, doesn't do anything when it doesn't exist"""
+        self._listeners.pop(packet_filter, None)
+
     async def wait_for(
-        self, packet_filter: Callable, new_only: bool = True, ignore: list = None
+        self,
+        packet_filter: Callable,
+        new_only: bool = True,
+        ignore: list = None,
+        timeout: float = None,
     ):
         """
         Waits for new packets (or finds old ones) and puts them through the
@@ -55,6 +69,10 @@ class PacketQueue:
             new_only (bool): If only new packets should be returned. If this is False
                 old packets may be returned if they pass the filter
             ignore (list): A list of packets to ignore
+            timeout (float): Optional; Seconds to wait before giving up
+
+        Raises:
+            asyncio.TimeoutError: No packet passed the filter within the timeout
         """
         ignore = ignore or []
         if not new_only:
@@ -62,14 +80,28 @@ class PacketQueue:
                 if item not in ignore and packet_filter(item):
                     return item
 
-        _new_content = asyncio.Event()
-        _data: Any = None
+        loop = asyncio.get_running_loop()
+        _result = loop.create_future()
 
         async def callback(item: Any):
-            nonlocal _data
-            _new_content.set()
-            _data = item
+            if not _result.done():
+                _result.set_result(item)
+
+        def on_timeout():
+            if not _result.done():
+                _result.set_exception(asyncio.TimeoutError())
+
+        handle = None
+        if timeout is not None:
+            if self.timer_wheel is not None:
+                handle = self.timer_wheel.call_later(timeout, on_timeout)
+            else:
+                handle = loop.call_later(timeout, on_timeout)
 
         await self.add_listener(packet_filter, callback)
-        await _new_content.wait()
-        return _data
+        try:
+            return await _result
+        finally:
+            self.remove_listener(packet_filter)
+            if handle is not None:
+                handle.cancel()
@@ -0,0 +1,507 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import asyncio
+import itertools
+import logging
+from typing import Callable, Dict, Iterable, List, Set, Tuple, Union
+
+from .cache import TTLCache
+from .connection import Connection
+from .enums import GameSettings
+from .eventbus import EventBus
+from .exceptions import AmongUsException
+from .game import Game, GameList
+from .index import LobbyIndex
+from .regions import regions as default_regions
+from .timers import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+# a lobby search by map, amount of impostors and chat language
+Query = Tuple[GameSettings.SearchMap, int, GameSettings.Keywords]
+
+
+class LobbyScanner:
+    """
+    Searches public lobbies in all regions at once
+
+    The scanner keeps lightweight connections (they never join a game) to every
+    region and sends the GetGameListV2 queries to all regions concurrently. Every
+    answer is stored per region and query in a :class:`TTLCache`, repeated queries
+    within the time to live are answered from the cache without any network traffic.
+
+    As the server's answers can't be matched to their request a connection only
+    handles one query at a time, use `connections_per_region` to run more queries
+    in parallel. Connections which were closed, e.g. by the server, are connected
+    again by the next query which uses them.
+
+    Example:
+        .. code-block:: python
+
+           async with LobbyScanner() as scanner:
+               result = await scanner.scan(
+                   LobbyScanner.combinations(impostors=[1, 2, 3])
+               )
+               for game in result.games:
+                   print(game.region, game.readable_code, game.playerCount)
+
+           scanner = LobbyScanner()
+
+           @scanner.event
+           async def on_lobby_changed(game, changes):
+               print(game.readable_code, changes)
+
+           await scanner.start()
+           scanner.watch()
+
+    Attributes:
+        regions (Dict[str, str]): The regions to scan, name -> host
+        connections (Dict[str, List[Connection]]): The connected connections by region
+        cache (TTLCache): The cached results, (region, mapId, impostors, language)
+            -> :class:`GameList`
+        timeout (float): Seconds to wait for an answer of a region
+        eventbus (EventBus): The eventbus shared by all connections of the scanner
+        lobbies (Dict[Tuple[str, int], Game]): The lobbies seen by the last polls,
+            keyed by region and :attr:`Game.code`
+        index (LobbyIndex): The same lobbies sorted for fast filtered queries
+        poll_interval (float): The current interval of :meth:`watch` in seconds
+    """
+
+    # the attributes compared for lobby_changed
+    TRACKED = ("playerCount", "mapId")
+
+    regions: Dict[str, str]
+    connections: Dict[str, List[Connection]]
+    cache: TTLCache
+    timeout: float
+    eventbus: EventBus
+    lobbies: Dict[Tuple[str, int], Game]
+    index: LobbyIndex
+    poll_interval: float
+
+    def __init__(
+        self,
+        name: str = "Scanner",
+        regions: Dict[str, str] = None,
+        ttl: float = 10.0,
+        port: int = 22023,
+        gameVersion: tuple = (2021, 3, 5),
+        timeout: float = 5.0,
+        connections_per_region: int = 1,
+        timer_wheel: TimerWheel = None,
+    ):
+        """
+        Creates the scanner, :meth:`start` connects to the regions
+
+        Args:
+            name (str): Optional; The name used in the Hello packet
+            regions (Dict[str, str]): Optional; The regions to scan, defaults to
+                :attr:`amongus.regions.regions`
+            ttl (float): Optional; Default time to live of cached results in seconds
+            port (int): Optional; Port of the servers
+            gameVersion (tuple): Optional; The version of the game running on the
+                servers
+            timeout (float): Optional; Seconds to wait for an answer of a region
+            connections_per_region (int): Optional; How many queries can run in
+                parallel per region
+            timer_wheel (TimerWheel): Optional; Timer wheel for the connections
+        """
+        self.name = name
+        self.regions = dict(regions if regions is not None else default_regions)
+        self.port = port
+        self.gameVersion = gameVersion
+        self.timeout = timeout
+        self.connections_per_region = connections_per_region
+        self.timer_wheel = timer_wheel
+        self.cache = TTLCache(ttl)
+        self.eventbus = EventBus()
+        self.connections = {}
+        self._idle: Dict[str, asyncio.Queue] = {}
+        self._pending: Dict[tuple, asyncio.Future] = {}
+        self.lobbies = {}
+        self.index = LobbyIndex()
+        self.poll_interval = None
+        self._watch_task = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def add_listener(self, event: str, func: Callable) -> None:
+        """
+        Adds a listener for the lobby events, see :meth:`poll`
+
+        Args:
+            event (str): The event to listen/subscribe to
+            func (Callable): The callback which will be run when the event happens
+
+        Raises:
+            TypeError: The callback is not a coroutine
+        """
+        if not asyncio.iscoroutinefunction(func):
+            raise TypeError("Listeners must be coroutines")
+
+        name = event if event is not None else func.__name__
+        if not name.startswith("on_"):
+            name = "on_" + name
+        self.eventbus.add_listener(name, func)
+
+    def remove_listener(self, func: Callable) -> None:
+        """Removes an event listener, doesn't do anything when it doesn't exist"""
+        self.eventbus.remove_listener(func)
+
+    def event(self, name: Union[str, Callable] = None) -> Callable:
+        """
+        Decorator for :meth:`LobbyScanner.add_listener`
+
+        Args:
+            name (str): Optional; The event name to listen on, if not given the
+                function name will be used
+        """
+
+        def decorator(func: Callable):
+            _name = name
+            if callable(_name):
+                _name = name.__name__
+                func = name
+            self.add_listener(_name, func)
+            return func
+
+        return decorator(name) if callable(name) else decorator
+
+    @staticmethod
+    def combinations(
+        maps: Iterable[GameSettings.SearchMap] = (GameSettings.SearchMap.All,),
+        impostors: Iterable[int] = (0,),
+        languages: Iterable[GameSettings.Keywords] = (GameSettings.Keywords.All,),
+    ) -> List[Query]:
+        """Returns every combination of the given filters as a list of queries"""
+        return list(itertools.product(maps, impostors, languages))
+
+    async def start(self) -> None:
+        """
+        Connects to all regions concurrently
+
+        Regions which can't be reached are logged and skipped, their queries return
+        no games
+        """
+        regions = list(self.regions.items())
+        connected = await asyncio.gather(
+            *(self._connect(region, host) for region, host in regions)
+        )
+        for (region, _), connections in zip(regions, connected):
+            if not connections:
+                logger.warning(f"Could not connect to region {region}")
+                continue
+            self.connections[region] = connections
+            self._idle[region] = asyncio.Queue()
+            for connection in connections:
+                self._idle[region].put_nowait(connection)
+
+    async def _connect(self, region: str, host: str) -> List[Connection]:
+        async def connect_one() -> Connection:
+            connection = Connection(self.eventbus, timer_wheel=self.timer_wheel)
+            connection.region = region
+            await connection.connect(self.name, host, self.port, self.gameVersion)
+            return connection
+
+        connections = await asyncio.gather(
+            *(connect_one() for _ in range(self.connections_per_region)),
+            return_exceptions=True,
+        )
+        result = []
+        for connection in connections:
+            if isinstance(connection, Exception):
+                logger.debug(f"Connecting to {region} failed: {connection!r}")
+            elif connection.closed:
+                logger.debug(f"Connecting to {region} failed: {connection.result!r}")
+            else:
+                result.append(connection)
+        return result
+
+    async def _reconnect(self, connection: Connection) -> bool:
+        """Replaces the transport of a connection which died, returns if it worked"""
+        logger.debug(f"Reconnecting to region {connection.region}")
+        try:
+            await connection.reconnect()
+        except Exception as e:
+            logger.debug(f"Reconnecting to {connection.region} failed: {e!r}")
+            return False
+        if connection.closed:
+            logger.warning(f"Could not reconnect to region {connection.region}")
+            return False
+        return True
+
+    async def stop(self) -> None:
+        """Stops watching and disconnects from all regions"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+        await asyncio.gather(
+            *(
+                connection.disconnect(False)
+                for connections in self.connections.values()
+                for connection in connections
+            ),
+            return_exceptions=True,
+        )
+        self.connections.clear()
+        self._idle.clear()
+
+    async def find_games(
+        self,
+        mapId: GameSettings.SearchMap = GameSettings.SearchMap.All,
+        impostors: int = 0,
+        language: GameSettings.Keywords = GameSettings.Keywords.All,
+        regions: Iterable[str] = None,
+        ttl: float = None,
+    ) -> GameList:
+        """
+        Returns the open lobbies of all regions matching the filters
+
+        Args:
+            mapId (GameSettings.SearchMap): The wanted map
+            impostors (int): Amount of impostors (0-3, 0 being Any)
+            language (GameSettings.Keywords): Which language the chat should be
+            regions (Iterable[str]): Optional; Only search these regions
+            ttl (float): Optional; Time to live of this query's results in seconds
+
+        Returns:
+            :class:`GameList` with the games of all regions, every game has its
+            :attr:`Game.region` set. The counts are summed over the regions
+
+        Raises:
+            AmongUsException: Amount of impostors is not between 0 and 3
+        """
+        return await self.scan([(mapId, impostors, language)], regions, ttl)
+
+    async def scan(
+        self,
+        queries: Iterable[Query],
+        regions: Iterable[str] = None,
+        ttl: float = None,
+        fresh: bool = False,
+    ) -> GameList:
+        """
+        Runs multiple queries on all regions concurrently and merges the results
+
+        Args:
+            queries (Iterable[Query]): (mapId, impostors, language) tuples,
+                see :meth:`combinations`
+            regions (Iterable[str]): Optional; Only search these regions
+            ttl (float): Optional; Time to live of these results in seconds
+            fresh (bool): Optional; Ignore cached results and ask the servers
+
+        Returns:
+            :class:`GameList` without duplicates. The counts are summed over the
+            regions, using the highest count of a region's queries
+
+        Raises:
+            AmongUsException: Amount of impostors is not between 0 and 3
+        """
+        result, _ = await self._scan(queries, regions, ttl, fresh)
+        return result
+
+    async def _scan(
+        self,
+        queries: Iterable[Query],
+        regions: Iterable[str] = None,
+        ttl: float = None,
+        fresh: bool = False,
+    ) -> Tuple[GameList, Set[str]]:
+        """Like :meth:`scan`, also returns the regions where a query failed"""
+        queries = list(queries)
+        for _, impostors, _ in queries:
+            if impostors not in range(0, 4):
+                raise AmongUsException("Amount of impostors has to be between 0 and 3!")
+        regions = [r.upper() for r in regions] if regions is not None else self.regions
+        failed = {region for region in regions if region not in self.connections}
+        keys = [
+            (region, *query)
+            for region in regions
+            if region in self.connections
+            for query in queries
+        ]
+        results = await asyncio.gather(*(self._query(key, ttl, fresh) for key in keys))
+
+        games = {}
+        counts: Dict[str, List[int]] = {}
+        for (region, *_), result in zip(keys, results):
+            if result is None:
+                failed.add(region)
+                continue
+            for game in result.games:
+                games.setdefault((region, game.code), game)
+            region_counts = counts.setdefault(region, [0, 0, 0])
+            for i, count in enumerate(
+                (result.skeld_count, result.mirahq_count, result.polus_count)
+            ):
+                region_counts[i] = max(region_counts[i], count)
+        result = GameList(
+            games=list(games.values()),
+            skeld_count=sum(c[0] for c in counts.values()),
+            mirahq_count=sum(c[1] for c in counts.values()),
+            polus_count=sum(c[2] for c in counts.values()),
+        )
+        return result, failed
+
+    async def poll(
+        self, queries: Iterable[Query] = None, regions: Iterable[str] = None
+    ) -> int:
+        """
+        Asks the servers for the current lobbies and updates :attr:`lobbies`
+
+        Dispatches `lobby_added` (game), `lobby_removed` (game) and `lobby_changed`
+        (game, changes) for the differences to the last poll, where changes maps the
+        changed attributes (see :attr:`TRACKED`) to (old, new). Lobbies of regions
+        which didn't answer are kept until the region answers again
+
+        Args:
+            queries (Iterable[Query]): Optional; The queries which make up the index,
+                defaults to every lobby
+            regions (Iterable[str]): Optional; Only poll these regions
+
+        Returns:
+            The amount of changes
+        """
+        queries = list(queries) if queries is not None else self.combinations()
+        result, failed = await self._scan(queries, regions, fresh=True)
+        polled = (
+            {r.upper() for r in regions} if regions is not None else set(self.regions)
+        )
+        polled -= failed
+
+        seen = set()
+        # the events are dispatched once the lobbies and the index are up to date
+        events = []
+        for game in result.games:
+            key = (game.region, game.code)
+            seen.add(key)
+            old = self.lobbies.get(key)
+            self.lobbies[key] = game
+            self.index.add(game)
+            if old is None:
+                events.append(("lobby_added", game))
+                continue
+            changed = {
+                attr: (getattr(old, attr, None), getattr(game, attr, None))
+                for attr in self.TRACKED
+                if getattr(old, attr, None) != getattr(game, attr, None)
+            }
+            if changed:
+                events.append(("lobby_changed", game, changed))
+        for key in [k for k in self.lobbies if k[0] in polled and k not in seen]:
+            game = self.lobbies.pop(key)
+            self.index.remove(game)
+            events.append(("lobby_removed", game))
+        for event, *args in events:
+            self.eventbus.dispatch(event, *args)
+        return len(events)
+
+    def watch(
+        self,
+        queries: Iterable[Query] = None,
+        regions: Iterable[str] = None,
+        min_interval: float = 1.0,
+        max_interval: float = 30.0,
+    ) -> asyncio.Task:
+        """
+        Keeps polling in the background, see :meth:`poll`
+
+        The poll interval adapts to the churn: it is halved while more than a fifth
+        of the lobbies change per poll and grows by half while less than one in
+        twenty changes, staying between min_interval and max_interval. The current
+        interval is :attr:`poll_interval`
+
+        Args:
+            queries (Iterable[Query]): Optional; See :meth:`poll`
+            regions (Iterable[str]): Optional; See :meth:`poll`
+            min_interval (float): Optional; The shortest interval in seconds
+            max_interval (float): Optional; The longest interval in seconds
+
+        Returns:
+            The polling task, it is cancelled by :meth:`stop`
+        """
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+        queries = list(queries) if queries is not None else None
+        self.poll_interval = min_interval
+        self._watch_task = asyncio.ensure_future(
+            self._watch(queries, regions, min_interval, max_interval)
+        )
+        return self._watch_task
+
+    async def _watch(
+        self,
+        queries: List[Query],
+        regions: Iterable[str],
+        min_interval: float,
+        max_interval: float,
+    ) -> None:
+        while True:
+            try:
+                changes = await self.poll(queries, regions)
+            except Exception as e:
+                logger.exception(e)
+            else:
+                churn = changes / max(len(self.lobbies), 1)
+                if churn > 0.2:
+                    self.poll_interval = max(min_interval, self.poll_interval / 2)
+                elif churn < 0.05:
+                    self.poll_interval = min(max_interval, self.poll_interval * 1.5)
+            await asyncio.sleep(self.poll_interval)
+
+    def cached(self, region: str, query: Query) -> GameList:
+        """Returns the cached result of a query or None if it expired"""
+        return self.cache.get((region.upper(), *query))
+
+    async def _query(
+        self, key: tuple, ttl: float = None, fresh: bool = False
+    ) -> GameList:
+        """Returns the result of one query in one region, None if it failed"""
+        result = self.cache.get(key) if not fresh else None
+        if result is not None:
+            return result
+        # the same query is already on its way, wait for its answer instead
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            result = await self._request(key)
+            if result is not None:
+                self.cache.set(key, result, ttl)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # only the waiters should see the exception
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    async def _request(self, key: tuple) -> GameList:
+        region, mapId, impostors, language = key
+        idle = self._idle[region]
+        connection = await idle.get()
+        try:
+            if connection.closed and not await self._reconnect(connection):
+                return None
+            result = await connection.request_game_list(
+                mapId, impostors, language, timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout searching games in region {region}")
+            return None
+        finally:
+            idle.put_nowait(connection)
+        return result
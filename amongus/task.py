@@ -3,7 +3,7 @@
 from typing import Tuple
 
 from .enums import TaskType
-from .helpers import readPacked
+from .helpers import createPacked, readPacked
 
 
 class Task:
@@ -19,6 +19,9 @@ class Task:
         _id, _data = readPacked(data)
         return cls(id=_id, complete=bool(_data[0])), _data[1:]
 
+    def serialize(self) -> bytes:
+        return createPacked(self.id) + bytes([self.complete])
+
     @property
     def type(self) -> TaskType:  # noqa: A003
         return TaskType(self.id)
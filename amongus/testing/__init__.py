@@ -0,0 +1,14 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Tools to run clients against a local server, without Among Us servers."""
+
+from .load import LoadGenerator, LoadReport
+from .server import FakePlayer, MockLobby, MockServer
+
+__all__ = [
+    "MockServer",
+    "MockLobby",
+    "FakePlayer",
+    "LoadGenerator",
+    "LoadReport",
+]
@@ -0,0 +1,369 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import asyncio
+import collections
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List
+
+from .server import FakePlayer, MockLobby, MockServer
+from ..client import Client
+from ..enums import RPCTag
+from ..exceptions import AmongUsException
+from ..game import Game
+from ..helpers import createPacked, createVector2
+from ..player import Player
+from ..pool import ClientPool
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("move", "chat", "meeting")
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Returns the p-th percentile (0-100) of the values using nearest rank"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+@dataclass
+class LoadReport:
+    """
+    The result of :meth:`LoadGenerator.run`
+
+    Attributes:
+        lobbies (int): The amount of lobbies, one client under test per lobby
+        players (int): The synthetic players per lobby
+        duration (float): Seconds the traffic was generated
+        sent (Dict[str, int]): Packets sent by the synthetic players, by kind
+        received (Dict[str, int]): Events handled by the clients, by kind
+        latencies (Dict[str, List[float]]): Seconds from sending a packet until
+            the client's event handler ran, by kind
+        cpu_time (float): CPU seconds used by the process while generating traffic,
+            this includes the mock server
+        max_rss (int): Peak resident memory of the process in bytes, 0 if unknown
+        client_memory (int): Approximated memory of all clients in bytes
+    """
+
+    lobbies: int
+    players: int
+    duration: float = 0.0
+    sent: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(KINDS, 0))
+    received: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(KINDS, 0))
+    latencies: Dict[str, List[float]] = field(
+        default_factory=lambda: {kind: [] for kind in KINDS}
+    )
+    cpu_time: float = 0.0
+    max_rss: int = 0
+    client_memory: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """Events handled per second by all clients"""
+        return sum(self.received.values()) / self.duration if self.duration else 0.0
+
+    @property
+    def cpu_percent(self) -> float:
+        """CPU usage in percent of one core"""
+        return 100 * self.cpu_time / self.duration if self.duration else 0.0
+
+    def latency(self, kind: str = None, p: float = 50) -> float:
+        """
+        Returns a latency percentile in seconds
+
+        Args:
+            kind (str): Optional; "move", "chat" or "meeting", all kinds if not given
+            p (float): Optional; The percentile, between 0 and 100
+        """
+        if kind is not None:
+            return percentile(self.latencies[kind], p)
+        return percentile([t for v in self.latencies.values() for t in v], p)
+
+    def format(self) -> str:  # noqa: A003
+        """Returns the report as a human readable table"""
+        lines = [
+            f"{self.lobbies} lobbies x {self.players} players, {self.duration:.1f}s",
+            f"{'kind':>8} {'sent/s':>10} {'handled/s':>10} "
+            f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}",
+        ]
+        for kind in (*KINDS, None):
+            sent = sum(self.sent.values()) if kind is None else self.sent[kind]
+            received = (
+                sum(self.received.values()) if kind is None else self.received[kind]
+            )
+            lines.append(
+                f"{kind or 'total':>8} {sent / self.duration:>10.0f} "
+                f"{received / self.duration:>10.0f} "
+                + " ".join(
+                    f"{self.latency(kind, p) * 1000:>8.2f}" for p in (50, 90, 99, 100)
+                )
+            )
+        lines.append(
+            f"cpu {self.cpu_percent:.0f}%, max rss {self.max_rss / 2 ** 20:.1f} MiB, "
+            f"clients {self.client_memory / 2 ** 10:.0f} KiB"
+        )
+        return "\n".join(lines)
+
+
+class _LobbyLoad:
+    """Drives the synthetic players of one lobby and matches the client's events"""
+
+    def __init__(self, lobby: MockLobby, client: Client, report: LoadReport):
+        self.lobby = lobby
+        self.client = client
+        self.report = report
+        self.fakes: List[FakePlayer] = []
+        self.players_ready = asyncio.Event()
+        # movement is matched by the sent position, because lost unreliable packets
+        # never arrive; everything older than a matched position was lost
+        self.moves: Dict[int, Dict[bytes, float]] = collections.defaultdict(dict)
+        self.chats: Dict[str, float] = {}
+        self.meetings: Dict[int, Deque[float]] = collections.defaultdict(
+            collections.deque
+        )
+        self.budget = dict.fromkeys(KINDS, 0.0)
+        self._next = dict.fromkeys(KINDS, 0)
+        self._chat_id = 0
+
+        client.add_listener("players_update", self._on_players_update)
+        client.add_listener("player_move", self._on_player_move)
+        client.add_listener("chat", self._on_chat)
+        client.add_listener("meeting_start", self._on_meeting_start)
+
+    def _handled(self, kind: str, sent_at: float) -> None:
+        self.report.received[kind] += 1
+        self.report.latencies[kind].append(asyncio.get_running_loop().time() - sent_at)
+
+    async def _on_players_update(self, players: List[Player]) -> None:
+        if len(players) > len(self.fakes):
+            self.players_ready.set()
+
+    async def _on_player_move(self, player: Player) -> None:
+        sent = self.moves.get(player.id)
+        key = createVector2(*player.position)
+        if not sent or key not in sent:
+            return
+        while sent:
+            position, sent_at = next(iter(sent.items()))
+            del sent[position]
+            if position == key:
+                self._handled("move", sent_at)
+                return
+
+    async def _on_chat(self, message: str, sender: Player) -> None:
+        sent_at = self.chats.pop(message, None)
+        if sent_at is not None:
+            self._handled("chat", sent_at)
+
+    async def _on_meeting_start(self, player: Player) -> None:
+        sent = self.meetings.get(getattr(player, "id", None))
+        if sent:
+            self._handled("meeting", sent.popleft())
+
+    def _pick(self, kind: str) -> FakePlayer:
+        fake = self.fakes[self._next[kind] % len(self.fakes)]
+        self._next[kind] += 1
+        return fake
+
+    def tick(self, rates: Dict[str, float], dt: float, now: float, rng) -> None:
+        """Sends the packets which are due after dt seconds"""
+        for kind, rate in rates.items():
+            self.budget[kind] += rate * len(self.fakes) * dt
+            amount, self.budget[kind] = divmod(self.budget[kind], 1)
+            for _ in range(int(amount)):
+                getattr(self, "_send_" + kind)(self._pick(kind), now, rng)
+                self.report.sent[kind] += 1
+
+    def _send_move(self, fake: FakePlayer, now: float, rng) -> None:
+        x, y = fake.player.position or (0, 0)
+        position = (
+            min(max(x + rng.uniform(-0.5, 0.5), -39), 39),
+            min(max(y + rng.uniform(-0.5, 0.5), -39), 39),
+        )
+        sent = self.moves[fake.player.id]
+        key = createVector2(*position)
+        sent.pop(key, None)
+        sent[key] = now
+        fake.move(position, (position[0] - x, position[1] - y))
+
+    def _send_chat(self, fake: FakePlayer, now: float, rng) -> None:
+        self._chat_id += 1
+        text = f"load {self._chat_id}"
+        self.chats[text] = now
+        fake.chat(text)
+
+    def _send_meeting(self, fake: FakePlayer, now: float, rng) -> None:
+        self.meetings[fake.player.id].append(now)
+        fake.rpc(RPCTag.StartMeeting, createPacked(fake.player.id))
+
+
+class LoadGenerator:
+    """
+    Measures how much traffic clients can absorb, using a local :class:`MockServer`
+
+    Every lobby gets synthetic players (:class:`FakePlayer`) and one client under
+    test, all clients run in one :class:`ClientPool`. The players send movement,
+    chat and meeting RPCs at the configured rates (per player and second). The
+    latency of a packet is the time from the server sending it until the client's
+    event handler for it (``player_move``, ``chat`` and ``meeting_start``) runs.
+
+    Example:
+        .. code-block:: python
+
+           generator = LoadGenerator(lobbies=20, players=14, move_rate=10)
+           report = asyncio.run(generator.run(duration=30))
+           print(report.format())
+
+    Attributes:
+        lobbies (int): The amount of lobbies and clients under test
+        players (int): The synthetic players per lobby
+        rates (Dict[str, float]): Packets per player and second, by kind
+        tick (float): Seconds between two traffic bursts
+        server (MockServer): The server, available while :meth:`run` is running
+        pool (ClientPool): The clients under test, available while :meth:`run` is
+            running
+    """
+
+    lobbies: int
+    players: int
+    rates: Dict[str, float]
+    tick: float
+    server: MockServer = None
+    pool: ClientPool = None
+
+    def __init__(
+        self,
+        lobbies: int = 1,
+        players: int = 14,
+        move_rate: float = 10.0,
+        chat_rate: float = 0.2,
+        meeting_rate: float = 0.01,
+        tick: float = 0.05,
+        resend_limit: int = None,
+        client_kwargs: dict = None,
+        **server_kwargs,
+    ):
+        """
+        Configures the load, nothing is started yet
+
+        Args:
+            lobbies (int): Optional; The amount of lobbies, one client each
+            players (int): Optional; The synthetic players per lobby, 1 to 14 so the
+                lobby holds at most 15 players including the client
+            move_rate (float): Optional; Movement updates per player and second
+            chat_rate (float): Optional; Chat messages per player and second
+            meeting_rate (float): Optional; StartMeeting RPCs per player and second
+            tick (float): Optional; Seconds between two traffic bursts
+            resend_limit (int): Optional; Sets :attr:`Connection.resendLimit` of the
+                clients, needed to join when the server simulates loss
+            client_kwargs (dict): Optional; More arguments for :class:`Client`
+            server_kwargs: Passed to :class:`MockServer`, e.g. loss and latency
+
+        Raises:
+            AmongUsException: The amount of players or lobbies is invalid
+        """
+        if not 1 <= players <= 14:
+            raise AmongUsException("Amount of players has to be between 1 and 14!")
+        if lobbies < 1:
+            raise AmongUsException("At least one lobby is needed!")
+        self.lobbies = lobbies
+        self.players = players
+        self.rates = {"move": move_rate, "chat": chat_rate, "meeting": meeting_rate}
+        self.tick = tick
+        self.resend_limit = resend_limit
+        self.client_kwargs = client_kwargs or {}
+        self.server_kwargs = server_kwargs
+
+    async def run(self, duration: float = 10.0, timeout: float = 30.0) -> LoadReport:
+        """
+        Starts the server and the clients, generates traffic and reports the results
+
+        Args:
+            duration (float): Optional; Seconds to generate traffic for
+            timeout (float): Optional; Seconds to wait for all clients to join
+
+        Raises:
+            asyncio.TimeoutError: The clients didn't join in time
+        """
+        report = LoadReport(self.lobbies, self.players)
+        self.server = MockServer(**self.server_kwargs)
+        self.pool = ClientPool()
+        await self.server.start()
+        try:
+            loads = self._setup(report)
+            task = asyncio.ensure_future(self.pool.start())
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(load.players_ready.wait() for load in loads)),
+                    timeout,
+                )
+                await self._generate(loads, report, duration)
+                report.client_memory = self.pool.memory_summary()[0]
+            finally:
+                await self.pool.stop()
+                await asyncio.gather(task, return_exceptions=True)
+        finally:
+            await self.server.stop()
+        if resource is not None:
+            # kilobytes on linux
+            report.max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return report
+
+    def _setup(self, report: LoadReport) -> List[_LobbyLoad]:
+        loads = []
+        for i in range(self.lobbies):
+            settings = Game.with_default_settings()
+            settings.maxPlayers = self.players + 1
+            lobby = self.server.add_lobby(settings=settings, name=f"Load{i}")
+            client = self.pool.create(
+                f"Client{i}",
+                client_kwargs=self.client_kwargs,
+                custom_server=self.server.address,
+            )
+            if self.resend_limit is not None:
+                client.connection.resendLimit = self.resend_limit
+                client.connection.resendTimeout = self.server.resendInterval
+            load = _LobbyLoad(lobby, client, report)
+            load.fakes = [
+                lobby.add_player(f"Player{j}", color=j % 12)
+                for j in range(self.players)
+            ]
+            client.add_listener("ready", self._joiner(client, lobby.code))
+            loads.append(load)
+        return loads
+
+    @staticmethod
+    def _joiner(client: Client, code: str):
+        async def _join():
+            await client.join_lobby(code)
+
+        return _join
+
+    async def _generate(
+        self, loads: List[_LobbyLoad], report: LoadReport, duration: float
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        rng = self.server._random
+        cpu, start = time.process_time(), loop.time()
+        last = start
+        while True:
+            await asyncio.sleep(self.tick)
+            now = loop.time()
+            if now - start >= duration:
+                report.duration = now - start
+                break
+            for load in loads:
+                load.tick(self.rates, now - last, now, rng)
+            last = now
+        # give the last packets time to arrive, they still count
+        await asyncio.sleep(max(self.tick, 0.2) + self.server.latency)
+        report.cpu_time = time.process_time() - cpu
@@ -0,0 +1,865 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import asyncio
+import collections
+import logging
+import random
+import socket
+import struct
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterator, List, Tuple
+
+from ..enums import (
+    AlterGameTag,
+    DisconnectReason,
+    GameDataTag,
+    GameOverReason,
+    GameSettings,
+    MatchMakingTag,
+    PacketType,
+    RPCTag,
+    SpawnTag,
+)
+from ..game import Game
+from ..helpers import (
+    alphabet,
+    createPacked,
+    createVector2,
+    dotdict,
+    gameNameToInt,
+    readMessage,
+    readPacked,
+    readString,
+    writeString,
+)
+from ..player import Player
+
+logger = logging.getLogger(__name__)
+
+Address = Tuple[str, int]
+
+
+def message(tag: int, payload: bytes) -> bytes:
+    """Frames a Hazel message as [length][tag][payload]"""
+    return struct.pack("<h", len(payload)) + bytes([tag]) + payload
+
+
+def rpc(net_id: int, tag: RPCTag, payload: bytes) -> bytes:
+    """Returns a RPC GameData message sent by the object with the net id"""
+    return message(GameDataTag.RpcFlag, createPacked(net_id) + bytes([tag]) + payload)
+
+
+def _messages(data: bytes) -> Iterator[Tuple[int, bytes]]:
+    while len(data) >= 3:
+        tag, payload, data = readMessage(data)
+        yield tag, payload
+
+
+@dataclass
+class _RemoteClient:
+    """A real client connected to the server, e.g. a :class:`Connection`"""
+
+    address: Address
+    client_id: int
+    name: str = ""
+    lobby: "MockLobby" = None
+    player: Player = None
+    last_id: int = 0
+    last_seen: float = 0.0
+    pending: Dict[int, asyncio.TimerHandle] = field(default_factory=dict)
+    received: Deque[int] = field(default_factory=lambda: collections.deque(maxlen=256))
+
+
+class FakePlayer:
+    """
+    A scripted player inside of a :class:`MockLobby`, its actions are sent to the
+    real clients like the host would relay them
+
+    Attributes:
+        lobby (MockLobby): The lobby of the player
+        client_id (int): The client id of the player
+        player (Player): The spawned player, including its id and net ids
+    """
+
+    lobby: "MockLobby"
+    client_id: int
+    player: Player
+
+    def __init__(self, lobby: "MockLobby", client_id: int, player: Player):
+        self.lobby = lobby
+        self.client_id = client_id
+        self.player = player
+        self._sequence_id = 0
+
+    def __repr__(self):
+        return f"<FakePlayer id={self.player.id} name={self.player.name!r}>"
+
+    def move(
+        self, position: Tuple[float, float], velocity: Tuple[float, float] = (0, 0)
+    ) -> None:
+        """Sends an unreliable movement update"""
+        self._sequence_id = (self._sequence_id + 1) & 0x7FFF
+        self.player.position, self.player.velocity = position, velocity
+        self.lobby.broadcast(
+            message(
+                GameDataTag.DataFlag,
+                createPacked(self.player.net_ids.network)
+                + struct.pack("<h", self._sequence_id)
+                + createVector2(*position)
+                + createVector2(*velocity),
+            ),
+            reliable=False,
+        )
+
+    def chat(self, text: str) -> None:
+        """Sends a chat message"""
+        self.rpc(RPCTag.SendChat, writeString(text))
+
+    def set_name(self, name: str) -> None:
+        self.player.name = name
+        self.rpc(RPCTag.SetName, writeString(name))
+
+    def set_color(self, color: int) -> None:
+        self.player.color = color
+        self.rpc(RPCTag.SetColor, bytes([color]))
+
+    def rpc(self, tag: RPCTag, payload: bytes, reliable: bool = True) -> None:
+        """
+        Sends any RPC from the PlayerControl of this player
+
+        Args:
+            tag (RPCTag): The tag of the RPC
+            payload (bytes): The already serialized RPC data
+            reliable (bool): Optional; Send it reliably
+        """
+        self.lobby.broadcast(
+            rpc(self.player.net_ids.control, tag, payload), reliable=reliable
+        )
+
+    def leave(self) -> None:
+        """Despawns the player and removes it from the lobby"""
+        self.lobby.remove_player(self)
+
+
+class MockLobby:
+    """
+    A lobby of a :class:`MockServer`, the server is its host
+
+    The server spawns the GameData and a PlayerControl for every client which sends
+    a SceneChange, answers CheckName/CheckColor and relays the GameData of the
+    clients to each other
+
+    Attributes:
+        server (MockServer): The server of the lobby
+        code (str): The lobby code
+        game_id (int): The code as int, like in the packets
+        name (str): The name shown in the game list
+        settings (Game): The settings which are sent with SyncSettings
+        host_id (int): The client id of the server acting as host
+        clients (Dict[int, _RemoteClient]): The real clients, by client id
+        fake_players (Dict[int, FakePlayer]): The scripted players, by client id
+        players (Dict[int, Player]): All spawned players, by player id
+        public (bool): If the lobby is public, sent with AlterGame on join
+        started (bool): If the game is running
+    """
+
+    server: "MockServer"
+    code: str
+    game_id: int
+    name: str
+    settings: Game
+    host_id: int
+    public: bool = True
+    started: bool = False
+
+    def __init__(self, server: "MockServer", code: str, settings: Game, name: str):
+        self.server = server
+        self.code = code.upper()
+        self.game_id = gameNameToInt(self.code)
+        self.name = name
+        self.settings = settings
+        self.host_id = server._next_client_id()
+        self.clients: Dict[int, _RemoteClient] = {}
+        self.fake_players: Dict[int, FakePlayer] = {}
+        self.players: Dict[int, Player] = {}
+        self._next_net_id = 1
+        self._gamedata_net_id = self._net_id()
+        self._changed = asyncio.Event()
+
+    def __repr__(self):
+        return f"<MockLobby code={self.code} players={len(self.players)}>"
+
+    @property
+    def player_count(self) -> int:
+        return len(self.clients) + len(self.fake_players)
+
+    def _net_id(self) -> int:
+        net_id = self._next_net_id
+        self._next_net_id += 1
+        return net_id
+
+    def _spawned(self) -> Iterator[_RemoteClient]:
+        """The clients which sent a SceneChange and know the spawned objects"""
+        return (c for c in list(self.clients.values()) if c.player is not None)
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_for_clients(self, amount: int, timeout: float = None) -> None:
+        """
+        Waits until the amount of real clients have spawned in the lobby
+
+        Raises:
+            asyncio.TimeoutError: Not enough clients joined in time
+        """
+
+        async def _wait():
+            while sum(1 for _ in self._spawned()) < amount:
+                await self._changed.wait()
+
+        await asyncio.wait_for(_wait(), timeout)
+
+    def broadcast(
+        self, data: bytes, reliable: bool = True, exclude: _RemoteClient = None
+    ) -> None:
+        """
+        Sends GameData messages to every spawned client
+
+        Args:
+            data (bytes): The framed GameData messages, see :func:`message`
+            reliable (bool): Optional; Send it reliably
+            exclude (_RemoteClient): Optional; Don't send it to this client
+        """
+        payload = message(
+            MatchMakingTag.GameData, struct.pack("<I", self.game_id) + data
+        )
+        for client in self._spawned():
+            if client is not exclude:
+                self.server._send(client, payload, reliable)
+
+    def sync_settings(self) -> None:
+        """Sends :attr:`settings` to every client"""
+        data = self.settings.serialize()
+        self.broadcast(
+            rpc(
+                self._gamedata_net_id,
+                RPCTag.SyncSettings,
+                createPacked(len(data)) + data,
+            )
+        )
+
+    def add_player(
+        self, name: str, color: int = 0, hat: int = 0, pet: int = 0, skin: int = 0
+    ) -> FakePlayer:
+        """
+        Spawns a scripted player, the clients receive it like a player who joined
+
+        Returns:
+            The player, use it to send movement, chat and other RPCs
+        """
+        client_id = self.server._next_client_id()
+        player = self._spawn_player(client_id, name, color, hat, pet, skin)
+        fake = self.fake_players[client_id] = FakePlayer(self, client_id, player)
+        self.broadcast(
+            self._player_control(player, new=True)
+            + rpc(player.net_ids.control, RPCTag.SetName, writeString(name))
+            + rpc(player.net_ids.control, RPCTag.SetColor, bytes([color]))
+        )
+        self._notify()
+        return fake
+
+    def remove_player(self, fake: FakePlayer) -> None:
+        if self.fake_players.pop(fake.client_id, None) is not None:
+            self._despawn(fake.player)
+
+    def start_game(self) -> None:
+        """Sends StartGame, the clients answer with Ready"""
+        self.started = True
+        self.server._send_all(
+            self, message(MatchMakingTag.StartGame, struct.pack("<I", self.game_id))
+        )
+
+    def end_game(self, reason: GameOverReason = GameOverReason.HumansByVote) -> None:
+        """Sends EndGame, the clients have to join the lobby again afterwards"""
+        self.started = False
+        self.server._send_all(
+            self,
+            message(
+                MatchMakingTag.EndGame,
+                struct.pack("<I", self.game_id) + bytes([reason, 0]),
+            ),
+        )
+
+    def _spawn_player(
+        self,
+        client_id: int,
+        name: str,
+        color: int = 0,
+        hat: int = 0,
+        pet: int = 0,
+        skin: int = 0,
+    ) -> Player:
+        player = Player()
+        player.id = min(set(range(len(self.players) + 1)) - set(self.players))
+        player.client_id = client_id
+        player.name, player.color, player.hat, player.pet, player.skin = (
+            name,
+            color,
+            hat,
+            pet,
+            skin,
+        )
+        player.tasks = []
+        player.net_ids = dotdict(
+            control=self._net_id(), physics=self._net_id(), network=self._net_id()
+        )
+        self.players[player.id] = player
+        return player
+
+    def _despawn(self, player: Player) -> None:
+        self.players.pop(player.id, None)
+        self.broadcast(
+            b"".join(
+                message(GameDataTag.DespawnFlag, createPacked(net_id))
+                for net_id in player.net_ids.values()
+            )
+        )
+        self._notify()
+
+    def _player_control(self, player: Player, new: bool = False) -> bytes:
+        position = player.position or (0, 0)
+        components = (
+            createPacked(player.net_ids.control)
+            + message(1, bytes([new, player.id]))
+            + createPacked(player.net_ids.physics)
+            + message(1, b"")
+            + createPacked(player.net_ids.network)
+            + message(1, struct.pack("<h", 0) + createVector2(*position) + bytes(4))
+        )
+        return message(
+            GameDataTag.SpawnFlag,
+            createPacked(SpawnTag.PlayerControl)
+            + createPacked(player.client_id)
+            + bytes([1])
+            + createPacked(3)
+            + components,
+        )
+
+    def _game_data(self) -> bytes:
+        players = [self.players[i] for i in sorted(self.players)]
+        data = createPacked(len(players)) + b"".join(p.serialize() for p in players)
+        return message(
+            GameDataTag.SpawnFlag,
+            createPacked(SpawnTag.GameData)
+            + createPacked(self.host_id)
+            + bytes([0])
+            + createPacked(1)
+            + createPacked(self._gamedata_net_id)
+            + message(1, data),
+        )
+
+    def _join(self, client: _RemoteClient) -> None:
+        if client.lobby is not None and client.lobby is not self:
+            client.lobby._leave(client)
+        client.lobby = self
+        self.clients[client.client_id] = client
+        others = [
+            i for i in (*self.clients, *self.fake_players) if i != client.client_id
+        ]
+        self.server._send(
+            client,
+            message(
+                MatchMakingTag.JoinedGame,
+                struct.pack("<III", self.game_id, client.client_id, self.host_id)
+                + createPacked(len(others))
+                + b"".join(createPacked(i) for i in others),
+            )
+            + message(
+                MatchMakingTag.AlterGame,
+                struct.pack("<I", self.game_id)
+                + bytes([AlterGameTag.ChangePrivacy, self.public]),
+            ),
+        )
+
+    def _leave(self, client: _RemoteClient) -> None:
+        self.clients.pop(client.client_id, None)
+        client.lobby = None
+        if client.player is not None:
+            player, client.player = client.player, None
+            self._despawn(player)
+
+    def _scene_change(self, client: _RemoteClient) -> None:
+        """Spawns the player of the client and sends it everything spawned so far"""
+        new = client.player is None
+        if new:
+            client.player = self._spawn_player(client.client_id, client.name)
+        settings = self.settings.serialize()
+        self.server._send(
+            client,
+            message(
+                MatchMakingTag.GameData,
+                struct.pack("<I", self.game_id)
+                + self._game_data()
+                + b"".join(
+                    self._player_control(self.players[i]) for i in sorted(self.players)
+                )
+                + rpc(
+                    self._gamedata_net_id,
+                    RPCTag.SyncSettings,
+                    createPacked(len(settings)) + settings,
+                ),
+            ),
+        )
+        if new:
+            player = client.player
+            self.broadcast(
+                self._player_control(player, new=True)
+                + rpc(player.net_ids.control, RPCTag.SetName, writeString(player.name)),
+                exclude=client,
+            )
+        self._notify()
+
+    def _host_rpc(self, client: _RemoteClient, payload: bytes) -> None:
+        """Answers the RPCs only the host handles"""
+        net_id, data = readPacked(payload)
+        player = client.player
+        if player is None or net_id != player.net_ids.control:
+            return
+        if data[0] == RPCTag.CheckName:
+            player.name, _ = readString(data[1:])
+            self.broadcast(rpc(net_id, RPCTag.SetName, writeString(player.name)))
+        elif data[0] == RPCTag.CheckColor:
+            player.color = data[1]
+            self.broadcast(rpc(net_id, RPCTag.SetColor, bytes([player.color])))
+
+    def _on_game_data(self, client: _RemoteClient, payload: bytes, reliable: bool):
+        relay = []
+        for tag, data in _messages(payload[4:]):
+            if tag == GameDataTag.SceneChangeFlag:
+                self._scene_change(client)
+                continue
+            if tag == GameDataTag.ReadyFlag:
+                continue
+            if tag == GameDataTag.RpcFlag and client.player is not None:
+                net_id, rest = readPacked(data)
+                if net_id == client.player.net_ids.control and len(rest) > 1:
+                    attribute = _COSMETICS.get(rest[0])
+                    if attribute is not None:
+                        setattr(client.player, attribute, rest[1])
+            relay.append(message(tag, data))
+        if relay:
+            self.broadcast(b"".join(relay), reliable, exclude=client)
+
+    def _on_game_data_to(self, client: _RemoteClient, payload: bytes, reliable: bool):
+        target, data = readPacked(payload[4:])
+        if target == self.host_id:
+            for tag, _data in _messages(data):
+                if tag == GameDataTag.RpcFlag:
+                    self._host_rpc(client, _data)
+        elif target in self.clients:
+            self.server._send(
+                self.clients[target],
+                message(MatchMakingTag.GameDataTo, payload),
+                reliable,
+            )
+
+
+_COSMETICS = {
+    RPCTag.SetColor: "color",
+    RPCTag.SetHat: "hat",
+    RPCTag.SetPet: "pet",
+    RPCTag.SetSkin: "skin",
+}
+
+
+class _ServerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server: "MockServer"):
+        self.server = server
+
+    def datagram_received(self, data: bytes, addr: Address) -> None:
+        self.server._datagram_received(data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        logger.debug(f"Mock server socket error: {exc!r}")
+
+
+class MockServer:
+    """
+    A local server which speaks enough of the protocol to test clients end to end
+
+    It handles Hello, acks, pings and disconnects, JoinGame/JoinedGame, redirects
+    to another mock server, GetGameListV2 and acts as the host of its lobbies (see
+    :class:`MockLobby`). Scripted players (:class:`FakePlayer`) generate traffic
+    like real players would. Packet loss and latency are simulated in both
+    directions, reliable packets of the server are resent until they are acked
+
+    Example:
+        .. code-block:: python
+
+           async with MockServer(loss=0.05, latency=0.02) as server:
+               lobby = server.add_lobby("ABCDEF")
+               bot = lobby.add_player("Bot")
+
+               client = amongus.Client("Test")
+
+               @client.event
+               async def on_ready():
+                   await client.join_lobby("ABCDEF")
+
+               task = asyncio.ensure_future(client.start(custom_server=server.address))
+               await lobby.wait_for_clients(1, timeout=5)
+               bot.chat("Hello!")
+
+    Attributes:
+        host (str): The IPv4 address the server is bound to
+        port (int): The port, a random one is used if it was 0
+        loss (float): Probability that a datagram is dropped, in both directions
+        latency (float): Seconds every datagram is delayed, in both directions
+        jitter (float): Up to this many seconds are added to the latency
+        redirect (MockServer): Joins of unknown lobbies are redirected to this
+            server, which makes this one the matchmaker
+        lobbies (Dict[str, MockLobby]): The lobbies by code
+        resendInterval (int): Milliseconds until an unacked packet is resent
+        resendLimit (int): How often a packet is resent
+        clientTimeout (int): Milliseconds until a silent client is removed
+        datagrams_in (int): Received datagrams, including dropped ones
+        datagrams_out (int): Sent datagrams, including dropped ones
+        dropped (int): Datagrams dropped by the simulated loss
+    """
+
+    host: str
+    port: int
+    loss: float
+    latency: float
+    jitter: float
+    redirect: "MockServer"
+    resendInterval: int = 200
+    resendLimit: int = 10
+    clientTimeout: int = 10000
+    transport: asyncio.DatagramTransport = None
+    datagrams_in: int = 0
+    datagrams_out: int = 0
+    dropped: int = 0
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        loss: float = 0.0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        redirect: "MockServer" = None,
+        seed: int = None,
+    ):
+        """
+        Creates the server, it listens once :meth:`start` is called
+
+        Args:
+            host (str): Optional; The IPv4 address to bind to
+            port (int): Optional; The port to bind to, 0 for a random one
+            loss (float): Optional; Probability that a datagram is dropped
+            latency (float): Optional; Seconds every datagram is delayed
+            jitter (float): Optional; Up to this many seconds are added to the latency
+            redirect (MockServer): Optional; The game server for unknown lobbies
+            seed (int): Optional; Seed for the simulated loss and jitter
+        """
+        self.host = host
+        self.port = port
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.redirect = redirect
+        self.lobbies: Dict[str, MockLobby] = {}
+        self._games: Dict[int, MockLobby] = {}
+        self._clients: Dict[Address, _RemoteClient] = {}
+        self._random = random.Random(seed)
+        self._client_id = 0
+        self._sweep_handle: asyncio.TimerHandle = None
+
+    @property
+    def address(self) -> str:
+        """host:port, to be used as custom_server of :meth:`Client.start`"""
+        return f"{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: _ServerProtocol(self), local_addr=(self.host, self.port)
+        )
+        self.port = self.transport.get_extra_info("sockname")[1]
+        self._sweep_handle = loop.call_later(1, self._sweep)
+
+    async def stop(self) -> None:
+        """Disconnects every client and closes the socket"""
+        for client in list(self._clients.values()):
+            self._send_raw(
+                client.address,
+                bytes([PacketType.Disconnect])
+                + message(0, bytes([1, DisconnectReason.ServerRequest])),
+            )
+            self._remove(client)
+        if self._sweep_handle is not None:
+            self._sweep_handle.cancel()
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    async def __aenter__(self) -> "MockServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.stop()
+
+    def add_lobby(
+        self, code: str = None, settings: Game = None, name: str = "Mock"
+    ) -> MockLobby:
+        """
+        Creates a lobby which can be joined and is listed in the game list
+
+        Args:
+            code (str): Optional; The six letter lobby code, random if not given
+            settings (Game): Optional; The settings, defaults to
+                :meth:`Game.with_default_settings`
+            name (str): Optional; The name shown in the game list
+        """
+        if code is None:
+            code = "".join(self._random.choice(alphabet) for _ in range(6))
+        lobby = MockLobby(self, code, settings or Game.with_default_settings(), name)
+        self.lobbies[lobby.code] = lobby
+        self._games[lobby.game_id] = lobby
+        return lobby
+
+    def remove_lobby(self, code: str) -> None:
+        lobby = self.lobbies.pop(code.upper())
+        del self._games[lobby.game_id]
+        for client in list(lobby.clients.values()):
+            lobby._leave(client)
+
+    def _next_client_id(self) -> int:
+        self._client_id += 1
+        return self._client_id
+
+    def _delay(self) -> float:
+        return self.latency + (
+            self._random.uniform(0, self.jitter) if self.jitter else 0
+        )
+
+    def _datagram_received(self, data: bytes, address: Address) -> None:
+        self.datagrams_in += 1
+        if self.loss and self._random.random() < self.loss:
+            self.dropped += 1
+            return
+        if self.latency or self.jitter:
+            asyncio.get_running_loop().call_later(
+                self._delay(), self._handle, data, address
+            )
+        else:
+            self._handle(data, address)
+
+    def _send_raw(self, address: Address, data: bytes) -> None:
+        self.datagrams_out += 1
+        if self.transport is None:
+            return
+        if self.loss and self._random.random() < self.loss:
+            self.dropped += 1
+            return
+        if self.latency or self.jitter:
+            asyncio.get_running_loop().call_later(
+                self._delay(), self._sendto, data, address
+            )
+        else:
+            self.transport.sendto(data, address)
+
+    def _sendto(self, data: bytes, address: Address) -> None:
+        if self.transport is not None:
+            self.transport.sendto(data, address)
+
+    def _send(self, client: _RemoteClient, data: bytes, reliable: bool = True) -> None:
+        """Sends framed messages, reliable ones are resent until they're acked"""
+        if not reliable:
+            self._send_raw(client.address, bytes([PacketType.Unreliable]) + data)
+            return
+        client.last_id = client.last_id % 0x7FFF + 1
+        datagram = (
+            bytes([PacketType.Reliable]) + struct.pack(">h", client.last_id) + data
+        )
+        self._send_raw(client.address, datagram)
+        self._schedule_resend(client, client.last_id, datagram, self.resendLimit)
+
+    def _send_all(self, lobby: MockLobby, data: bytes) -> None:
+        for client in list(lobby.clients.values()):
+            self._send(client, data)
+
+    def _schedule_resend(
+        self, client: _RemoteClient, reliable_id: int, datagram: bytes, left: int
+    ) -> None:
+        if left <= 0:
+            client.pending.pop(reliable_id, None)
+            return
+
+        def _resend():
+            if client.address not in self._clients:
+                return
+            self._send_raw(client.address, datagram)
+            self._schedule_resend(client, reliable_id, datagram, left - 1)
+
+        client.pending[reliable_id] = asyncio.get_running_loop().call_later(
+            self.resendInterval / 1000, _resend
+        )
+
+    def _ack(self, address: Address, reliable_id: bytes) -> None:
+        self._send_raw(
+            address, bytes([PacketType.Acknowledgement]) + reliable_id + b"\xff"
+        )
+
+    def _handle(self, data: bytes, address: Address) -> None:
+        if not data:
+            return
+        client = self._clients.get(address)
+        tag = data[0]
+        if tag == PacketType.Hello:
+            if client is None:
+                client = self._clients[address] = _RemoteClient(
+                    address, self._next_client_id()
+                )
+                client.name, _ = readString(data[8:])
+            self._ack(address, data[1:3])
+        if client is None:
+            return
+        client.last_seen = asyncio.get_running_loop().time()
+        if tag == PacketType.Reliable:
+            self._ack(address, data[1:3])
+            reliable_id = struct.unpack(">h", data[1:3])[0]
+            if reliable_id in client.received:
+                # resent because our ack got lost
+                return
+            client.received.append(reliable_id)
+            self._on_messages(client, data[3:], True)
+        elif tag == PacketType.Unreliable:
+            self._on_messages(client, data[1:], False)
+        elif tag == PacketType.Ping:
+            self._ack(address, data[1:3])
+        elif tag == PacketType.Acknowledgement:
+            handle = client.pending.pop(struct.unpack(">h", data[1:3])[0], None)
+            if handle is not None:
+                handle.cancel()
+        elif tag == PacketType.Disconnect:
+            self._remove(client)
+
+    def _on_messages(self, client: _RemoteClient, data: bytes, reliable: bool) -> None:
+        for tag, payload in _messages(data):
+            try:
+                self._on_message(client, tag, payload, reliable)
+            except Exception as e:
+                logger.exception(e)
+
+    def _on_message(
+        self, client: _RemoteClient, tag: int, payload: bytes, reliable: bool
+    ) -> None:
+        if tag == MatchMakingTag.JoinGame:
+            self._on_join(client, struct.unpack("<I", payload[:4])[0])
+        elif tag == MatchMakingTag.GetGameListV2:
+            self._on_game_list(client, payload)
+        elif tag in (MatchMakingTag.GameData, MatchMakingTag.GameDataTo):
+            lobby = client.lobby
+            if lobby is None or struct.unpack("<I", payload[:4])[0] != lobby.game_id:
+                logger.debug(
+                    f"Client {client.client_id} sent GameData for another game"
+                )
+            elif tag == MatchMakingTag.GameData:
+                lobby._on_game_data(client, payload, reliable)
+            else:
+                lobby._on_game_data_to(client, payload, reliable)
+        else:
+            logger.debug(f"Mock server ignores message {tag}")
+
+    def _on_join(self, client: _RemoteClient, game_id: int) -> None:
+        lobby = self._games.get(game_id)
+        if lobby is None and self.redirect is not None:
+            self._send(
+                client,
+                message(
+                    MatchMakingTag.Redirect,
+                    socket.inet_aton(socket.gethostbyname(self.redirect.host))
+                    + struct.pack("<H", self.redirect.port),
+                ),
+            )
+            return
+        reason = None
+        if lobby is None:
+            reason = DisconnectReason.GameNotFound
+        elif lobby.started:
+            reason = DisconnectReason.GameStarted
+        elif (
+            client.client_id not in lobby.clients
+            and lobby.player_count >= lobby.settings.maxPlayers
+        ):
+            reason = DisconnectReason.GameFull
+        if reason is not None:
+            self._send(
+                client, message(MatchMakingTag.JoinGame, struct.pack("<I", reason))
+            )
+            return
+        lobby._join(client)
+
+    def _listed(self) -> Iterator[Tuple["MockServer", MockLobby]]:
+        for server in (self, self.redirect) if self.redirect is not None else (self,):
+            for lobby in server.lobbies.values():
+                yield server, lobby
+
+    def _on_game_list(self, client: _RemoteClient, payload: bytes) -> None:
+        _, settings = readPacked(payload[1:])
+        keywords = struct.unpack("<I", settings[2:6])[0]
+        search_map, impostors = settings[6], settings[30]
+        counts = [0, 0, 0]
+        games: List[bytes] = []
+        for server, lobby in self._listed():
+            game = lobby.settings
+            if lobby.started:
+                continue
+            if game.mapId < len(counts):
+                counts[game.mapId] += 1
+            if not search_map & (1 << game.mapId):
+                continue
+            if impostors and game.impostors != impostors:
+                continue
+            if keywords != GameSettings.Keywords.All and game.keywords != keywords:
+                continue
+            games.append(
+                message(
+                    0,
+                    socket.inet_aton(socket.gethostbyname(server.host))
+                    + struct.pack("<HI", server.port, lobby.game_id)
+                    + writeString(lobby.name)
+                    + bytes([lobby.player_count])
+                    + createPacked(0)
+                    + bytes([game.mapId, game.impostors, game.maxPlayers]),
+                )
+            )
+        self._send(
+            client,
+            message(
+                MatchMakingTag.GetGameListV2,
+                message(1, struct.pack("<III", *counts)) + message(0, b"".join(games)),
+            ),
+        )
+
+    def _remove(self, client: _RemoteClient) -> None:
+        self._clients.pop(client.address, None)
+        for handle in client.pending.values():
+            handle.cancel()
+        client.pending.clear()
+        if client.lobby is not None:
+            client.lobby._leave(client)
+
+    def _sweep(self) -> None:
+        """Removes clients which didn't send anything for :attr:`clientTimeout`"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() - self.clientTimeout / 1000
+        for client in list(self._clients.values()):
+            if client.last_seen < deadline:
+                logger.debug(f"Mock server timed out client {client.client_id}")
+                self._remove(client)
+        self._sweep_handle = loop.call_later(1, self._sweep)
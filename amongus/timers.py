@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import math
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    """
+    A timer scheduled on a :class:`TimerWheel`
+
+    Mirrors :class:`asyncio.TimerHandle` closely enough that the two can be used
+    interchangeably by the :class:`Connection`
+
+    Attributes:
+        expires (int): The tick in which the timer fires
+        callback (callable): The function which gets called when the timer fires
+        args (tuple): The arguments passed to the callback
+    """
+
+    __slots__ = ("expires", "callback", "args", "_cancelled", "_wheel")
+
+    def __init__(self, wheel: "TimerWheel", expires: int, callback: Callable, args):
+        self._wheel = wheel
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        """Cancels the timer, does nothing if it already fired or was cancelled"""
+        if not self._cancelled:
+            self._cancelled = True
+            self._wheel._pending -= 1
+
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+
+class TimerWheel:
+    """
+    Hierarchical timer wheel which can be shared by many connections
+
+    Scheduling and cancelling a timer are O(1), no matter how many timers are
+    pending. The wheel only registers a single callback with the event loop per tick
+    (and none at all while no timer is pending), which serves every connection using
+    it. Timers are rounded up to the next tick, so the resolution is :attr:`tick`.
+
+    Example:
+        .. code-block:: python
+
+           wheel = TimerWheel(tick=0.05)
+           clients = [Client(name=f"Bot{i}", timer_wheel=wheel) for i in range(500)]
+
+    Attributes:
+        tick (float): The resolution of the wheel in seconds
+        slots (int): The amount of slots per level, has to be a power of two
+        levels (int): The amount of levels, timers further in the future than
+            `slots ** levels` ticks are clamped and rescheduled when they come up
+    """
+
+    def __init__(self, tick: float = 0.01, slots: int = 64, levels: int = 4):
+        """
+        Creates an empty wheel, the event loop is bound lazily on first use
+
+        Args:
+            tick (float): The resolution of the wheel in seconds
+            slots (int): Slots per level, has to be a power of two
+            levels (int): Amount of levels of the wheel
+
+        Raises:
+            ValueError: slots is not a power of two
+        """
+        if slots < 2 or slots & (slots - 1):
+            raise ValueError("slots has to be a power of two")
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._max_delta = slots ** levels - 1
+        self._wheel: List[List[List[TimerHandle]]] = [
+            [[] for _ in range(slots)] for _ in range(levels)
+        ]
+        self._loop: asyncio.AbstractEventLoop = None
+        self._handle: asyncio.TimerHandle = None
+        self._start: float = 0.0
+        self._now: int = 0
+        self._pending: int = 0
+
+    def __len__(self) -> int:
+        """Returns the amount of pending timers"""
+        return self._pending
+
+    def call_later(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        """
+        Schedules callback to be called after delay seconds
+
+        Args:
+            delay (float): The delay in seconds
+            callback (Callable): A normal function, use :func:`asyncio.ensure_future`
+                inside of it to run coroutines
+
+        Returns:
+            A :class:`TimerHandle` which can be cancelled
+
+        Raises:
+            RuntimeError: The wheel still has pending timers on another event loop
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._pending:
+                raise RuntimeError("The TimerWheel is in use by another event loop")
+            self._loop = loop
+            self._start = loop.time()
+            self._handle = None
+        if self._pending == 0:
+            # nothing is pending, so the wheel was not advanced. Catch up in O(1)
+            self._now = self._current_tick()
+        ticks = max(1, math.ceil(delay / self.tick))
+        # the wheel might lag behind the loop, the delay starts now and not at the
+        # last processed tick
+        handle = TimerHandle(self, self._current_tick() + ticks, callback, args)
+        self._insert(handle)
+        self._pending += 1
+        if self._handle is None:
+            self._schedule_tick()
+        return handle
+
+    def close(self) -> None:
+        """Cancels every pending timer and detaches from the event loop"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        for level in self._wheel:
+            for slot in level:
+                for handle in slot:
+                    handle._cancelled = True
+                slot.clear()
+        self._pending = 0
+        self._loop = None
+
+    def _current_tick(self) -> int:
+        return int((self._loop.time() - self._start) / self.tick)
+
+    def _insert(self, handle: TimerHandle) -> None:
+        delta = min(handle.expires - self._now, self._max_delta)
+        expires = self._now + max(delta, 0)
+        level = 0
+        while delta >= self.slots and level < self.levels - 1:
+            delta >>= self._bits
+            level += 1
+        index = (expires >> (self._bits * level)) & self._mask
+        self._wheel[level][index].append(handle)
+
+    def _schedule_tick(self) -> None:
+        when = self._start + (self._now + 1) * self.tick
+        self._handle = self._loop.call_at(when, self._on_tick)
+
+    def _cascade(self, level: int) -> None:
+        index = (self._now >> (self._bits * level)) & self._mask
+        slot = self._wheel[level][index]
+        self._wheel[level][index] = []
+        for handle in slot:
+            if not handle._cancelled:
+                self._insert(handle)
+        if index == 0 and level + 1 < self.levels:
+            self._cascade(level + 1)
+
+    def _on_tick(self) -> None:
+        """The one loop callback per tick, advances the wheel and runs due timers"""
+        self._handle = None
+        target = self._current_tick()
+        while self._now < target and self._pending > 0:
+            self._now += 1
+            index = self._now & self._mask
+            if index == 0 and self.levels > 1:
+                self._cascade(1)
+            slot = self._wheel[0][index]
+            self._wheel[0][index] = []
+            for handle in slot:
+                if handle._cancelled:
+                    continue
+                if handle.expires > self._now:
+                    # clamped timer which is not due yet
+                    self._insert(handle)
+                    continue
+                handle._cancelled = True
+                self._pending -= 1
+                try:
+                    handle.callback(*handle.args)
+                except Exception as e:
+                    logger.exception(e)
+        if self._pending > 0:
+            self._schedule_tick()
@@ -0,0 +1,387 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Sampled lifecycle traces of received datagrams and an event loop lag monitor
+
+A traced datagram records when it was received, when the reader started on it, when
+it was parsed, when its packets were handled (the state applied), which events it
+dispatched and when their listeners finished. The loop lag monitor measures how late
+a periodic callback runs, so a slow handler can be told apart from an overloaded
+loop: with a high lag everything waits, not only the datagrams.
+
+Traces are kept in a ring buffer and can be exported in the Trace Event Format,
+which can be opened with https://ui.perfetto.dev or ``chrome://tracing``.
+"""
+import asyncio
+import collections
+import contextvars
+import json
+import logging
+import math
+import os
+import random
+import time
+from typing import Deque, Dict, List, Optional, Tuple, Union
+
+from .metrics import Histogram, Metrics
+
+logger = logging.getLogger(__name__)
+
+# the trace of the datagram which is being processed, copied into listener tasks
+current_trace: contextvars.ContextVar = contextvars.ContextVar(
+    "current_trace", default=None
+)
+
+
+class _TracedDatagram(bytes):
+    """A received datagram which carries its :class:`Trace`"""
+
+    trace: "Trace"
+
+
+class Trace:
+    """
+    The lifecycle of one sampled datagram, all times are :func:`time.perf_counter`
+    seconds
+
+    Attributes:
+        id (int): The number of the trace
+        size (int): The size of the datagram in bytes
+        received (float): When the datagram arrived on the socket
+        started (float): When the reader started processing it
+        parsed (float): When it was parsed
+        applied (float): When all its packets were handled
+        handlers (List[Tuple[str, float, float]]): The packet handlers which ran, by
+            tag with start and end
+        events (List[Tuple[str, float]]): The dispatched events with their time
+        listeners (List[Tuple[str, str, float, float]]): The event listeners by
+            event and function, from the dispatch until they finished
+    """
+
+    __slots__ = (
+        "id",
+        "size",
+        "received",
+        "started",
+        "parsed",
+        "applied",
+        "handlers",
+        "events",
+        "listeners",
+    )
+
+    def __init__(self, trace_id: int, size: int, received: float):
+        self.id = trace_id
+        self.size = size
+        self.received = received
+        self.started = self.parsed = self.applied = None
+        self.handlers: List[Tuple[str, float, float]] = []
+        self.events: List[Tuple[str, float]] = []
+        self.listeners: List[Tuple[str, str, float, float]] = []
+
+    @property
+    def dispatched(self) -> Optional[float]:
+        """When the first event was dispatched, None without events"""
+        return self.events[0][1] if self.events else None
+
+    @property
+    def completed(self) -> Optional[float]:
+        """When the last listener finished, or the state was applied without any"""
+        if self.listeners:
+            return max(end for _, _, _, end in self.listeners)
+        return self.applied
+
+    def stages(self) -> Dict[str, float]:
+        """
+        Returns the seconds spent in every stage, only the ones already reached:
+        queued (received to started), parse, apply, dispatch (received to the first
+        event), listeners (first event to the last listener) and total
+        """
+        stages = {}
+        if self.started is not None:
+            stages["queued"] = self.started - self.received
+        if self.parsed is not None:
+            stages["parse"] = self.parsed - self.started
+        if self.applied is not None:
+            stages["apply"] = self.applied - self.parsed
+        if self.events:
+            stages["dispatch"] = self.dispatched - self.received
+        if self.listeners:
+            stages["listeners"] = self.completed - self.dispatched
+        if self.completed is not None:
+            stages["total"] = self.completed - self.received
+        return stages
+
+
+class LoopMonitor:
+    """
+    Measures the event loop lag: how much later than scheduled a periodic callback
+    runs. A busy or blocked loop delays every callback, including the processing of
+    received datagrams
+
+    Attributes:
+        interval (float): Seconds between two measurements
+        samples (Deque[Tuple[float, float]]): The last measurements as
+            (:func:`time.perf_counter` time, lag in seconds)
+        histogram (Histogram): All measured lags
+        metrics (Metrics): Optional; Gets the lags as ``loop_lag_seconds``
+    """
+
+    interval: float
+    samples: Deque[Tuple[float, float]]
+    histogram: Histogram
+    metrics: Metrics = None
+    _loop: asyncio.AbstractEventLoop = None
+    _handle: asyncio.TimerHandle = None
+    _expected: float = 0.0
+
+    def __init__(
+        self, interval: float = 0.1, capacity: int = 1024, metrics: Metrics = None
+    ):
+        """
+        Args:
+            interval (float): Optional; Seconds between two measurements
+            capacity (int): Optional; The amount of measurements kept in
+                :attr:`samples`
+            metrics (Metrics): Optional; Records the lags as ``loop_lag_seconds``
+        """
+        self.interval = interval
+        self.samples = collections.deque(maxlen=capacity)
+        self.histogram = Histogram()
+        self.metrics = metrics
+
+    @property
+    def running(self) -> bool:
+        return self._handle is not None
+
+    def start(self) -> None:
+        """Starts measuring on the running event loop, moves to it if it changed"""
+        loop = asyncio.get_running_loop()
+        if self._handle is not None:
+            if self._loop is loop:
+                return
+            self._handle.cancel()
+        self._loop = loop
+        self._schedule()
+
+    def stop(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _schedule(self) -> None:
+        self._expected = time.perf_counter() + self.interval
+        self._handle = self._loop.call_later(self.interval, self._tick)
+
+    def _tick(self) -> None:
+        now = time.perf_counter()
+        lag = max(now - self._expected, 0.0)
+        self.samples.append((now, lag))
+        self.histogram.observe(lag)
+        if self.metrics is not None:
+            self.metrics.observe("loop_lag_seconds", lag)
+        if self._loop.is_closed():
+            self._handle = None
+            return
+        self._schedule()
+
+
+class Tracer:
+    """
+    Samples received datagrams and records their lifecycle, see
+    :meth:`Connection.enable_tracing`
+
+    Example:
+        .. code-block:: python
+
+           tracer = client.connection.enable_tracing(sample_rate=0.1)
+           ...
+           print(tracer.summary())
+           tracer.export("trace.json")  # open with https://ui.perfetto.dev
+
+    Attributes:
+        sample_rate (float): The share of datagrams traced, 0 to 1
+        traces (Deque[Trace]): The last traces, the oldest are dropped
+        monitor (LoopMonitor): The event loop lag monitor, None if disabled
+    """
+
+    sample_rate: float
+    traces: Deque[Trace]
+    monitor: Optional[LoopMonitor]
+
+    def __init__(
+        self,
+        sample_rate: float = 0.01,
+        capacity: int = 1024,
+        lag_interval: Optional[float] = 0.1,
+        metrics: Metrics = None,
+    ):
+        """
+        Args:
+            sample_rate (float): Optional; The share of datagrams traced, default is
+                1 in 100
+            capacity (int): Optional; The amount of traces and lag measurements kept
+            lag_interval (float): Optional; Seconds between two loop lag measurements,
+                None to not measure the lag
+            metrics (Metrics): Optional; Gets the loop lag as ``loop_lag_seconds``
+        """
+        self.sample_rate = sample_rate
+        self.traces = collections.deque(maxlen=capacity)
+        self.monitor = (
+            None
+            if lag_interval is None
+            else LoopMonitor(lag_interval, capacity, metrics)
+        )
+        self._count = 0
+        self._random = random.Random()
+
+    def start(self) -> None:
+        """Starts the loop lag monitor, needs a running event loop"""
+        if self.monitor is not None:
+            self.monitor.start()
+
+    def stop(self) -> None:
+        if self.monitor is not None:
+            self.monitor.stop()
+
+    def sample(self, data: bytes) -> bytes:
+        """
+        Decides if a received datagram is traced
+
+        Returns:
+            The datagram, carrying a new :class:`Trace` if it was sampled
+        """
+        if self._random.random() >= self.sample_rate:
+            return data
+        self._count += 1
+        traced = _TracedDatagram(data)
+        traced.trace = Trace(self._count, len(data), time.perf_counter())
+        self.traces.append(traced.trace)
+        return traced
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the percentiles (p50, p90, p99 and max) of every stage of the traces
+        and of the loop lag, in milliseconds
+
+        Compare the stages to the loop lag: if the lag is about as high as the time
+        datagrams were queued, the loop was busy with other work
+        """
+        stages: Dict[str, List[float]] = collections.defaultdict(list)
+        for trace in list(self.traces):
+            for stage, seconds in trace.stages().items():
+                stages[stage].append(seconds)
+        if self.monitor is not None:
+            stages["loop_lag"] = [lag for _, lag in self.monitor.samples]
+        result = {}
+        for stage, values in stages.items():
+            values.sort()
+            result[stage] = {
+                f"p{p}": values[max(0, math.ceil(p / 100 * len(values)) - 1)] * 1000
+                for p in (50, 90, 99)
+            }
+            result[stage]["max"] = values[-1] * 1000
+            result[stage]["count"] = len(values)
+        return result
+
+    def trace_events(self) -> List[dict]:
+        """
+        Returns the traces and loop lags as Trace Event Format events
+
+        Every datagram is an async span with its stages and listeners nested inside,
+        the packet handlers are complete events on the reader's track and the loop
+        lag is a counter
+        """
+        pid = os.getpid()
+        events = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "args": {"name": "amongus"},
+            },
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": 1,
+                "args": {"name": "reader"},
+            },
+        ]
+
+        def span(name: str, trace: Trace, start: float, end: float, args: dict = None):
+            common = {"cat": "datagram", "id": trace.id, "pid": pid, "tid": 1}
+            events.append(
+                {
+                    "name": name,
+                    "ph": "b",
+                    "ts": start * 1e6,
+                    **common,
+                    "args": args or {},
+                }
+            )
+            events.append({"name": name, "ph": "e", "ts": end * 1e6, **common})
+
+        for trace in list(self.traces):
+            completed = trace.completed
+            if trace.applied is None:
+                # still being processed
+                continue
+            span("datagram", trace, trace.received, completed, {"bytes": trace.size})
+            span("queued", trace, trace.received, trace.started)
+            span("parse", trace, trace.started, trace.parsed)
+            span("apply", trace, trace.parsed, trace.applied)
+            for event, name, start, end in trace.listeners:
+                span(f"{event}:{name}", trace, start, end)
+            for event, at in trace.events:
+                events.append(
+                    {
+                        "name": f"dispatch {event}",
+                        "ph": "n",
+                        "cat": "datagram",
+                        "id": trace.id,
+                        "ts": at * 1e6,
+                        "pid": pid,
+                        "tid": 1,
+                    }
+                )
+            for name, start, end in trace.handlers:
+                events.append(
+                    {
+                        "name": name,
+                        "ph": "X",
+                        "cat": "handler",
+                        "ts": start * 1e6,
+                        "dur": (end - start) * 1e6,
+                        "pid": pid,
+                        "tid": 1,
+                    }
+                )
+        if self.monitor is not None:
+            for at, lag in list(self.monitor.samples):
+                events.append(
+                    {
+                        "name": "loop lag",
+                        "ph": "C",
+                        "ts": at * 1e6,
+                        "pid": pid,
+                        "args": {"ms": lag * 1000},
+                    }
+                )
+        return events
+
+    def export(self, path: Union[str, os.PathLike]) -> int:
+        """
+        Writes the traces and loop lags as Trace Event Format JSON, which can be
+        opened with https://ui.perfetto.dev or ``chrome://tracing``
+
+        Args:
+            path (str): The file to write
+
+        Returns:
+            The amount of events written
+        """
+        events = self.trace_events()
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import asyncio
+import collections
+import logging
+from typing import Deque, Dict, Iterable, Set, Tuple
+
+from .connection import Connection
+from .eventbus import EventBus
+from .exceptions import AmongUsException
+from .regions import regions as default_regions
+from .timers import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """
+    Keeps already connected connections per region ready to be used by a client
+
+    Connecting costs the UDP setup, the Hello packet and waiting for the server to
+    answer. A pooled connection has done all of that, so a client which adopts one
+    (see :meth:`Client.start`) is ready immediately and can send JoinGame right
+    away. Idle connections are kept alive by their keepalive pings and every
+    checkout replenishes the pool in the background.
+
+    The name of the player is sent in the Hello packet, spectators never send it
+    again. So connections are pooled per region and name, fill the pool with the
+    names of the clients which will use it.
+
+    Example:
+        .. code-block:: python
+
+           pool = ConnectionPool(size=4)
+           await pool.fill(["EU"], name="Bot")
+
+           client = Client("Bot")
+
+           @client.event
+           async def on_ready():
+               await client.join_lobby("ABCDEF")
+
+           await client.start(region="EU", pool=pool)
+
+    Attributes:
+        regions (Dict[str, str]): The regions which can be pooled, name -> host
+        size (int): The amount of idle connections kept per region
+        hits (int): Checkouts which got a pooled connection
+        misses (int): Checkouts which had to connect first
+    """
+
+    regions: Dict[str, str]
+    size: int
+    hits: int = 0
+    misses: int = 0
+
+    def __init__(
+        self,
+        size: int = 2,
+        regions: Dict[str, str] = None,
+        port: int = 22023,
+        gameVersion: tuple = (2021, 3, 5),
+        timer_wheel: TimerWheel = None,
+    ):
+        """
+        Creates an empty pool, see :meth:`fill`
+
+        Args:
+            size (int): Optional; The amount of idle connections kept per region
+            regions (Dict[str, str]): Optional; The regions, defaults to
+                :attr:`amongus.regions.regions`
+            port (int): Optional; Port of the servers
+            gameVersion (tuple): Optional; The version of the game running on the
+                servers
+            timer_wheel (TimerWheel): Optional; Timer wheel for the connections
+        """
+        self.size = size
+        self.regions = dict(regions if regions is not None else default_regions)
+        self.port = port
+        self.gameVersion = gameVersion
+        self.timer_wheel = timer_wheel
+        # the pooled connections don't have any listeners until they are adopted
+        self._eventbus = EventBus()
+        # by region and name
+        self._idle: Dict[Tuple[str, str], Deque[Connection]] = collections.defaultdict(
+            collections.deque
+        )
+        self._connecting: Dict[Tuple[str, str], int] = collections.defaultdict(int)
+        self._tasks: Set[asyncio.Task] = set()
+        self.closed = False
+
+    def idle(self, region: str, name: str = "Player") -> int:
+        """Returns the amount of idle connections of a region for the name"""
+        return len(self._idle[region.upper(), name])
+
+    async def fill(self, regions: Iterable[str] = None, name: str = "Player") -> None:
+        """
+        Connects until every region has :attr:`size` idle connections for the name
+
+        Args:
+            regions (Iterable[str]): Optional; Only fill these regions
+            name (str): Optional; The name sent in the Hello packet
+        """
+        regions = [r.upper() for r in regions] if regions is not None else self.regions
+        await asyncio.gather(*(self._replenish(region, name) for region in regions))
+
+    async def checkout(self, region: str, name: str = "Player") -> Connection:
+        """
+        Takes a connected connection out of the pool
+
+        If no idle connection is left a new one is connected. The pool is refilled
+        in the background either way
+
+        Args:
+            region (str): The region
+            name (str): Optional; The name sent in the Hello packet, has to be the
+                name of the client adopting the connection
+
+        Returns:
+            The connection, its eventbus has to be replaced by the new owner
+
+        Raises:
+            AmongUsException: Invalid region, the pool is closed or the server
+                could not be reached
+        """
+        region = region.upper()
+        if region not in self.regions:
+            raise AmongUsException(f"The region {region} does not exist!")
+        if self.closed:
+            raise AmongUsException("The connection pool is closed!")
+        idle = self._idle[region, name]
+        while idle:
+            connection = idle.popleft()
+            # connections which timed out or were disconnected are thrown away
+            if not connection.closed and connection.ready:
+                self.hits += 1
+                self._spawn(self._replenish(region, name))
+                return connection
+            await connection.disconnect(True)
+        self.misses += 1
+        self._spawn(self._replenish(region, name))
+        connection = await self._connect(region, name)
+        if connection is None:
+            raise AmongUsException(f"Could not connect to region {region}!")
+        return connection
+
+    async def close(self) -> None:
+        """Disconnects all idle connections, checked out ones stay connected"""
+        self.closed = True
+        for task in self._tasks:
+            task.cancel()
+        connections = [c for idle in self._idle.values() for c in idle]
+        self._idle.clear()
+        await asyncio.gather(
+            *(c.disconnect(False) for c in connections), return_exceptions=True
+        )
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _replenish(self, region: str, name: str) -> None:
+        key = (region, name)
+        missing = self.size - len(self._idle[key]) - self._connecting[key]
+        if missing <= 0:
+            return
+        self._connecting[key] += missing
+        try:
+            connections = await asyncio.gather(
+                *(self._connect(region, name) for _ in range(missing))
+            )
+        finally:
+            self._connecting[key] -= missing
+        for connection in connections:
+            if connection is None:
+                continue
+            if self.closed:
+                await connection.disconnect(False)
+            else:
+                self._idle[key].append(connection)
+
+    async def _connect(self, region: str, name: str) -> Connection:
+        """Returns a new connected connection, None if the server didn't answer"""
+        connection = Connection(self._eventbus, timer_wheel=self.timer_wheel)
+        connection.region = region
+        try:
+            await connection.connect(
+                name, self.regions[region], self.port, self.gameVersion
+            )
+        except OSError as e:
+            logger.warning(f"Connecting to {region} failed: {e!r}")
+            return None
+        if connection.closed:
+            logger.warning(f"Connecting to {region} failed: {connection.result!r}")
+            return None
+        return connection
@@ -0,0 +1,353 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks the hot paths with the datagrams of ``corpus.json``: parsing, serializing,
+the :meth:`Connection.on_packet` dispatch and the :class:`EventBus` fanout.
+
+Every benchmark reports operations per second and the memory of one operation: the
+bytes allocated while it runs and the blocks left for the garbage collector. Results
+can be saved as JSON and compared to a previous run, the script exits with 1 if an
+operation got slower than the threshold.
+
+Usage::
+
+    python benchmarks/codec.py --output before.json
+    python benchmarks/codec.py --compare before.json --threshold 10
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator, List
+
+from amongus.capture import Direction, Record, _ReplayTransport, replay
+from amongus.connection import Connection
+from amongus.eventbus import EventBus
+from amongus.game import Game
+from amongus.packets import (
+    DataFlagPacket,
+    GameDataPacket,
+    MovementPacket,
+    RPCPacket,
+    ReliablePacket,
+    SendChatPacket,
+    SpawnPacket,
+    UnreliablePacket,
+)
+from amongus.packets.base import Packet
+from amongus.packets.spawn import GameDataSpawnPacket
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus.json")
+
+
+def load_corpus(path: str = CORPUS) -> Dict[str, List[bytes]]:
+    with open(path) as f:
+        return {k: [bytes.fromhex(d) for d in v] for k, v in json.load(f).items()}
+
+
+def parse(data: bytes) -> List[Packet]:
+    """Parses a datagram including the spawned objects, like the connection does"""
+    packets = Packet.parse(data, first_call=True)
+    stack = list(packets)
+    while stack:
+        packet = stack.pop()
+        if type(packet) is SpawnPacket:
+            packet.parse_spawn()
+        stack.extend(packet.contained_packets)
+    return packets
+
+
+def measure(op: Callable[[], None], seconds: float, repeat: int, ops: int = 1) -> dict:
+    """
+    Runs op for about seconds, repeat times
+
+    Returns the best rate and the memory of one operation: the traced peak of bytes
+    allocated while it runs and the memory blocks reference counting didn't free,
+    e.g. packets referencing their parent, which are left to the garbage collector.
+    A call of op does ops operations
+    """
+    batch = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(batch):
+            op()
+        took = time.perf_counter() - start
+        if took > 0.05:
+            break
+        batch *= 4
+    batch = max(1, int(batch * seconds / took))
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(batch):
+            op()
+        best = max(best, batch * ops / (time.perf_counter() - start))
+
+    samples = 100
+    gc.collect()
+    gc.disable()
+    try:
+        # without tracemalloc, its traces are memory blocks as well
+        blocks = sys.getallocatedblocks()
+        for _ in range(samples):
+            op()
+        blocks = sys.getallocatedblocks() - blocks
+        peak_bytes = 0
+        for _ in range(samples):
+            # restarted for every sample to reset the peak, reset_peak needs 3.9
+            tracemalloc.start()
+            try:
+                op()
+                peak_bytes += tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    finally:
+        gc.enable()
+    return {
+        "ops_per_sec": round(best, 1),
+        "alloc_bytes_per_op": round(peak_bytes / samples / ops, 1),
+        "gc_blocks_per_op": round(max(blocks, 0) / samples / ops, 2),
+    }
+
+
+def _walk(packets: List[Packet]) -> Iterator[Packet]:
+    for packet in packets:
+        yield packet
+        yield from _walk(packet.contained_packets)
+
+
+def parse_benchmarks(corpus: Dict[str, List[bytes]]) -> Dict[str, Callable[[], None]]:
+    return {
+        f"parse/{name}": (lambda datagrams=datagrams: [parse(d) for d in datagrams])
+        for name, datagrams in corpus.items()
+        if name != "join"
+    }
+
+
+def serialize_benchmarks(
+    corpus: Dict[str, List[bytes]]
+) -> Dict[str, Callable[[], None]]:
+    settings = Game.with_default_settings()
+    players = [
+        player
+        for packet in _walk(parse(corpus["spawn_burst"][0]))
+        if isinstance(packet, GameDataSpawnPacket)
+        for player in packet.values["players"]
+    ]
+
+    def movement():
+        UnreliablePacket.create(
+            [
+                GameDataPacket.create(
+                    [
+                        DataFlagPacket.create(
+                            [MovementPacket.create((1.5, 2.5), (1.0, 0.0), i)],
+                            net_id=4 + i,
+                        )
+                        for i in range(len(players))
+                    ],
+                    game_id=0x8C25BE3B,
+                )
+            ]
+        ).serialize(lambda: 1)
+
+    def chat():
+        ReliablePacket.create(
+            [
+                GameDataPacket.create(
+                    [RPCPacket.create([SendChatPacket.create("hello")], net_id=2)],
+                    game_id=0x8C25BE3B,
+                )
+            ]
+        ).serialize(lambda: 1)
+
+    return {
+        "serialize/movement_burst": movement,
+        "serialize/update_game_data": lambda: [p.serialize() for p in players],
+        "serialize/sync_settings": settings.serialize,
+        "serialize/chat": chat,
+    }
+
+
+# the events every dispatch benchmark has to cause, a dispatch which returns early
+# is not measured by accident
+DISPATCH_EVENTS = {
+    "movement_burst": "player_move",
+    "update_game_data": "players_update",
+    "sync_settings": "game_settings",
+    "chat": "chat",
+}
+
+
+def dispatch_benchmarks(
+    corpus: Dict[str, List[bytes]], loop: asyncio.AbstractEventLoop, metrics: bool
+) -> Dict[str, Callable[[], None]]:
+    """Runs Connection.on_packet for already parsed packets of a joined connection"""
+    connection = Connection(EventBus())
+    connection.name = "Bench"
+    if metrics:
+        connection.enable_metrics()
+    records = [Record(0, Direction.Inbound, d) for d in corpus["join"]]
+    loop.run_until_complete(replay(connection, records, 0))
+    # the replay closes the connection at the end, which on_packet ignores
+    connection.closed = False
+    connection._ready.set()
+    connection.transport = _ReplayTransport()
+    # UpdateGameData is only applied by spectators which reconnected
+    connection._spectator_reconnected = True
+
+    dispatched = []
+
+    def forward(event: str, args: tuple, kwargs: dict) -> None:
+        dispatched.append(event)
+
+    benchmarks = {}
+    for name, event in DISPATCH_EVENTS.items():
+        packets = parse(corpus[name][0])
+        flagged = [p for p in _walk(packets) if type(p) is DataFlagPacket]
+
+        async def _dispatch(packets=packets, flagged=flagged):
+            # movement with an already seen sequence id would be dropped early
+            connection._sequence_ids.clear()
+            # the connection adds the data of a flag to it, like for a new datagram
+            for packet in flagged:
+                packet.contained_packets.clear()
+            for packet in packets:
+                await connection.on_packet(packet)
+            # let the listener tasks run
+            await asyncio.sleep(0)
+
+        dispatched.clear()
+        connection.eventbus.add_forwarder(forward)
+        loop.run_until_complete(_dispatch())
+        connection.eventbus.forwarders.remove(forward)
+        assert event in dispatched, f"dispatch/{name} dispatched {dispatched}"
+
+        benchmarks[f"dispatch/{name}"] = (
+            lambda _dispatch=_dispatch: loop.run_until_complete(_dispatch())
+        )
+    return benchmarks
+
+
+def fanout_benchmarks(loop: asyncio.AbstractEventLoop) -> Dict[str, Callable[[], None]]:
+    """Dispatches events to 1, 10 and 100 listeners, 100 events per call"""
+
+    async def listener(*args, **kwargs):
+        pass
+
+    benchmarks = {}
+    for listeners in (1, 10, 100):
+        bus = EventBus()
+        for _ in range(listeners):
+            bus.add_listener("on_chat", listener)
+
+        async def _fanout(bus=bus):
+            for _ in range(100):
+                bus.dispatch("chat", None, "hello")
+            await asyncio.sleep(0)
+
+        benchmarks[f"eventbus/fanout_{listeners}"] = (
+            lambda _fanout=_fanout: loop.run_until_complete(_fanout())
+        )
+    return benchmarks
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Returns the benchmarks which got slower than the threshold in percent"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        change = (result["ops_per_sec"] / before["ops_per_sec"] - 1) * 100
+        print(f"{name:32} {change:+7.1f}%")  # noqa: T001
+        if change < -threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(args: argparse.Namespace) -> int:
+    corpus = load_corpus(args.corpus)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        benchmarks = {
+            **parse_benchmarks(corpus),
+            **serialize_benchmarks(corpus),
+            **dispatch_benchmarks(corpus, loop, args.metrics),
+            **fanout_benchmarks(loop),
+        }
+        results = {}
+        for name, op in benchmarks.items():
+            if args.filter and args.filter not in name:
+                continue
+            ops = 100 if name.startswith("eventbus/") else 1
+            results[name] = measure(op, args.seconds, args.repeat, ops)
+            print(  # noqa: T001
+                f"{name:32} {results[name]['ops_per_sec']:>12,.0f} ops/s "
+                f"{results[name]['alloc_bytes_per_op']:>10,.0f} B/op "
+                f"{results[name]['gc_blocks_per_op']:>6} blocks/op"
+            )
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "meta": {
+                        "python": platform.python_version(),
+                        "implementation": platform.python_implementation(),
+                        "machine": platform.machine(),
+                        "time": time.time(),
+                        "seconds": args.seconds,
+                        "repeat": args.repeat,
+                        "metrics": args.metrics,
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(  # noqa: T001
+                f"Slower by more than {args.threshold}%: {', '.join(regressions)}"
+            )
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=CORPUS, help="The corpus to use")
+    parser.add_argument(
+        "--seconds", type=float, default=0.5, help="Duration of every run"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per benchmark, the best one counts"
+    )
+    parser.add_argument("--filter", help="Only run benchmarks containing this")
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Enable the metrics of the connection used by the dispatch benchmarks",
+    )
+    parser.add_argument("-o", "--output", help="Save the results to this JSON file")
+    parser.add_argument("--compare", help="Compare the results to this JSON file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10,
+        help="Percent of ops/s a benchmark may lose in --compare, default is 10",
+    )
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Runs the receive path and timer benchmarks on every available event loop
+implementation and prints them as a matrix.
+
+The default asyncio loop is always included, uvloop is added when it is installed.
+
+Usage::
+
+    python benchmarks/event_loops.py --seconds 3
+"""
+import argparse
+import asyncio
+import time
+
+from amongus.timers import TimerWheel
+
+# the receive path benchmark next to this script
+import udp_reader  # noqa: I100
+
+
+def loop_factories() -> dict:
+    factories = {"asyncio": asyncio.new_event_loop}
+    try:
+        import uvloop
+    except ImportError:
+        pass
+    else:
+        factories["uvloop"] = uvloop.new_event_loop
+    return factories
+
+
+async def timers(amount: int, use_wheel: bool) -> float:
+    """Schedules and cancels keepalive like timers, returns timers per second."""
+    loop = asyncio.get_running_loop()
+    wheel = TimerWheel()
+    call_later = wheel.call_later if use_wheel else loop.call_later
+    start = time.perf_counter()
+    handles = [call_later(1.0, lambda: None) for _ in range(amount)]
+    for handle in handles:
+        handle.cancel()
+    result = amount / (time.perf_counter() - start)
+    wheel.close()
+    return result
+
+
+async def run_all(seconds: float, window: int, amount: int) -> dict:
+    results = await udp_reader.main(seconds, window)
+    results["loop_timers"] = await timers(amount, use_wheel=False)
+    results["wheel_timers"] = await timers(amount, use_wheel=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--window", type=int, default=64)
+    parser.add_argument("--timers", type=int, default=100_000)
+    args = parser.parse_args()
+
+    matrix = {}
+    for name, factory in loop_factories().items():
+        loop = factory()
+        try:
+            matrix[name] = loop.run_until_complete(
+                run_all(args.seconds, args.window, args.timers)
+            )
+        finally:
+            loop.close()
+
+    columns = list(next(iter(matrix.values())).keys())
+    print(f"{'loop':>10} " + " ".join(f"{c:>18}" for c in columns))  # noqa: T001
+    for name, results in matrix.items():
+        row = " ".join(f"{results[c]:>18.0f}" for c in columns)
+        print(f"{name:>10} {row}")  # noqa: T001
+    print("(datagrams/s for the readers, scheduled+cancelled/s for timers)")  # noqa: T001
@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Generates movement, chat and meeting traffic of synthetic players against clients
+in local lobbies and reports how much of it the clients could handle.
+
+Every lobby has one client under test, everything runs in this process against a
+:class:`amongus.testing.MockServer`, so the CPU usage includes the server.
+
+Usage::
+
+    python benchmarks/load.py --lobbies 20 --players 14 --move-rate 10 --seconds 10
+"""
+import argparse
+import asyncio
+
+from amongus.testing import LoadGenerator
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lobbies", type=int, default=1)
+    parser.add_argument("--players", type=int, default=14)
+    parser.add_argument("--move-rate", type=float, default=10.0)
+    parser.add_argument("--chat-rate", type=float, default=0.2)
+    parser.add_argument("--meeting-rate", type=float, default=0.01)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--resend-limit", type=int, default=None)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+    if args.loss and args.resend_limit is None:
+        # without resends the clients can't even join when packets get lost
+        args.resend_limit = 10
+
+    generator = LoadGenerator(
+        lobbies=args.lobbies,
+        players=args.players,
+        move_rate=args.move_rate,
+        chat_rate=args.chat_rate,
+        meeting_rate=args.meeting_rate,
+        loss=args.loss,
+        latency=args.latency,
+        resend_limit=args.resend_limit,
+    )
+    report = asyncio.run(generator.run(duration=args.seconds))
+    print(report.format())  # noqa: T001
@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Writes ``corpus.json``, the datagrams used by ``codec.py``.
+
+The datagrams are generated by the :class:`amongus.testing.MockServer` lobby code for
+a lobby with ten players, so they match what a client receives after joining. Only
+run it again if the corpus should change, as results of different corpora can't be
+compared.
+
+Usage::
+
+    python benchmarks/make_corpus.py
+"""
+import json
+import os
+import random
+import struct
+
+from amongus.enums import GameDataTag, GameSettings, MatchMakingTag, PacketType, RPCTag
+from amongus.game import Game
+from amongus.helpers import createPacked, createVector2, writeString
+from amongus.testing import MockServer
+from amongus.testing.server import _RemoteClient, message, rpc
+
+PLAYERS = 10
+
+
+def reliable(data: bytes, reliable_id: int = 1) -> str:
+    return (bytes([PacketType.Reliable]) + struct.pack(">h", reliable_id) + data).hex()
+
+
+def unreliable(data: bytes) -> str:
+    return (bytes([PacketType.Unreliable]) + data).hex()
+
+
+def main() -> dict:
+    rng = random.Random(22023)
+    server = MockServer()
+    sent = []
+    # collect what the server would send instead of sending it
+    server._send = lambda client, data, reliable=True: sent.append(data)
+    lobby = server.add_lobby("ABCDEF")
+    for i in range(PLAYERS - 1):
+        lobby.add_player(f"Player{i}", color=i, hat=rng.randrange(90))
+    for i in range(3):
+        server.add_lobby(name=f"Lobby{i}")
+    client = _RemoteClient(("127.0.0.1", 50000), server._next_client_id(), "Bench")
+    game_id = struct.pack("<I", lobby.game_id)
+
+    lobby._join(client)
+    joined = sent.pop()
+    lobby._scene_change(client)
+    spawn_burst = sent.pop()
+    sent.clear()
+    search = Game.with_default_settings()
+    search.mapId = GameSettings.SearchMap.All
+    search = search.serialize()
+    server._on_game_list(client, bytes([0]) + createPacked(len(search)) + search)
+    game_list = sent.pop()
+
+    players = [lobby.players[i] for i in sorted(lobby.players)]
+    movement = message(
+        MatchMakingTag.GameData,
+        game_id
+        + b"".join(
+            message(
+                GameDataTag.DataFlag,
+                createPacked(p.net_ids.network)
+                + struct.pack("<h", 100 + p.id)
+                + createVector2(rng.uniform(-20, 20), rng.uniform(-20, 20))
+                + createVector2(rng.uniform(-1, 1), rng.uniform(-1, 1)),
+            )
+            for p in players
+        ),
+    )
+    update = b"".join(
+        struct.pack("<h", len(data) - 1) + data
+        for data in (p.serialize() for p in players)
+    )
+    update_game_data = message(
+        MatchMakingTag.GameData,
+        game_id + rpc(lobby._gamedata_net_id, RPCTag.UpdateGameData, update),
+    )
+    settings = lobby.settings.serialize()
+    sync_settings = message(
+        MatchMakingTag.GameData,
+        game_id
+        + rpc(
+            lobby._gamedata_net_id,
+            RPCTag.SyncSettings,
+            createPacked(len(settings)) + settings,
+        ),
+    )
+    chat = message(
+        MatchMakingTag.GameData,
+        game_id
+        + rpc(
+            players[0].net_ids.control,
+            RPCTag.SendChat,
+            writeString("where? I was in electrical doing wires"),
+        ),
+    )
+    return {
+        "join": [reliable(joined, 1), reliable(spawn_burst, 2)],
+        "movement_burst": [unreliable(movement)],
+        "spawn_burst": [reliable(spawn_burst, 2)],
+        "update_game_data": [reliable(update_game_data, 3)],
+        "game_list": [reliable(game_list, 4)],
+        "sync_settings": [reliable(sync_settings, 5)],
+        "chat": [reliable(chat, 6)],
+    }
+
+
+if __name__ == "__main__":
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus.json")
+    with open(path, "w") as f:
+        json.dump(main(), f, indent=2)
+        f.write("\n")
+    print(f"Wrote {path}")  # noqa: T001
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Measures how :func:`amongus.analysis.parse_capture` scales with the amount of worker
+processes.
+
+A synthetic capture with chat, movement and SyncSettings datagrams is written to a
+temporary directory and decoded with 1, 2, 4, ... workers up to the CPU count.
+
+Usage::
+
+    python benchmarks/parse_capture.py --records 200000
+"""
+import argparse
+import os
+import struct
+import tempfile
+import time
+
+from amongus.analysis import parse_capture
+from amongus.capture import CaptureWriter, Direction
+from amongus.enums import GameDataTag, MatchMakingTag, PacketType, RPCTag
+from amongus.game import Game
+from amongus.helpers import createPacked, createVector2, writeString
+from amongus.testing.server import message, rpc
+
+GAME_ID = struct.pack("<I", 0x8C25BE3B)
+
+
+def game_data(data: bytes, reliable: bool) -> bytes:
+    payload = message(MatchMakingTag.GameData, GAME_ID + data)
+    if reliable:
+        return bytes([PacketType.Reliable]) + struct.pack(">h", 1) + payload
+    return bytes([PacketType.Unreliable]) + payload
+
+
+def datagrams() -> list:
+    settings = Game.with_default_settings().serialize()
+    return [
+        game_data(rpc(2, RPCTag.SendChat, writeString("benchmark message")), True),
+        game_data(
+            message(
+                GameDataTag.DataFlag,
+                createPacked(4) + struct.pack("<h", 1) + createVector2(1, 2) * 2,
+            ),
+            False,
+        ),
+        game_data(
+            rpc(1, RPCTag.SyncSettings, createPacked(len(settings)) + settings), True
+        ),
+    ]
+
+
+def write_capture(path: str, records: int) -> None:
+    samples = datagrams()
+    with CaptureWriter(path) as writer:
+        for i in range(records):
+            writer.write(Direction.Inbound, samples[i % len(samples)], i * 1000)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark.aucp")
+        write_capture(path, args.records)
+        workers, baseline = 1, None
+        while workers <= (os.cpu_count() or 1):
+            start = time.perf_counter()
+            events = sum(1 for _ in parse_capture(path, workers=workers))
+            took = time.perf_counter() - start
+            baseline = baseline or took
+            print(  # noqa: T001
+                f"{workers:>3} workers: {args.records / took:>10.0f} datagrams/s, "
+                f"{events / took:>10.0f} packets/s, speedup {baseline / took:.2f}x"
+            )
+            workers *= 2
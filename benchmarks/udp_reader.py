@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Compares the datagrams per second of the :class:`Connection` receive path with the
+previous reader, which awaited ``recv()`` wrapped in :func:`asyncio.wait_for` for
+every single datagram.
+
+A local UDP echo server stands in for the Among Us server. The client keeps a
+window of datagrams in flight, parses every echo like a real connection would and
+sends a new datagram for each one it receives.
+
+Usage::
+
+    python benchmarks/udp_reader.py --seconds 5 --window 64
+"""
+import argparse
+import asyncio
+import contextlib
+import time
+
+from amongus.connection import Connection
+from amongus.eventbus import EventBus
+from amongus.helpers import pack
+from amongus.packets import Packet
+from amongus.protocol import ConnectionProtocol
+
+# an unreliable GameData message containing a movement DataFlag
+PAYLOAD = bytes([0x00]) + pack({18: "h"}) + bytes.fromhex(
+    "0578563412" "0b00" "01" "04" "0100" "ff7fff7f" "ff7fff7f"
+)
+
+
+class EchoProtocol(asyncio.DatagramProtocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.transport.sendto(data, addr)
+
+
+class LegacyStream(asyncio.DatagramProtocol):
+    """Queue based stream, like the asyncio_dgram stream the old reader used."""
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.queue.put_nowait((data, addr))
+
+    async def recv(self):
+        return await self.queue.get()
+
+    async def send(self, data: bytes) -> None:
+        self.transport.sendto(data)
+
+
+class Counter:
+    def __init__(self):
+        self.received = 0
+        self.stopped = False
+
+    def on_datagram(self, data: bytes, send) -> None:
+        if self.stopped:
+            return
+        Packet.parse(data, first_call=True)
+        self.received += 1
+        send(PAYLOAD)
+
+
+async def run_legacy(port: int, seconds: float, window: int) -> float:
+    loop = asyncio.get_running_loop()
+    transport, stream = await loop.create_datagram_endpoint(
+        LegacyStream, remote_addr=("127.0.0.1", port)
+    )
+    counter = Counter()
+
+    async def on_data(data: bytes) -> None:
+        counter.on_datagram(data, transport.sendto)
+
+    async def reader():
+        while True:
+            try:
+                data, _ = await asyncio.wait_for(stream.recv(), timeout=5)
+                asyncio.ensure_future(on_data(data))
+            except asyncio.TimeoutError:
+                return
+
+    task = asyncio.ensure_future(reader())
+    for _ in range(window):
+        await stream.send(PAYLOAD)
+    start = time.perf_counter()
+    await asyncio.sleep(seconds)
+    result = counter.received / (time.perf_counter() - start)
+    counter.stopped = True
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+    transport.close()
+    # let the pending handlers finish
+    await asyncio.sleep(0.1)
+    return result
+
+
+async def run_protocol(port: int, seconds: float, window: int) -> float:
+    connection = Connection(EventBus())
+    counter = Counter()
+
+    async def on_data(data: bytes) -> None:
+        counter.on_datagram(data, connection._send)
+
+    # skip the handshake, only the receive path is measured
+    connection._on_data = on_data
+    connection._bind_loop()
+    connection._ready.set()
+    loop = asyncio.get_running_loop()
+    connection.transport, _ = await loop.create_datagram_endpoint(
+        lambda: ConnectionProtocol(connection), remote_addr=("127.0.0.1", port)
+    )
+    for _ in range(window):
+        connection._send(PAYLOAD)
+    start = time.perf_counter()
+    await asyncio.sleep(seconds)
+    result = counter.received / (time.perf_counter() - start)
+    counter.stopped = True
+    connection.transport.close()
+    await asyncio.sleep(0.1)
+    return result
+
+
+async def main(seconds: float, window: int) -> dict:
+    loop = asyncio.get_running_loop()
+    server, _ = await loop.create_datagram_endpoint(
+        EchoProtocol, local_addr=("127.0.0.1", 0)
+    )
+    port = server.get_extra_info("sockname")[1]
+    results = {
+        "legacy_reader": await run_legacy(port, seconds, window),
+        "datagram_protocol": await run_protocol(port, seconds, window),
+    }
+    server.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--window", type=int, default=64)
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args.seconds, args.window))
+    for name, rate in results.items():
+        print(f"{name:>20}: {rate:>10.0f} datagrams/s")  # noqa: T001
+    speedup = results["datagram_protocol"] / max(results["legacy_reader"], 1)
+    print(f"{'speedup':>20}: {speedup:>10.2f}x")  # noqa: T001
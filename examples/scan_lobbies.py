@@ -0,0 +1,30 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+import asyncio
+
+import amongus
+from amongus.enums import GameSettings
+
+
+async def main():
+    async with amongus.LobbyScanner(ttl=10) as scanner:
+        # every map with 1-3 impostors, in all regions at once
+        queries = amongus.LobbyScanner.combinations(
+            maps=[
+                GameSettings.SearchMap.Skeld,
+                GameSettings.SearchMap.MiraHQ,
+                GameSettings.SearchMap.Polus,
+            ],
+            impostors=[1, 2, 3],
+        )
+        result = await scanner.scan(queries)
+        print(f"Found {len(result.games)} games.")
+        for game in result.games:
+            print(f"[{game.region}] {game.readable_code}: {game.playerCount} players")
+
+        # answered from the cache, no packets are sent
+        result = await scanner.find_games(GameSettings.SearchMap.Skeld, impostors=2)
+        print(f"{len(result.games)} Skeld games with 2 impostors.")
+
+
+asyncio.run(main())